@@ -0,0 +1,117 @@
+# Pages/sec of the Celery scrape task body with SCRAPE_FETCH_MODE=sync (one
+# blocking requests.get after another, the old prefork behaviour) and
+# SCRAPE_FETCH_MODE=async (a chunk's pages fetched concurrently over aiohttp).
+# Each mode runs `--processes` forked workers, as a prefork worker with that
+# concurrency would, against a local stub server with `--latency` per page.
+# The Postgres upsert and the redis rate limiter are left out so only the
+# fetch/parse path is compared; the response cache and the metric samples
+# go to a temporary directory.
+#
+# Run from the repository root:
+#   python -m benchmarks.celery_fetch_modes --urls 400 --latency 0.1
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from benchmarks.detail_extraction import build_detail_html
+from benchmarks.stub_server import stub_server
+from src.utilities.rate_limiter import RequestSlot
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "src", "harvestor_exp", "celery"))
+_scratch = tempfile.mkdtemp()
+os.environ["RESPONSE_CACHE_PATH"] = os.path.join(_scratch, "responses.sqlite3")
+os.environ["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(_scratch, "metrics")
+
+import tasks  # noqa: E402
+from sites import SITE_CONFIGS  # noqa: E402
+
+
+class Unpaced:
+    """Stands in for the redis rate limiter: no pacing, no redis."""
+
+    @contextmanager
+    def request(self, url):
+        yield RequestSlot()
+
+    @asynccontextmanager
+    async def request_async(self, url):
+        yield RequestSlot()
+
+
+class CountingDatabase:
+    """Stands in for Postgres: counts the rows that reach the upsert."""
+
+    def __init__(self):
+        self.rows = 0
+
+    def upsert_job_details(self, rows: list, rejected=None, replaced=None) -> int:
+        self.rows += sum(1 for row in rows if row[0])
+        return len(rows)
+
+
+def run_worker(args):
+    """One worker process: scrape its urls chunk by chunk, return (rows, cpu seconds)."""
+    urls, chunk, mode = args
+    db = CountingDatabase()
+    tasks._rate_limiter = Unpaced()
+    tasks._job_writer = tasks.JobDetailsWriter(db)
+    config = SITE_CONFIGS["apple"]
+    cpu = time.process_time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(0, len(urls), chunk):
+            payloads = [tasks.ScraperPayload(url=url, **config) for url in urls[i:i + chunk]]
+            tasks.scrape_urls(payloads, "apple", mode)
+            tasks.get_job_writer().flush()
+    return db.rows, time.process_time() - cpu
+
+
+def run_mode(base_url: str, mode: str, urls: int, processes: int, chunk: int, round_: int):
+    # fresh urls per run, so the response cache never short-cuts a page
+    all_urls = [f"{base_url}/{mode}/{round_}/jobs/{i}" for i in range(urls)]
+    shares = [(all_urls[i::processes], chunk, mode) for i in range(processes)]
+    start = time.perf_counter()
+    with multiprocessing.get_context("fork").Pool(processes) as pool:
+        results = pool.map(run_worker, shares)
+    wall = time.perf_counter() - start
+    rows = sum(r for r, _ in results)
+    cpu = sum(c for _, c in results)
+    assert rows == urls, f"{mode}: {rows} of {urls} pages extracted"
+    return wall, cpu
+
+
+def main(urls: int, processes: int, chunk: int, latency: float, concurrency: int, filler: int):
+    tasks.FETCH_CONCURRENCY = concurrency
+    cores = os.cpu_count() or 1
+    page = build_detail_html(filler)
+    print(f"{urls} pages of {len(page)} chars, {latency * 1000:.0f} ms latency, {processes} worker processes, "
+          f"chunks of {chunk}, async concurrency {concurrency}, {cores} cores")
+    with stub_server(default=page, latency=latency) as base_url:
+        print(f"{'mode':<8} {'wall s':>8} {'cpu s':>8} {'pages/sec':>10} {'/core':>8} {'pages/cpu s':>12} {'speedup':>8}")
+        baseline = None
+        for round_, mode in enumerate(("sync", "async")):
+            wall, cpu = run_mode(base_url, mode, urls, processes, chunk, round_)
+            rate = urls / wall
+            baseline = baseline or rate
+            print(f"{mode:<8} {wall:>8.2f} {cpu:>8.2f} {rate:>10.1f} {rate / cores:>8.1f} {urls / cpu:>12.1f} "
+                  f"{rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--urls", type=int, default=400)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="prefork worker concurrency")
+    parser.add_argument("--chunk", type=int, default=100, help="urls per task (TASK_CHUNK_SIZE)")
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds the stub server takes per page")
+    parser.add_argument("--concurrency", type=int, default=tasks.FETCH_CONCURRENCY,
+                        help="SCRAPE_FETCH_CONCURRENCY of the async mode")
+    parser.add_argument("--filler", type=int, default=300, help="unrelated blocks in the detail page")
+    args = parser.parse_args()
+    main(args.urls, args.processes, args.chunk, args.latency, args.concurrency, args.filler)
@@ -0,0 +1,109 @@
+# Fields/sec of the job detail extraction: one soup.select_one per field
+# selector (as the detail scrapers did) against a compiled ExtractionPlan
+# that finds every field in one tree walk. Parsing is done once up front so
+# only extraction is timed. A second table times parse + extract for every
+# parser backend.
+#
+# Run from the repository root:
+#   python -m benchmarks.detail_extraction --repeat 200
+#   python -m benchmarks.detail_extraction --html saved_detail_page.html
+
+import argparse
+import time
+
+from bs4 import BeautifulSoup
+
+from src.utilities.extraction_plan import PARSERS, get_plan
+
+# Apple job detail selectors, as used by the detail scrapers
+CONFIG = {
+    "job_id": "#jobNumber",
+    "title": ".jd__header--title",
+    "location": [".addressCountry", "#job-location-name"],
+    "department": "#job-team-name",
+    "summary": "#jd-job-summary",
+    "long_description": "#jd-description",
+    "date": "#jobPostDate",
+}
+
+
+def build_detail_html(filler: int) -> str:
+    """A detail page with `filler` unrelated blocks around the job fields, location only in the fallback."""
+    noise = "".join(
+        f'<div class="card card-{i}"><a href="/x/{i}">Link {i}</a><p>Paragraph {i} <span>text</span></p></div>'
+        for i in range(filler)
+    )
+    return (
+        f"<html><body><header>{noise}</header><main>"
+        f'<h1 class="jd__header--title">Software Engineer</h1>'
+        f'<strong id="jobNumber">200571234</strong>'
+        f'<span class="addressCountry"></span><span id="job-location-name">Cupertino, California</span>'
+        f'<span id="job-team-name">Software and Services</span>'
+        f'<time id="jobPostDate">Jan 15, 2025</time>'
+        f'<div id="jd-job-summary"><p>Build things.</p></div>'
+        f'<div id="jd-description"><p>Lots of detail.</p></div>'
+        f"</main><footer>{noise}</footer></body></html>"
+    )
+
+
+def select_one_per_field(soup: BeautifulSoup, config: dict) -> dict:
+    """ The previous extraction: a select_one (full tree match) per selector """
+    result = {}
+    for name, selectors in config.items():
+        result[name] = ""
+        for selector in [selectors] if isinstance(selectors, str) else selectors:
+            element = soup.select_one(selector)
+            text = element.get_text(strip=True) if element else ""
+            if text:
+                result[name] = text
+                break
+    return result
+
+
+def timed(fn, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main(html: str, repeat: int):
+    soup = BeautifulSoup(html, "html.parser")
+    tags = len(soup.find_all(True))
+    print(f"input: {len(html)} chars, {tags} tags, {len(CONFIG)} fields, {repeat} runs each")
+
+    strategies = (
+        ("select_one per field", lambda: select_one_per_field(soup, CONFIG)),
+        ("extraction plan", lambda: get_plan(CONFIG).extract(soup)),
+    )
+    baseline, expected = None, None
+    print(f"{'strategy':<22} {'avg ms':>10} {'fields/sec':>12} {'speedup':>8}")
+    for name, fn in strategies:
+        avg, result = timed(fn, repeat)
+        expected = expected or result
+        assert result == expected, f"{name} disagrees: {result}"
+        baseline = baseline or avg
+        print(f"{name:<22} {avg * 1000:>10.3f} {len(CONFIG) / avg:>12.0f} {baseline / avg:>7.2f}x")
+
+    plan = get_plan(CONFIG)
+    baseline = None
+    print(f"\n{'parse + extract':<22} {'avg ms':>10} {'pages/sec':>12} {'speedup':>8}")
+    for parser in PARSERS:
+        avg, result = timed(lambda: plan.extract_html(html, parser), repeat)
+        assert result == expected, f"{parser} disagrees: {result}"
+        baseline = baseline or avg
+        print(f"{parser:<22} {avg * 1000:>10.3f} {1 / avg:>12.1f} {baseline / avg:>7.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--html", help="saved detail page to use instead of the synthetic one")
+    parser.add_argument("--filler", type=int, default=300, help="unrelated blocks in the synthetic page")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    if args.html:
+        with open(args.html, encoding="utf-8") as f:
+            page = f.read()
+    else:
+        page = build_detail_html(args.filler)
+    main(page, args.repeat)
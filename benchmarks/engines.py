@@ -0,0 +1,378 @@
+# Offline benchmark of the detail scraper engines:
+#
+#   pyppeteer-per-job   src/harvestor_job_detail.py (a browser launched per job)
+#   pyppeteer-shared    src/harvestor_exp/harvestor_detailv2.py (BrowserPool)
+#   playwright          src/harvestor_exp/harvestor_detail_with_playwrite.py
+#   aiohttp             src/harvestor_exp/harvestor_detail_without_browserv1.py
+#   celery-prefork      celery/tasks.py, sync requests, one process per slot
+#
+# Recorded pages (the Apple careers page in temo.py plus any saved *.html
+# in --pages) are served by a local stub server with --latency/--jitter;
+# pages without job fields get the synthetic detail block appended so every
+# engine has something to extract. Each engine runs at each --concurrency
+# level in a fresh forked process (module level semaphores and singletons
+# start clean), with the rate limiter unpaced and the DB writes discarded.
+#
+# Reported per run: pages/sec, per page latency p50/p95/p99, CPU seconds
+# (the run's process and everything it spawned: browsers, parse pools),
+# peak RSS of that process tree (needs psutil) and the engine's own phase
+# timings. Results are written as JSON; --baseline compares throughput
+# and the browsers' median navigation time with an earlier results file.
+# --wait networkidle makes the browser engines wait for the network to go
+# quiet on every page instead of for their fields (NAVIGATION_WAIT).
+#
+# Run from the repository root:
+#   python -m benchmarks.engines --engines aiohttp celery-prefork --concurrency 1 5 20
+#   python -m benchmarks.engines --pages saved_pages/ --latency 0.2 --jitter 0.1 --baseline old.json
+#   python -m benchmarks.engines --engines playwright --wait networkidle --output idle.json
+
+import argparse
+import ast
+import asyncio
+import contextlib
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from benchmarks.detail_extraction import build_detail_html
+from benchmarks.stub_server import stub_server
+from src.utilities.timing import PhaseTimer, percentile
+
+try:
+    import psutil
+except ImportError:  # peak RSS is not reported without psutil
+    psutil = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENGINES = ("pyppeteer-per-job", "pyppeteer-shared", "playwright", "aiohttp", "celery-prefork")
+
+# selectors of the browser scrapers (one selector per field) ...
+BROWSER_CONFIG = {
+    "job_id": "#jobNumber",
+    "title": ".jd__header--title",
+    "location": "#job-location-name",
+    "department": "#job-team-name",
+    "summary": "#jd-job-summary",
+    "long_description": "#jd-description",
+    "date": "#jobPostDate",
+}
+# ... and of the HTML parsing ones (fallback lists, parser backend)
+PARSER_CONFIG = {**BROWSER_CONFIG, "location": [".addressCountry", "#job-location-name"], "parser": "selectolax"}
+
+
+def recorded_pages(pages_dir: Optional[str]) -> Dict[str, str]:
+    """temo.py's page and the *.html files of `pages_dir`, each with job fields to extract."""
+    pages = {}
+    with open(os.path.join(ROOT, "temo.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "html_code" for t in node.targets):
+            pages["temo.py"] = node.value.value
+    for path in sorted(glob.glob(os.path.join(pages_dir, "*.html"))) if pages_dir else []:
+        with open(path, encoding="utf-8") as f:
+            pages[os.path.basename(path)] = f.read()
+
+    job_block = build_detail_html(0).split("<main>")[1].split("</main>")[0]
+    for name, html in pages.items():
+        if 'id="jobNumber"' not in html:
+            at = html.rfind("</body>")
+            pages[name] = html[:at] + job_block + html[at:] if at >= 0 else html + job_block
+    return pages
+
+
+class CountingWriter:
+    """Stands in for JobDetailsWriter: counts the rows that found a job id."""
+
+    def __init__(self, *args):
+        self.rows = 0
+
+    def add(self, job_id, *args, **kwargs):
+        self.rows += bool(job_id)
+
+    def flush(self):
+        return 0
+
+
+def unpace():
+    """Replace the process's rate limiter with one that never waits."""
+    from src.utilities import rate_limiter
+    rate_limiter._limiter = rate_limiter.AdaptiveRateLimiter(
+        rate_limiter.AIMDPolicy(initial_rate=1e9, max_rate=1e9, burst=10 ** 9))
+
+
+async def run_pages(payloads, handle, workers: int, page_timer: PhaseTimer):
+    from src.utilities.work_queue import run_work_queue
+
+    async def timed(payload):
+        with page_timer.span("page"):
+            await handle(payload)
+
+    await run_work_queue(payloads, timed, workers=workers)
+
+
+async def pyppeteer_per_job(urls, concurrency, writer, page_timer):
+    import src.harvestor_job_detail as engine
+    engine.timer = PhaseTimer("pyppeteer-per-job")
+    payloads = [engine.ScraperPayload(url, **BROWSER_CONFIG) for url in urls]
+    await run_pages(payloads, lambda payload: engine.scrape_job_details(payload, writer), concurrency, page_timer)
+    return engine.timer
+
+
+async def pyppeteer_shared(urls, concurrency, writer, page_timer):
+    from src.harvestor_exp import harvestor_detailv2 as engine
+    from src.utilities.browser_pool import BrowserPool
+    engine.timer = PhaseTimer("pyppeteer-shared")
+    payloads = [engine.ScraperPayload(url=url, **BROWSER_CONFIG) for url in urls]
+    async with BrowserPool(size=1, pages_per_browser=concurrency, timer=engine.timer) as pool:
+        await run_pages(payloads, lambda payload: engine.process_job_detail(payload, pool, writer),
+                        concurrency, page_timer)
+    return engine.timer
+
+
+async def playwright(urls, concurrency, writer, page_timer):
+    from playwright.async_api import async_playwright
+    from src.harvestor_exp import harvestor_detail_with_playwrite as engine
+    from src.utilities.browser_pool import LAUNCH_ARGS
+    engine.timer = PhaseTimer("playwright")
+    payloads = [engine.ScraperPayload(url=url, **BROWSER_CONFIG) for url in urls]
+    async with async_playwright() as p:
+        with engine.timer.span("launch"):
+            browser = await p.chromium.launch(headless=True, args=LAUNCH_ARGS)
+        await run_pages(payloads, lambda payload: engine.process_job_detail(payload, browser, writer),
+                        concurrency, page_timer)
+        await browser.close()
+    return engine.timer
+
+
+async def aiohttp_engine(urls, concurrency, writer, page_timer):
+    from concurrent.futures import ProcessPoolExecutor
+    from src.harvestor_exp import harvestor_detail_without_browserv1 as engine
+    from src.utilities.http_client import close_session, get_session
+    engine.timer = PhaseTimer("aiohttp")
+    engine.SEM = asyncio.Semaphore(concurrency)
+    payloads = [engine.ScraperPayload(url=url, **PARSER_CONFIG) for url in urls]
+    session = get_session()
+    with ProcessPoolExecutor(max_workers=engine.PARSE_WORKERS) as parse_pool:
+        try:
+            await run_pages(payloads, lambda payload: engine.scrape_job_details(payload, session, writer, parse_pool),
+                            concurrency + engine.PARSE_WORKERS * 2, page_timer)
+        finally:
+            await close_session()
+    return engine.timer
+
+
+def _celery_worker(urls):
+    """One prefork worker process: the sync task body over its share of the urls."""
+    from benchmarks.celery_fetch_modes import CountingDatabase, Unpaced, tasks
+    from sites import SITE_CONFIGS
+    db = CountingDatabase()
+    tasks._rate_limiter = Unpaced()
+    tasks._job_writer = tasks.JobDetailsWriter(db)
+    page_seconds = []
+    for url in urls:
+        start = time.perf_counter()
+        tasks.scrape_urls([tasks.ScraperPayload(url=url, **SITE_CONFIGS["apple"])], "apple", "sync")
+        page_seconds.append(time.perf_counter() - start)
+    tasks.get_job_writer().flush()
+    return db.rows, page_seconds
+
+
+async def celery_prefork(urls, concurrency, writer, page_timer):
+    shares = [urls[i::concurrency] for i in range(concurrency)]
+    with multiprocessing.get_context("fork").Pool(concurrency) as pool:
+        results = await asyncio.get_running_loop().run_in_executor(None, pool.map, _celery_worker, shares)
+    for rows, page_seconds in results:
+        writer.rows += rows
+        for seconds in page_seconds:
+            page_timer.record("page", seconds)
+    return None
+
+
+RUNNERS = {
+    "pyppeteer-per-job": pyppeteer_per_job,
+    "pyppeteer-shared": pyppeteer_shared,
+    "playwright": playwright,
+    "aiohttp": aiohttp_engine,
+    "celery-prefork": celery_prefork,
+}
+
+
+def missing_browser(engine: str) -> Optional[str]:
+    """Why `engine` cannot run here, checked up front so pyppeteer does not try a download per page."""
+    if engine.startswith("pyppeteer"):
+        from pyppeteer.chromium_downloader import check_chromium
+        if not check_chromium():
+            return "Chromium is not installed (run pyppeteer-install)"
+    return None
+
+
+def cpu_seconds() -> float:
+    """CPU time of this process plus its reaped children (browsers, pools)."""
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def run_engine(engine: str, urls: List[str], concurrency: int, results):
+    """Body of the forked run: scrape every url and put the measurements on `results`."""
+    # the connector must not cap the concurrency level being measured
+    os.environ["HTTP_LIMIT_PER_HOST"] = str(max(concurrency, int(os.getenv("HTTP_LIMIT_PER_HOST", 10))))
+    writer, page_timer = CountingWriter(), PhaseTimer(engine)
+    try:
+        reason = missing_browser(engine)
+        if reason:
+            raise RuntimeError(reason)
+        unpace()
+        cpu, start = cpu_seconds(), time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            timer = asyncio.run(RUNNERS[engine](urls, concurrency, writer, page_timer))
+        wall = time.perf_counter() - start
+        cpu = cpu_seconds() - cpu
+    except Exception as e:
+        results.put({"error": f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"})
+        return
+    pages = page_timer.samples.get("page", [])
+    results.put({
+        "pages": len(urls),
+        "ok": writer.rows,
+        "wall_seconds": round(wall, 3),
+        "pages_per_sec": round(len(urls) / wall, 2),
+        "latency": {q: round(percentile(pages, n), 4) for q, n in (("p50", 50), ("p95", 95), ("p99", 99))},
+        "cpu_seconds": round(cpu, 3),
+        "cpu_ms_per_page": round(cpu / len(urls) * 1000, 2),
+        "phases": timer.summary()["phases"] if timer else {},
+    })
+
+
+def tree_rss_mb(process) -> float:
+    rss = 0
+    for member in [process] + process.children(recursive=True):
+        try:
+            rss += member.memory_info().rss
+        except psutil.Error:
+            pass
+    return rss / (1024 * 1024)
+
+
+def measure(engine: str, urls: List[str], concurrency: int) -> dict:
+    """Run one engine at one concurrency level in a forked process, sampling its memory."""
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    child = context.Process(target=run_engine, args=(engine, urls, concurrency, results))
+    child.start()
+    peak = [0.0]
+
+    def sample():
+        process = psutil.Process(child.pid)
+        while child.is_alive():
+            with contextlib.suppress(psutil.Error):
+                peak[0] = max(peak[0], tree_rss_mb(process))
+            time.sleep(0.05)
+
+    sampler = threading.Thread(target=sample, daemon=True) if psutil else None
+    if sampler:
+        sampler.start()
+    result = results.get()
+    child.join()
+    if sampler:
+        sampler.join()
+    result["peak_rss_mb"] = round(peak[0], 1) if psutil else None
+    return {"engine": engine, "concurrency": concurrency, **result}
+
+
+def compare(results: List[dict], baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = {(r["engine"], r["concurrency"]): r for r in json.load(f)["results"]}
+    print(f"\nagainst {baseline_path}:")
+    for result in results:
+        before = baseline.get((result["engine"], result["concurrency"]))
+        if before and "error" not in before and "error" not in result:
+            change = result["pages_per_sec"] / before["pages_per_sec"] - 1
+            flag = "  <-- slower" if change < -0.1 else ""
+            navigation = ""
+            if "navigate" in result["phases"] and "navigate" in before["phases"]:
+                navigation = (f"   navigate p50 {before['phases']['navigate']['p50']:.3f}s -> "
+                              f"{result['phases']['navigate']['p50']:.3f}s")
+            print(f"{result['engine']:<18} {result['concurrency']:>4} "
+                  f"{before['pages_per_sec']:>10.1f} -> {result['pages_per_sec']:<10.1f} {change:+.0%}{flag}{navigation}")
+
+
+def main(engines: List[str], levels: List[int], urls_per_run: int, latency: float, jitter: float,
+         pages_dir: Optional[str], asset_bytes: int, output: Optional[str], baseline: Optional[str],
+         wait: str = "ready"):
+    pages = recorded_pages(pages_dir)
+    print(f"{len(pages)} recorded pages ({', '.join(pages)}), {urls_per_run} pages per run, "
+          f"{latency * 1000:.0f}±{jitter * 1000:.0f} ms latency, browsers wait for {wait}, {os.cpu_count()} cores")
+    # read by src.utilities.page_ready when the forked runs import the scrapers
+    os.environ["NAVIGATION_WAIT"] = wait
+    os.environ["RESPONSE_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "responses.sqlite3")
+    os.environ.setdefault("TIMING_DIR", tempfile.mkdtemp())
+
+    results = []
+    header = f"{'engine':<18} {'conc':>4} {'pages/s':>8} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} " \
+             f"{'cpu s':>7} {'ms/page':>8} {'rss MB':>7} {'ok':>5}"
+    with stub_server(default=list(pages.values()), latency=latency, jitter=jitter, asset_bytes=asset_bytes) as base:
+        print(header)
+        for engine in engines:
+            for concurrency in levels:
+                # fresh urls per run, so no response cache entry short-cuts a page
+                urls = [f"{base}/{engine}/{concurrency}/jobs/{i}" for i in range(urls_per_run)]
+                result = measure(engine, urls, concurrency)
+                results.append(result)
+                if "error" in result:
+                    print(f"{engine:<18} {concurrency:>4} failed: {result['error']}")
+                    continue
+                lat = result["latency"]
+                rss = f"{result['peak_rss_mb']:>7.0f}" if result["peak_rss_mb"] is not None else f"{'-':>7}"
+                print(f"{engine:<18} {concurrency:>4} {result['pages_per_sec']:>8.1f} {lat['p50']:>7.3f} "
+                      f"{lat['p95']:>7.3f} {lat['p99']:>7.3f} {result['cpu_seconds']:>7.2f} "
+                      f"{result['cpu_ms_per_page']:>8.1f} {rss} {result['ok']:>5}")
+
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "latency": latency,
+        "jitter": jitter,
+        "asset_bytes": asset_bytes,
+        "wait": wait,
+        "pages": {name: len(html) for name, html in pages.items()},
+        "results": results,
+    }
+    if output is None:
+        output = os.path.join(".cache", "benchmarks", f"engines-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 5, 20])
+    parser.add_argument("--urls", type=int, default=50, help="pages scraped per engine and concurrency level")
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds the stub server takes per response")
+    parser.add_argument("--jitter", type=float, default=0.05, help="uniform +/- seconds added to the latency")
+    parser.add_argument("--pages", help="directory of saved detail pages (*.html) to serve besides temo.py")
+    parser.add_argument("--asset-bytes", type=int, default=20000, help="size of every script/style/image served")
+    parser.add_argument("--output", help="results file (default .cache/benchmarks/engines-<time>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare throughput with")
+    parser.add_argument("--wait", choices=("ready", "networkidle"), default="ready",
+                        help="what the browser engines wait for after navigating")
+    args = parser.parse_args()
+    sys.exit(main(args.engines, args.concurrency, args.urls, args.latency, args.jitter, args.pages,
+                  args.asset_bytes, args.output, args.baseline, args.wait))
@@ -0,0 +1,68 @@
+# Times HTMLCleaner on the Apple careers page embedded in temo.py:
+# the previous parse-per-step pipeline, the single-parse clean() and the
+# lxml tree builder.
+#
+# Run from the repository root:
+#   python -m benchmarks.html_cleaner --repeat 20
+
+import argparse
+import ast
+import os
+import time
+
+from bs4 import BeautifulSoup
+
+from src.utilities.html_cleaner import HTMLCleaner
+
+TEMO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "temo.py")
+
+
+def load_apple_page() -> str:
+    """Return the `html_code` string literal from temo.py without running it."""
+    with open(TEMO_PATH, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "html_code" for t in node.targets):
+            return node.value.value
+    raise ValueError("html_code not found in temo.py")
+
+
+def parse_per_step(html: str) -> str:
+    """The cleaning pipeline as it was: parse and serialize again for every step."""
+    cleaner = HTMLCleaner(html)
+    for step in (cleaner._strip_unwanted_tags, cleaner._remove_comments, cleaner._retain_allowed_attributes):
+        cleaner._soup = BeautifulSoup(cleaner.html_content, "html.parser")
+        step()
+        cleaner._serialize()
+    return cleaner.html_content
+
+
+def timed(fn, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main(repeat: int):
+    html = load_apple_page()
+    print(f"input: {len(html)} chars, {repeat} runs each")
+
+    strategies = (
+        ("parse per step", lambda: parse_per_step(html)),
+        ("single parse", lambda: HTMLCleaner(html).clean()),
+        ("single parse lxml", lambda: HTMLCleaner(html, parser="lxml").clean()),
+    )
+    baseline = None
+    print(f"{'strategy':<20} {'avg ms':>10} {'speedup':>8} {'out chars':>10}")
+    for name, fn in strategies:
+        avg, output = timed(fn, repeat)
+        baseline = baseline or avg
+        print(f"{name:<20} {avg * 1000:>10.1f} {baseline / avg:>7.2f}x {len(output):>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.repeat)
@@ -0,0 +1,99 @@
+# Compares CDP round-trips and wall time of the per-element listing helpers
+# (querySelector + evaluate for every field) against the batched
+# extract_listing_rows call, on a synthetic Apple-style listing page.
+#
+# Run from the repository root:
+#   python -m benchmarks.listing_extraction --rows 50 --repeat 5
+
+import argparse
+import asyncio
+import time
+
+from pyppeteer import launch
+
+from src.havestor import ScraperPayload, get_inner_text, get_link_href
+from src.utilities.browser_pool import LAUNCH_ARGS
+from src.utilities.listing_extractor import extract_listing_rows
+
+
+def build_listing_html(rows: int) -> str:
+    items = "".join(
+        f'<tbody><tr><td class="table-col-1">'
+        f'<a class="table--advanced-search__title" href="/en-us/details/{200000000 + i}/specialist">'
+        f'Specialist {i}</a>'
+        f'<span class="table--advanced-search__date">Jan {1 + i % 28}, 2025</span>'
+        f'</td></tr></tbody>'
+        for i in range(rows)
+    )
+    return f"<html><body><table>{items}</table></body></html>"
+
+
+class RoundTripCounter:
+    """Counts every CDP message the page session sends while installed."""
+
+    def __init__(self, page):
+        self.count = 0
+        self._client = page._client
+        self._send = self._client.send
+
+    def __enter__(self):
+        def counting_send(*args, **kwargs):
+            self.count += 1
+            return self._send(*args, **kwargs)
+
+        self._client.send = counting_send
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._client.send = self._send
+
+
+async def per_element(page, payload: ScraperPayload):
+    jobs = []
+    for job_el in await page.querySelectorAll(payload.job_list_selector):
+        title = await get_inner_text(job_el, payload.title_selector, page)
+        link = await get_link_href(job_el, payload.link_selector, page)
+        if title or link:
+            jobs.append({"title": title, "link": link})
+    return jobs
+
+
+async def measure(page, payload, strategy, repeat: int):
+    timings, round_trips, jobs = [], 0, []
+    for _ in range(repeat):
+        with RoundTripCounter(page) as counter:
+            start = time.perf_counter()
+            jobs = await strategy(page, payload)
+            timings.append(time.perf_counter() - start)
+        round_trips = counter.count
+    return len(jobs), round_trips, sum(timings) / len(timings)
+
+
+async def main(rows: int, repeat: int):
+    payload = ScraperPayload(
+        url="about:blank",
+        job_list_selector=".table-col-1",
+        title_selector=".table--advanced-search__title",
+        link_selector=".table--advanced-search__title",
+        date_selector=".table--advanced-search__date",
+    )
+
+    browser = await launch(headless=True, args=LAUNCH_ARGS)
+    try:
+        page = await browser.newPage()
+        await page.setContent(build_listing_html(rows))
+
+        print(f"{'strategy':<12} {'rows':>6} {'round-trips':>12} {'avg ms':>10}")
+        for name, strategy in (("per-element", per_element), ("batched", extract_listing_rows)):
+            count, round_trips, avg = await measure(page, payload, strategy, repeat)
+            print(f"{name:<12} {count:>6} {round_trips:>12} {avg * 1000:>10.1f}")
+    finally:
+        await browser.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
@@ -0,0 +1,118 @@
+# Page load time of the browser scrapers with and without the resource
+# policy (src/utilities/resource_policy.py). The recorded pages of
+# benchmarks/engines.py are served by the stub server with their absolute
+# asset urls made relative, so every script, stylesheet, font and image the
+# page references is answered locally after --latency, with --asset-bytes of
+# filler. Each engine loads the same pages once loading everything and once
+# under jobs.apple.com's policy, navigating the way the scrapers do
+# (networkidle0 / networkidle), and reports the navigation times, the
+# requests made and blocked, and how many pages still had their job fields.
+#
+# Run from the repository root (needs Chromium for pyppeteer / playwright):
+#   python -m benchmarks.resource_blocking --urls 20 --latency 0.1 --asset-bytes 50000
+
+import argparse
+import asyncio
+import re
+from collections import Counter
+
+from benchmarks.engines import BROWSER_CONFIG, missing_browser, recorded_pages
+from benchmarks.stub_server import stub_server
+from src.utilities.browser_pool import LAUNCH_ARGS
+from src.utilities.resource_policy import LOAD_EVERYTHING, SITE_RESOURCE_POLICIES, apply_resource_policy
+from src.utilities.timing import PhaseTimer
+
+POLICIES = {
+    "load everything": LOAD_EVERYTHING,
+    "jobs.apple.com": SITE_RESOURCE_POLICIES["jobs.apple.com"],
+}
+
+ABSOLUTE_ASSET = re.compile(r'''(<(?:script|link|img|source)\b[^>]*?\b(?:src|href)=["'])(?:https?:)?//[^/"']+''')
+
+
+def local_assets(html: str) -> str:
+    """Point the page's absolute asset urls at the server it is served from."""
+    return ABSOLUTE_ASSET.sub(r"\1", html)
+
+
+async def load_pyppeteer(urls, policy, timer: PhaseTimer, requests: Counter) -> int:
+    from pyppeteer import launch
+    found = 0
+    browser = await launch(headless=True, args=LAUNCH_ARGS)
+    try:
+        for url in urls:
+            page = await browser.newPage()
+            try:
+                counts = await apply_resource_policy(page, policy)
+                with timer.navigation(page):
+                    await page.goto(url, {'waitUntil': 'networkidle0', 'timeout': 90000})
+                found += bool(await page.querySelector(BROWSER_CONFIG["job_id"]))
+                requests.update(counts)
+            finally:
+                await page.close()
+    finally:
+        await browser.close()
+    return found
+
+
+async def load_playwright(urls, policy, timer: PhaseTimer, requests: Counter) -> int:
+    from playwright.async_api import async_playwright
+    found = 0
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True, args=LAUNCH_ARGS)
+        for url in urls:
+            page = await browser.new_page()
+            try:
+                counts = await apply_resource_policy(page, policy)
+                with timer.navigation(page):
+                    await page.goto(url, wait_until="networkidle", timeout=90000)
+                found += bool(await page.query_selector(BROWSER_CONFIG["job_id"]))
+                requests.update(counts)
+            finally:
+                await page.close()
+        await browser.close()
+    return found
+
+
+LOADERS = {"pyppeteer": load_pyppeteer, "playwright": load_playwright}
+
+
+def main(engines, urls_per_run: int, latency: float, asset_bytes: int, pages_dir):
+    pages = [local_assets(html) for html in recorded_pages(pages_dir).values()]
+    print(f"{len(pages)} recorded pages, {urls_per_run} loads per run, {latency * 1000:.0f} ms latency, "
+          f"{asset_bytes} byte assets")
+    with stub_server(default=pages, latency=latency, asset_bytes=asset_bytes) as base:
+        print(f"{'engine':<11} {'policy':<16} {'nav p50':>8} {'nav p95':>8} {'load p50':>9} "
+              f"{'requests':>9} {'blocked':>8} {'fields':>7} {'saved':>7}")
+        for engine in engines:
+            reason = missing_browser(engine)
+            baseline = None
+            for name, policy in POLICIES.items():
+                urls = [f"{base}/{engine}/{name.replace(' ', '-')}/jobs/{i}" for i in range(urls_per_run)]
+                timer, requests = PhaseTimer(engine), Counter()
+                try:
+                    if reason:
+                        raise RuntimeError(reason)
+                    found = asyncio.run(LOADERS[engine](urls, policy, timer, requests))
+                except Exception as e:
+                    print(f"{engine:<11} {name:<16} failed: {type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}")
+                    break
+                phases = timer.summary()["phases"]
+                navigate = phases["navigate"]["p50"]
+                baseline = baseline or navigate
+                load = phases.get("navigate.load", {}).get("p50", 0.0)
+                # without interception nothing is counted, every request is allowed
+                made = sum(requests.values()) or "-"
+                print(f"{engine:<11} {name:<16} {navigate:>8.3f} {phases['navigate']['p95']:>8.3f} {load:>9.3f} "
+                      f"{made:>9} {requests['blocked']:>8} {found:>7} {1 - navigate / baseline:>7.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engines", nargs="+", choices=list(LOADERS), default=list(LOADERS))
+    parser.add_argument("--urls", type=int, default=20, help="page loads per engine and policy")
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds the stub server takes per response")
+    parser.add_argument("--asset-bytes", type=int, default=50000, help="size of every script/style/image served")
+    parser.add_argument("--pages", help="directory of saved detail pages (*.html) to serve besides temo.py")
+    args = parser.parse_args()
+    main(args.engines, args.urls, args.latency, args.asset_bytes, args.pages)
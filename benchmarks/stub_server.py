@@ -0,0 +1,72 @@
+# Local HTTP server for the benchmarks. Runs in its own process and answers
+# every GET/HEAD after `latency` +/- `jitter` seconds, with the page recorded
+# for the path or the default page (404 when there is neither). A list of
+# default pages is spread over the paths, the same path always getting the
+# same page. Paths of static assets (scripts, styles, images, fonts) get
+# `asset_bytes` of filler with the matching content type instead, so a
+# browser loading a recorded page pays for its subresources too.
+#
+#   with stub_server({"/jobs/1": html}, default=html, latency=0.05) as base_url:
+#       ...
+
+import asyncio
+import mimetypes
+import multiprocessing
+import os
+import random
+import zlib
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Union
+
+from aiohttp import web
+
+ASSET_EXTENSIONS = {'.js', '.css', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.webp',
+                    '.woff', '.woff2', '.ttf', '.otf', '.mp4', '.webm'}
+
+
+def _serve(pages: Dict[str, str], default: Union[str, List[str], None], latency: float, jitter: float,
+           asset_bytes: int, ports):
+    def default_page(path: str) -> Optional[str]:
+        if isinstance(default, list):
+            return default[zlib.crc32(path.encode()) % len(default)] if default else None
+        return default
+
+    async def handle(request):
+        delay = latency + random.uniform(-jitter, jitter) if jitter else latency
+        if delay > 0:
+            await asyncio.sleep(delay)
+        extension = os.path.splitext(request.path)[1].lower()
+        if request.path not in pages and extension in ASSET_EXTENSIONS:
+            content_type = mimetypes.guess_type(request.path)[0] or "application/octet-stream"
+            return web.Response(body=b" " * asset_bytes, content_type=content_type)
+        body = pages.get(request.path) or default_page(request.path)
+        if body is None:
+            return web.Response(status=404)
+        return web.Response(text=body, content_type="text/html")
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/{path:.*}", handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        ports.put(runner.addresses[0][1])
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+@contextmanager
+def stub_server(pages: Optional[Dict[str, str]] = None, default: Union[str, List[str], None] = None,
+                latency: float = 0.05, jitter: float = 0.0, asset_bytes: int = 0):
+    """Start the server in a child process and yield its base url."""
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve,
+                                      args=(pages or {}, default, latency, jitter, asset_bytes, ports),
+                                      daemon=True)
+    process.start()
+    try:
+        yield f"http://127.0.0.1:{ports.get(timeout=30)}"
+    finally:
+        process.terminate()
+        process.join()
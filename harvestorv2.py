@@ -1,5 +1,4 @@
 import asyncio
-import aiohttp
 import logging
 import redis
 import json
@@ -9,10 +8,15 @@ from dataclasses import dataclass
 from urllib.parse import urljoin
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo.errors import DuplicateKeyError
-from pyppeteer import launch
 from fake_useragent import UserAgent
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+from src.utilities.browser_pool import BrowserPool
+from src.utilities.http_client import create_session
+from src.utilities.page_ready import goto_ready
+from src.utilities.rate_limiter import AdaptiveRateLimiter
+from src.utilities.resource_policy import ResourcePolicy, apply_resource_policy
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -30,6 +34,8 @@ class JobSite:
     js_required: bool = False
     wait_for_selector: Optional[str] = None
     headers: Optional[Dict[str, str]] = None
+    # subresources the browser skips; None means the policy of the site's host
+    resource_policy: Optional[ResourcePolicy] = None
 
 
 class JobHarvester:
@@ -45,27 +51,30 @@ class JobHarvester:
 
         # Session for making HTTP requests
         self.session = None
-        self.browser = None
+        # Chromium recycled every max_navigations pages instead of one
+        # browser living (and growing) for the whole crawl
+        self.browser_pool = None
 
         # User agent rotation
         self.ua = UserAgent()
 
+        # Per-host adaptive pacing shared by every crawl of this harvester
+        self.rate_limiter = AdaptiveRateLimiter()
+
     async def __aenter__(self):
         """Setup async resources."""
-        self.session = aiohttp.ClientSession()
+        self.session = create_session()
         if any(site.js_required for site in self.job_sites):
-            self.browser = await launch(
-                headless=True,
-                args=['--no-sandbox', '--disable-setuid-sandbox']
-            )
+            self.browser_pool = BrowserPool(size=1, pages_per_browser=5, max_navigations=100)
+            await self.browser_pool.start()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Cleanup async resources."""
         if self.session:
             await self.session.close()
-        if self.browser:
-            await self.browser.close()
+        if self.browser_pool:
+            await self.browser_pool.close()
 
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     async def fetch_page_content(self, url: str, site: JobSite) -> str:
@@ -81,21 +90,24 @@ class JobHarvester:
             'User-Agent': self.ua.random,
             **(site.headers or {})
         }
-        async with self.session.get(url, headers=headers) as response:
-            response.raise_for_status()
-            return await response.text()
+        async with self.rate_limiter.request(url) as slot:
+            async with self.session.get(url, headers=headers) as response:
+                slot.observe(response.status, response.headers)
+                response.raise_for_status()
+                return await response.text()
 
     async def _fetch_with_pyppeteer(self, url: str, site: JobSite) -> str:
         """Fetch page content using pyppeteer for JavaScript-heavy sites."""
-        page = await self.browser.newPage()
-        try:
+        async with self.browser_pool.page() as page:
             await page.setUserAgent(self.ua.random)
-            await page.goto(url, {'waitUntil': 'networkidle0'})
+            await apply_resource_policy(page, site.resource_policy, url=url)
+            async with self.rate_limiter.request(url) as slot:
+                response = await goto_ready(page, url, [site.wait_for_selector])
+                if response:
+                    slot.observe(response.status, response.headers)
             if site.wait_for_selector:
                 await page.waitForSelector(site.wait_for_selector)
             return await page.content()
-        finally:
-            await page.close()
 
     async def process_job_listing(self, job_data: Dict, site: JobSite):
         """Process and store individual job listing."""
@@ -132,8 +144,7 @@ class JobHarvester:
 
     async def extract_jobs(self, html: str, site: JobSite) -> List[Dict]:
         """Extract job listings from HTML content."""
-        page = await self.browser.newPage()
-        try:
+        async with self.browser_pool.page() as page:
             await page.setContent(html)
 
             jobs = await page.evaluate('''(selectors) => {
@@ -164,8 +175,6 @@ class JobHarvester:
             }''', site.selectors)
 
             return jobs
-        finally:
-            await page.close()
 
     async def crawl_site(self, site: JobSite):
         """Crawl a job site including pagination."""
@@ -180,16 +189,13 @@ class JobHarvester:
 
                 # Handle pagination
                 if site.pagination:
-                    page = await self.browser.newPage()
-                    try:
+                    async with self.browser_pool.page() as page:
                         await page.setContent(html)
                         next_url = await page.evaluate('''(selector) => {
                             const next = document.querySelector(selector);
                             return next ? next.href : null;
                         }''', site.pagination['next_button'])
                         current_url = urljoin(site.base_url, next_url) if next_url else None
-                    finally:
-                        await page.close()
                 else:
                     current_url = None
 
@@ -1,66 +1,348 @@
 # connect to postgresql database
 
-from psycopg2 import connect
-from psycopg2.extras import DictCursor
-from psycopg2.extensions import connection as pg_connection
+import csv
+import io
 import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterator, List, Optional
+
+from psycopg2 import DatabaseError, DataError, IntegrityError
+from psycopg2.extras import DictCursor, execute_values
+from psycopg2.extensions import connection as pg_connection
+from psycopg2.pool import ThreadedConnectionPool
+
+from src.utilities.timing import PhaseTimer
+
+# idle connections older than this (seconds) are pinged before being handed out
+HEALTH_CHECK_AFTER = 30
+
+JOB_DETAIL_COLUMNS = ('job_id', 'title', 'location', 'department', 'summary',
+                      'long_description', 'date', 'end_date', 'url')
+
+# batches at least this large are loaded with COPY instead of execute_values
+COPY_THRESHOLD = 1000
+
+# rows fetched per round trip when streaming from a server-side cursor
+STREAM_BATCH_SIZE = 1000
+
+UPSERT_JOB_DETAILS = """
+    INSERT INTO job_details ({columns}) {source}
+    ON CONFLICT (job_id) DO UPDATE SET {updates}
+""".format(
+    columns=', '.join(JOB_DETAIL_COLUMNS),
+    source='{source}',
+    updates=', '.join(f"{column} = EXCLUDED.{column}" for column in JOB_DETAIL_COLUMNS if column != 'job_id'),
+)
+
+# job_id is the conflict target; a url re-posted under a new job_id replaces
+# the old row (in the same transaction) instead of violating job_details_url_key.
+# The replaced rows are returned as (old job_id, new job_id, url) to be reported.
+DELETE_REPOSTED_URLS = """
+    DELETE FROM job_details AS job USING {source}
+    WHERE job.url = batch.url AND job.job_id <> batch.job_id
+    RETURNING job.job_id, batch.job_id, job.url
+"""
+
+# indexes built by migrate_job_details
+JOB_DETAILS_INDEXES = {
+    'job_details_url_key': "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS job_details_url_key ON job_details (url)",
+    'job_details_open_last_checked': """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS job_details_open_last_checked
+        ON job_details (last_checked NULLS FIRST) WHERE end_date IS NULL
+    """,
+}
+
+_pool = None
+_pool_pid = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+_last_used = {}
+
+
+class KeepAlivePool(ThreadedConnectionPool):
+    """
+    ThreadedConnectionPool closes every connection handed back above `minconn`;
+    this one keeps up to `maxconn` idle so bursts do not pay for reconnects.
+    """
+
+    def _putconn(self, conn, key=None, close=False):
+        minconn, self.minconn = self.minconn, self.maxconn
+        try:
+            super()._putconn(conn, key, close)
+        finally:
+            self.minconn = minconn
+
+
+def get_pool() -> ThreadedConnectionPool:
+    """
+    Process-wide connection pool, created on first use. A forked child (Celery
+    prefork worker) gets its own pool instead of sharing the parent's sockets.
+    Size is taken from DB_POOL_MIN / DB_POOL_MAX.
+    """
+    global _pool, _pool_pid, _pool_slots
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # host - localhost: 5432
+            # user - postgres
+            # database - Jobstats
+            # password - os.getenv('DB_PASSWORD')
+            maxconn = int(os.getenv('DB_POOL_MAX', 10))
+            _pool = KeepAlivePool(
+                int(os.getenv('DB_POOL_MIN', 1)),
+                maxconn,
+                host='localhost',
+                port=5432,
+                user='postgres',
+                password=os.getenv('DB_PASSWORD'),
+                database='postgres')
+            _pool_slots = threading.BoundedSemaphore(maxconn)
+            _pool_pid = os.getpid()
+            _last_used.clear()
+        return _pool
+
+
+def _is_healthy(connection: pg_connection) -> bool:
+    if connection.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(connection), 0) < HEALTH_CHECK_AFTER:
+        return True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        connection.rollback()
+        return True
+    except DatabaseError:
+        return False
+
+
+@contextmanager
+def pooled_connection():
+    """
+    Borrow a healthy connection from the pool, blocking while all of them are
+    in use. Uncommitted work is rolled back by the pool when it is returned.
+    """
+    pool = get_pool()
+    slots = _pool_slots
+    slots.acquire()
+    try:
+        connection = pool.getconn()
+        if not _is_healthy(connection):
+            pool.putconn(connection, close=True)
+            connection = pool.getconn()
+        try:
+            yield connection
+        finally:
+            _last_used[id(connection)] = time.monotonic()
+            pool.putconn(connection, close=bool(connection.closed))
+    finally:
+        slots.release()
 
 
 class Database:
 
     def __init__(self):
-        # host - localhost: 5432
-        # user - postgres
-        # database - Jobstats
-        # password - os.getenv('DB_PASSWORD')
-        self.connection = connect(
-            host='localhost',
-            port=5432,
-            user='postgres',
-            password=os.getenv('DB_PASSWORD'),
-            database='postgres')
-        self.cursor = self.connection.cursor(cursor_factory=DictCursor)
-
-    def test_connection(self):
-        self.cursor.execute("SELECT version();")
-        record = self.cursor.fetchone()
-        print("You are connected to - ", record, "\n")
+        # cheap: connections are borrowed from the process-wide pool per call
+        self.pool = get_pool()
+        self.connection = None
+        self._borrowed = None
 
     def __enter__(self) -> pg_connection:
+        self._borrowed = pooled_connection()
+        self.connection = self._borrowed.__enter__()
         return self.connection
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.connection.commit()
-        self.cursor.close()
-        self.connection.close()
+        if exc_type is None:
+            self.connection.commit()
+        borrowed, self._borrowed, self.connection = self._borrowed, None, None
+        return borrowed.__exit__(exc_type, exc_val, exc_tb)
+
+    def _execute(self, query: str, params=None, fetch=None):
+        with pooled_connection() as connection:
+            with connection.cursor(cursor_factory=DictCursor) as cursor:
+                cursor.execute(query, params)
+                result = fetch(cursor) if fetch else None
+            connection.commit()
+        return result
 
     def test_connection(self):
-        self.cursor.execute("SELECT version();")
-        record = self.cursor.fetchone()
+        record = self._execute("SELECT version();", fetch=lambda cursor: cursor.fetchone())
         print("You are connected to - ", record, "\n")
 
     def execute_query(self, query: str):
-        self.cursor.execute(query)
-        return self.cursor.fetchall()
+        return self._execute(query, fetch=lambda cursor: cursor.fetchall())
 
     def execute_query_with_params(self, query: str, params: tuple):
-        self.cursor.execute(query, params)
-        return self.cursor.fetchall()
+        return self._execute(query, params, fetch=lambda cursor: cursor.fetchall())
 
     def execute_query_with_params_and_fetch_one(self, query: str, params: tuple):
-        self.cursor.execute(query, params)
-        return self.cursor.fetchone()
+        return self._execute(query, params, fetch=lambda cursor: cursor.fetchone())
 
     def execute_query_with_params_and_fetch_all(self, query: str, params: tuple):
-        self.cursor.execute(query, params)
-        return self.cursor.fetchall()
+        return self._execute(query, params, fetch=lambda cursor: cursor.fetchall())
 
     def insert_query(self, query: str, params: tuple):
-        self.cursor.execute(query, params)
-        self.connection.commit()
+        self._execute(query, params)
         print("Data inserted successfully")
 
 
+    def upsert_job_details(self, rows: list, rejected: Optional[list] = None,
+                           replaced: Optional[list] = None) -> int:
+        """
+        Insert or update many job_details rows with one statement and one commit.
+        Rows are tuples in JOB_DETAIL_COLUMNS order; rows without a job_id are
+        skipped and a job_id or url seen twice keeps its last row. A url that
+        is stored under another job_id is moved to the new one, deleting the
+        old row; (old job_id, new job_id, url) of every such row is appended
+        to `replaced` once committed. If the batch is
+        rejected for its data it is retried row by row so one bad row does not
+        lose the rest; the rows that still fail (and the ones without a
+        job_id) are appended to `rejected`. Connection and other operational
+        errors are raised with nothing written.
+        """
+        unique = {}
+        for row in rows:
+            if row[0]:
+                unique[row[0]] = row
+            else:
+                print(f"[SKIP] No job_id for {row[-1]}")
+                if rejected is not None:
+                    rejected.append(row)
+        by_url = {}
+        for row in unique.values():
+            by_url[row[-1] if row[-1] is not None else id(row)] = row
+        rows = list(by_url.values())
+        if not rows:
+            return 0
+
+        try:
+            with pooled_connection() as connection:
+                with connection.cursor() as cursor:
+                    if len(rows) >= COPY_THRESHOLD:
+                        reposted = self._copy_job_details(cursor, rows)
+                    else:
+                        reposted = execute_values(
+                            cursor, DELETE_REPOSTED_URLS.format(source='(VALUES %s) AS batch (job_id, url)'),
+                            [(row[0], row[-1]) for row in rows], page_size=len(rows), fetch=True)
+                        execute_values(cursor, UPSERT_JOB_DETAILS.format(source='VALUES %s'), rows,
+                                       page_size=len(rows))
+                connection.commit()
+            print(f"Upserted {len(rows)} job details")
+            if reposted:
+                print(f"Replaced {len(reposted)} job details re-posted under a new job_id: "
+                      + ', '.join(f"{old} -> {new}" for old, new, _ in reposted))
+                if replaced is not None:
+                    replaced.extend(tuple(row) for row in reposted)
+            return len(rows)
+        except (DataError, IntegrityError) as e:
+            if len(rows) == 1:
+                print(f"Failed to upsert job {rows[0][0]}: {e}")
+                if rejected is not None:
+                    rejected.append(rows[0])
+                return 0
+            print(f"Batch upsert failed ({e}), retrying {len(rows)} rows one by one")
+            return sum(self.upsert_job_details([row], rejected, replaced) for row in rows)
+
+    def filter_unscraped_urls(self, urls: list) -> list:
+        """
+        Return the urls (stripped) that have no job_details row yet, checking the
+        whole batch with one indexed query instead of one SELECT per url.
+        """
+        urls = [url.strip() for url in urls]
+        if not urls:
+            return []
+        rows = self._execute("SELECT url FROM job_details WHERE url = ANY(%s)", (urls,),
+                             fetch=lambda cursor: cursor.fetchall())
+        scraped = {row[0] for row in rows}
+        return [url for url in urls if url not in scraped]
+
+    def is_url_scraped(self, url: str) -> bool:
+        row = self._execute("SELECT 1 FROM job_details WHERE url = %s LIMIT 1", (url.strip(),),
+                            fetch=lambda cursor: cursor.fetchone())
+        return row is not None
+
+    def iter_urls_to_check(self, stale_after: timedelta, batch_size: int = STREAM_BATCH_SIZE) -> Iterator[List[str]]:
+        """
+        Yield, in lists of `batch_size`, the urls of open jobs that were never
+        checked or last checked more than `stale_after` ago, least recently
+        checked first. Rows are streamed through a server-side cursor, so only
+        one batch is held in memory however many jobs are open.
+        """
+        return self._stream_urls(
+            'job_details_to_check',
+            """
+            SELECT url FROM job_details
+            WHERE end_date IS NULL AND url IS NOT NULL
+              AND (last_checked IS NULL OR last_checked < now() - %s)
+            ORDER BY last_checked NULLS FIRST
+            """,
+            (stale_after,), batch_size)
+
+    def iter_open_job_urls(self, batch_size: int = STREAM_BATCH_SIZE) -> Iterator[List[str]]:
+        """Yield the urls of every open job in lists of `batch_size`, e.g. to re-crawl them."""
+        return self._stream_urls(
+            'job_details_open', "SELECT url FROM job_details WHERE end_date IS NULL AND url IS NOT NULL",
+            None, batch_size)
+
+    def _stream_urls(self, cursor_name: str, query: str, params, batch_size: int) -> Iterator[List[str]]:
+        with pooled_connection() as connection:
+            with connection.cursor(name=cursor_name) as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield [row[0] for row in rows]
+
+    def update_job_status(self, rows: list) -> int:
+        """
+        Record liveness checks with one UPDATE and one commit. Rows are
+        (url, end_date, checked_at) tuples; an end_date of None leaves the
+        job open and only moves its last_checked.
+        """
+        if not rows:
+            return 0
+        with pooled_connection() as connection:
+            with connection.cursor() as cursor:
+                execute_values(
+                    cursor,
+                    """
+                    UPDATE job_details AS job
+                    SET end_date = COALESCE(checked.end_date, job.end_date),
+                        last_checked = checked.checked_at
+                    FROM (VALUES %s) AS checked (url, end_date, checked_at)
+                    WHERE job.url = checked.url
+                    """,
+                    rows,
+                    template='(%s, %s::date, %s::timestamp)',
+                    page_size=len(rows))
+            connection.commit()
+        print(f"Updated status of {len(rows)} jobs")
+        return len(rows)
+
+    def _copy_job_details(self, cursor, rows: list) -> list:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            # \N marks NULL in COPY's csv mode
+            writer.writerow(['\\N' if value is None else value for value in row])
+        buffer.seek(0)
+
+        cursor.execute("CREATE TEMP TABLE job_details_load (LIKE job_details) ON COMMIT DROP")
+        cursor.copy_expert(
+            f"COPY job_details_load ({', '.join(JOB_DETAIL_COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buffer)
+        cursor.execute(DELETE_REPOSTED_URLS.format(source='job_details_load AS batch'))
+        reposted = cursor.fetchall()
+        cursor.execute(UPSERT_JOB_DETAILS.format(
+            source=f"SELECT {', '.join(JOB_DETAIL_COLUMNS)} FROM job_details_load"))
+        return reposted
+
     def create_table_job_details(self):
         """
              config ={
@@ -85,15 +367,186 @@ class Database:
             url VARCHAR(255)
         );
         """
-        self.cursor.execute(query)
-        self.connection.commit()
+        self._execute(query)
         print("Table created successfully")
+        self.migrate_job_details()
+
+    def migrate_job_details(self):
+        """
+        Migration for an existing job_details table, run with
+        `python -m src.Database.database migrate`; safe to run more than once:
+        - adds job_details.last_checked, when the liveness checker last saw the posting
+        - deletes all but the last written row of every duplicated url
+        - builds the unique index on url ("already scraped" checks become index
+          lookups) and a partial index over the open jobs past the staleness
+          window, both CONCURRENTLY so the table stays live. An index left
+          INVALID by an earlier failed build is dropped and built again.
+        """
+        self._execute("ALTER TABLE job_details ADD COLUMN IF NOT EXISTS last_checked TIMESTAMP DEFAULT NULL")
+        duplicates = self._execute(
+            "DELETE FROM job_details AS job USING job_details AS newer "
+            "WHERE job.url = newer.url AND job.ctid < newer.ctid",
+            fetch=lambda cursor: cursor.rowcount)
+        if duplicates:
+            print(f"Deleted {duplicates} job_details rows with a duplicated url")
+
+        with pooled_connection() as connection:
+            connection.autocommit = True
+            try:
+                with connection.cursor() as cursor:
+                    for name, create in JOB_DETAILS_INDEXES.items():
+                        cursor.execute("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)",
+                                       (name,))
+                        invalid = cursor.fetchone()
+                        if invalid and invalid[0]:
+                            print(f"Index {name} is invalid (failed build), dropping it")
+                            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                        cursor.execute(create)
+                        print(f"Index {name} created successfully")
+            finally:
+                connection.autocommit = False
+
+
+class JobDetailsWriter:
+    """
+    Buffers job_details rows and writes them through `Database.upsert_job_details`
+    once `batch_size` rows are pending, and from a background thread once
+    rows have waited `flush_interval` seconds (without waiting for the next
+    `add`). Leave the `with` block (or call `close()`) when done.
+
+    After every commit `on_commit(stored, rejected)` is called with the rows
+    that are now in the DB and the ones the DB refused, e.g. to ack their
+    urls only once nothing can lose them any more. A flush that fails (DB
+    down) keeps its rows buffered for the next one. With a `timer`, every
+    flush is recorded as its `db_write` phase together with its row count.
+    `replaced` counts the stored rows deleted because their url was
+    re-posted under a new job_id.
+    """
+
+    def __init__(self, db: Database, batch_size=500, flush_interval=5.0,
+                 on_commit: Optional[Callable[[list, list], None]] = None, timer: Optional[PhaseTimer] = None):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_commit = on_commit
+        self.timer = timer
+        self.rows = []
+        self.replaced = 0
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self._closed = threading.Event()
+        self._flusher = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, job_id, title, location, department, summary, long_description, date,
+            end_date=None, url=None):
+        with self.lock:
+            self.rows.append((job_id, title, location, department, summary, long_description,
+                              date, end_date, url))
+            due = len(self.rows) >= self.batch_size
+            if self._flusher is None and self.flush_interval:
+                self._flusher = threading.Thread(target=self._flush_periodically, name='job-details-flush',
+                                                 daemon=True)
+                self._flusher.start()
+        if due:
+            self._try_flush()
+
+    def flush(self) -> int:
+        """Write the buffered rows now; on error they stay buffered and the error is raised."""
+        with self.flush_lock:
+            with self.lock:
+                rows, self.rows = self.rows, []
+                self.last_flush = time.monotonic()
+            if not rows:
+                return 0
+            rejected, replaced = [], []
+            try:
+                with self.timer.span('db_write', items=len(rows)) if self.timer else nullcontext():
+                    written = self.db.upsert_job_details(rows, rejected, replaced)
+            except Exception:
+                with self.lock:
+                    self.rows[:0] = rows
+                raise
+            self.replaced += len(replaced)
+            if self.on_commit:
+                refused = {id(row) for row in rejected}
+                self.on_commit([row for row in rows if id(row) not in refused], rejected)
+            return written
+
+    def close(self) -> int:
+        """Stop the background flushes and write what is left."""
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        written = self.flush()
+        if self.replaced:
+            print(f"{self.replaced} stored job details were replaced by a re-post under a new job_id")
+        return written
+
+    def _try_flush(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Flushing job details failed ({e}), {len(self.rows)} rows kept for the next try")
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval / 2):
+            if self.rows and time.monotonic() - self.last_flush >= self.flush_interval:
+                self._try_flush()
+
+
+class JobStatusWriter:
+    """
+    Buffers liveness check results and writes them through
+    `Database.update_job_status` once `batch_size` are pending or
+    `flush_interval` seconds have passed since the last flush. Leave the
+    `with` block (or call `flush()`) when done.
+    """
+
+    def __init__(self, db: Database, batch_size=1000, flush_interval=5.0):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows = []
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+    def add(self, url: str, end_date: Optional[date] = None, checked_at: Optional[datetime] = None):
+        with self.lock:
+            self.rows.append((url, end_date, checked_at or datetime.now()))
+            due = (len(self.rows) >= self.batch_size
+                   or time.monotonic() - self.last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self) -> int:
+        with self.lock:
+            rows, self.rows = self.rows, []
+            self.last_flush = time.monotonic()
+        return self.db.update_job_status(rows) if rows else 0
+
 
+if __name__ == "__main__":
+    # testing the connection
+    ob = Database()
+    ob.test_connection()
 
-# testing the connection
-ob = Database()
-ob.test_connection()
+    # python -m src.Database.database migrate
+    if sys.argv[1:] == ['migrate']:
+        ob.migrate_job_details()
 
-# # creating table
-# ob.create_table_job_details()
+    # # creating table
+    # ob.create_table_job_details()
 
@@ -1,6 +1,14 @@
 # connect to redis server
+import asyncio
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager, contextmanager
+
 import redis
 
+from src.utilities.rate_limiter import AIMDPolicy, RequestSlot, status_signal
+from src.utilities.work_queue import host_of
+
 r = redis.Redis(host='localhost', port=6379, db=0)
 
 
@@ -8,6 +16,8 @@ class Redis:
 
     def __init__(self):
         self.r = redis.Redis(host='localhost', port=6379, db=0)
+        # same server, replies decoded to str by the protocol parser
+        self.decoded = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
 
 
     def test_connection(self):
@@ -26,19 +36,385 @@ class Redis:
     def append_to_list(self, key, value):
         self.r.rpush(key, value)
 
+    def buffered_writer(self, batch_size=500, flush_interval=1.0):
+        return BufferedWriter(self.r, batch_size=batch_size, flush_interval=flush_interval)
+
+    def frontier(self, name, max_retries=3):
+        return Frontier(self.r, name, max_retries=max_retries)
+
+    def rate_limiter(self, prefix='ratelimit', policy=None):
+        return RateLimiter(self.r, prefix=prefix, policy=policy)
+
     def get_list(self, key):
-        res = self.r.lrange(key, 0, -1)
-        for i in range(len(res)):
-            res[i] = res[i].decode('utf-8')
-        return res
+        return self.decoded.lrange(key, 0, -1)
+
+
+def iter_list_chunks(client, key, chunk_size=1000):
+    """Walk a redis list in LRANGE windows of `chunk_size` items."""
+    start = 0
+    while True:
+        chunk = client.lrange(key, start, start + chunk_size - 1)
+        if not chunk:
+            return
+        yield chunk
+        start += len(chunk)
+
+
+# SADD every url into the seen-set and RPUSH only the ones that were new.
+FRONTIER_ADD_LUA = """
+local added = 0
+for i, url in ipairs(ARGV) do
+    if redis.call('SADD', KEYS[1], url) == 1 then
+        redis.call('RPUSH', KEYS[2], url)
+        added = added + 1
+    end
+end
+return added
+"""
+
+# Take claimed urls off the processing list and count the attempt: back to the
+# end of pending, or onto the dead list once they failed more than ARGV[1] times.
+FRONTIER_FAIL_LUA = """
+local requeued = 0
+for i = 2, #ARGV do
+    local url = ARGV[i]
+    if redis.call('LREM', KEYS[1], 1, url) == 1 then
+        if redis.call('HINCRBY', KEYS[3], url, 1) > tonumber(ARGV[1]) then
+            redis.call('HDEL', KEYS[3], url)
+            redis.call('RPUSH', KEYS[4], url)
+        else
+            redis.call('RPUSH', KEYS[2], url)
+            requeued = requeued + 1
+        end
+    end
+end
+return requeued
+"""
+
+
+class Frontier:
+    """
+    Deduplicating URL frontier stored under these redis keys:
+        <name>:seen        SET of every url ever added, checked at insert time
+        <name>:pending     LIST of urls waiting to be scraped
+        <name>:processing  LIST of urls claimed by a consumer and not acked yet
+        <name>:retries     HASH of failed attempts per url
+        <name>:dead        LIST of urls that failed more than `max_retries` times
+    Consumers `claim` a page of urls, scrape them and `ack` the ones whose rows
+    are stored or `fail` the rest, so memory and startup cost follow the
+    remaining work instead of the push history. A url is never added twice,
+    so a failure must go through `fail` to be tried again.
+    """
+
+    def __init__(self, client, name, max_retries=3):
+        self.r = client
+        self.max_retries = max_retries
+        self.seen_key = f"{name}:seen"
+        self.pending_key = f"{name}:pending"
+        self.processing_key = f"{name}:processing"
+        self.retries_key = f"{name}:retries"
+        self.dead_key = f"{name}:dead"
+        self._add_script = client.register_script(FRONTIER_ADD_LUA)
+        self._fail_script = client.register_script(FRONTIER_FAIL_LUA)
+
+    def add(self, *urls, client=None):
+        """
+        Add urls that were never seen before to the pending queue and return
+        how many were new. Pass a pipeline as `client` to defer the call.
+        """
+        if not urls:
+            return 0
+        return self._add_script(keys=[self.seen_key, self.pending_key], args=urls, client=client)
+
+    def requeue(self, *urls):
+        """
+        Put urls back on the pending queue even though they were seen before,
+        e.g. the stored jobs for a re-crawl. Not deduplicated against pending.
+        """
+        if not urls:
+            return 0
+        pipe = self.r.pipeline()
+        pipe.sadd(self.seen_key, *urls)
+        pipe.rpush(self.pending_key, *urls)
+        pipe.execute()
+        return len(urls)
+
+    def claim(self, count=100):
+        """Atomically move up to `count` urls from pending to processing in one round-trip."""
+        pipe = self.r.pipeline(transaction=True)
+        for _ in range(count):
+            pipe.lmove(self.pending_key, self.processing_key, 'LEFT', 'RIGHT')
+        return [url.decode('utf-8') for url in pipe.execute() if url is not None]
+
+    def ack(self, *urls):
+        """Drop finished urls from the processing list."""
+        if not urls:
+            return
+        pipe = self.r.pipeline(transaction=False)
+        for url in urls:
+            pipe.lrem(self.processing_key, 1, url)
+        pipe.hdel(self.retries_key, *urls)
+        pipe.execute()
+
+    def fail(self, *urls):
+        """
+        Hand claimed urls that could not be scraped back: to the end of the
+        pending queue, or to the dead list after `max_retries` failed retries.
+        Returns how many were requeued.
+        """
+        if not urls:
+            return 0
+        return self._fail_script(keys=[self.processing_key, self.pending_key, self.retries_key, self.dead_key],
+                                 args=[self.max_retries, *urls])
+
+    def dead(self):
+        """Urls given up on after `max_retries` failed retries."""
+        return [url.decode('utf-8') for url in self.r.lrange(self.dead_key, 0, -1)]
+
+    def iter_claims(self, page_size=100):
+        """Yield pages of claimed urls until the pending queue is empty."""
+        while True:
+            urls = self.claim(page_size)
+            if not urls:
+                return
+            yield urls
+
+    def requeue_unacked(self):
+        """
+        Put urls a crashed consumer claimed but never acked back in front of the
+        pending queue. Only call this when no other consumer is running.
+        """
+        moved = 0
+        while self.r.lmove(self.processing_key, self.pending_key, 'RIGHT', 'LEFT') is not None:
+            moved += 1
+        return moved
+
+    def pending_count(self):
+        return self.r.llen(self.pending_key)
+
+    def add_from_list(self, key, chunk_size=1000):
+        """
+        Move the urls of a legacy RPUSH list (e.g. 'jobs') into the frontier and
+        delete the list, so consumers can call this at every startup and only
+        the first one pays for it. The list is renamed to `<key>:migrating`
+        first; a migration that died half way is picked up from there, and the
+        urls it had already added are not queued twice.
+        """
+        migrating = f"{key}:migrating"
+        added = 0
+        while True:
+            if not self.r.exists(migrating):
+                try:
+                    self.r.renamenx(key, migrating)
+                except redis.ResponseError:  # no legacy list (left)
+                    return added
+            for urls in iter_list_chunks(self.r, migrating, chunk_size):
+                added += self.add(*urls)
+            self.r.delete(migrating)
+
+
+class BufferedWriter:
+    """
+    Buffers RPUSHes and frontier adds in memory and sends them to redis in one pipeline once
+    `batch_size` values are pending or `flush_interval` seconds have passed
+    since the last flush. Call `flush()` (or leave the `with` block) when a
+    page is done so nothing stays in the buffer.
+    """
+
+    def __init__(self, client, batch_size=500, flush_interval=1.0):
+        self.r = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = defaultdict(list)
+        self.pending_frontier = defaultdict(list)
+        self.pending_count = 0
+        self.last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+    def append_to_list(self, key, value):
+        self.pending[key].append(value)
+        self._queued()
+
+    def add_to_frontier(self, name, url):
+        self.pending_frontier[name].append(url)
+        self._queued()
+
+    def _queued(self):
+        self.pending_count += 1
+        if (self.pending_count >= self.batch_size
+                or time.monotonic() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Push every buffered value with one command per key in a single round-trip."""
+        self.last_flush = time.monotonic()
+        if not self.pending_count:
+            return 0
+        pipe = self.r.pipeline(transaction=False)
+        for key, values in self.pending.items():
+            pipe.rpush(key, *values)
+        for name, urls in self.pending_frontier.items():
+            Frontier(self.r, name).add(*urls, client=pipe)
+        pipe.execute()
+        flushed = self.pending_count
+        self.pending.clear()
+        self.pending_frontier.clear()
+        self.pending_count = 0
+        return flushed
+
+
+# Take a token from a host's bucket, refilled at the host's current rate, and
+# return how long to wait before using it (server clock, so every worker agrees).
+RATE_LIMIT_RESERVE_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'rate', 'tokens', 'updated', 'paused_until')
+local rate = tonumber(state[1]) or tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local tokens = tonumber(state[2]) or burst
+local updated = tonumber(state[3]) or now
+local paused_until = tonumber(state[4]) or 0
+tokens = math.min(burst, tokens + (now - updated) * rate) - 1
+local wait = 0
+if tokens < 0 then
+    wait = -tokens / rate
+end
+wait = math.max(wait, paused_until - now)
+redis.call('HSET', KEYS[1], 'rate', tostring(rate), 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], ARGV[3])
+return tostring(wait)
+"""
+
+# AIMD step of a host's rate after a response, same rules as HostBucket.record.
+# ARGV: signal, latency, has status, retry after, initial, min, max, increase,
+# decrease, slow factor, latency alpha, ttl ms, slow after
+RATE_LIMIT_RECORD_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'rate', 'latency', 'paused_until')
+local rate = tonumber(state[1]) or tonumber(ARGV[5])
+local average = tonumber(state[2])
+local signal = tonumber(ARGV[1])
+local latency = tonumber(ARGV[2])
+if signal > 0 and average and latency > math.max(tonumber(ARGV[13]), tonumber(ARGV[10]) * average) then
+    signal = -1
+end
+if ARGV[3] == '1' and latency > 0 then
+    if average then
+        average = average + tonumber(ARGV[11]) * (latency - average)
+    else
+        average = latency
+    end
+    redis.call('HSET', KEYS[1], 'latency', tostring(average))
+end
+if signal < 0 then
+    rate = math.max(tonumber(ARGV[6]), rate * tonumber(ARGV[9]))
+elseif signal > 0 then
+    rate = math.min(tonumber(ARGV[7]), rate + tonumber(ARGV[8]))
+end
+redis.call('HSET', KEYS[1], 'rate', tostring(rate))
+local retry_after = tonumber(ARGV[4])
+if retry_after > 0 then
+    local paused_until = math.max(tonumber(state[3]) or 0, now + retry_after)
+    redis.call('HSET', KEYS[1], 'paused_until', tostring(paused_until))
+end
+redis.call('PEXPIRE', KEYS[1], ARGV[12])
+return tostring(rate)
+"""
+
+
+class RateLimiter:
+    """
+    Per-host adaptive rate limiter shared by every process through redis, for
+    synchronous callers such as the Celery workers. Each host's bucket lives
+    in the hash <prefix>:<host> and follows the same AIMD policy as
+    src.utilities.rate_limiter.AdaptiveRateLimiter.
+
+    Usage:
+        with limiter.request(url) as slot:
+            response = requests.get(url)
+            slot.observe(response.status_code, response.headers)
+    """
+
+    def __init__(self, client, prefix='ratelimit', policy=None, ttl=86400):
+        self.r = client
+        self.prefix = prefix
+        self.policy = policy or AIMDPolicy()
+        self.ttl_ms = int(ttl * 1000)
+        self._reserve_script = client.register_script(RATE_LIMIT_RESERVE_LUA)
+        self._record_script = client.register_script(RATE_LIMIT_RECORD_LUA)
+
+    def _key(self, url):
+        return f"{self.prefix}:{host_of(url)}"
+
+    def reserve(self, url):
+        """Take a token of the host's bucket and return the seconds to wait before using it."""
+        return float(self._reserve_script(
+            keys=[self._key(url)], args=[self.policy.initial_rate, self.policy.burst, self.ttl_ms]
+        ))
+
+    def acquire(self, url):
+        """Block until the host's bucket allows another request; returns the seconds waited."""
+        wait = self.reserve(url)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def record(self, url, status, latency, retry_after=0.0):
+        """Apply a response to the host's shared rate and return the new rate."""
+        policy = self.policy
+        return float(self._record_script(keys=[self._key(url)], args=[
+            status_signal(status), latency, 0 if status is None else 1, retry_after,
+            policy.initial_rate, policy.min_rate, policy.max_rate, policy.increase,
+            policy.decrease, policy.slow_factor, policy.latency_alpha, self.ttl_ms, policy.slow_after,
+        ]))
 
+    def rate(self, url):
+        rate = self.r.hget(self._key(url), 'rate')
+        return float(rate) if rate is not None else self.policy.initial_rate
 
+    @contextmanager
+    def request(self, url):
+        self.acquire(url)
+        slot = RequestSlot()
+        start = time.monotonic()
+        try:
+            yield slot
+        except Exception:
+            self.record(url, slot.status, time.monotonic() - start, slot.retry_after)
+            raise
+        if slot.status is not None:
+            self.record(url, slot.status, time.monotonic() - start, slot.retry_after)
 
-# test redis
-r = Redis()
-r.test_connection()
+    @asynccontextmanager
+    async def request_async(self, url):
+        """
+        `request` for coroutines: waits for the bucket with asyncio.sleep. The
+        redis round trips themselves stay blocking; they are sub-millisecond.
+        """
+        wait = self.reserve(url)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        slot = RequestSlot()
+        start = time.monotonic()
+        try:
+            yield slot
+        except Exception:
+            self.record(url, slot.status, time.monotonic() - start, slot.retry_after)
+            raise
+        if slot.status is not None:
+            self.record(url, slot.status, time.monotonic() - start, slot.retry_after)
 
 
-# test append to list
-print(len(set(r.get_list('jobs'))))
+if __name__ == "__main__":
+    # test redis
+    r = Redis()
+    r.test_connection()
 
+    # test append to list
+    print(len(set(r.get_list('jobs'))))
@@ -8,3 +8,8 @@ task_serializer = 'json'
 result_serializer = 'json'
 accept_content = ['json']
 timezone = 'UTC'
+
+# a chunk is acked when scrape_job returns, i.e. after its rows were flushed,
+# so a worker that dies mid-chunk gets the chunk redelivered
+task_acks_late = True
+task_reject_on_worker_lost = True
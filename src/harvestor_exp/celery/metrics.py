@@ -0,0 +1,78 @@
+# metrics.py
+# Prometheus metrics of the scrape workers. Every prefork child writes its
+# samples to PROMETHEUS_MULTIPROC_DIR; the worker's main process serves the
+# sum over all of them, plus the broker queue depth, on METRICS_PORT.
+# Run one worker per host, or give each its own port and directory.
+import glob
+import os
+
+# must be set before prometheus_client is imported
+MULTIPROC_DIR = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(".cache", "prometheus"))
+os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+import redis  # noqa: E402
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, multiprocess, start_http_server  # noqa: E402
+from prometheus_client.core import GaugeMetricFamily  # noqa: E402
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", 8000))
+
+# db_check: "already scraped" lookup of a chunk, fetch: one page over HTTP,
+# parse: field extraction of one page, insert: batched upsert of a chunk
+PHASES = ("db_check", "fetch", "parse", "insert")
+
+PHASE_SECONDS = Histogram(
+    'scrape_phase_seconds', 'Seconds spent in each phase of a scrape task', ['site', 'phase'],
+    buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60))
+TASK_SECONDS = Histogram(
+    'celery_task_duration_seconds', 'Seconds a scrape_job chunk task took', ['site'],
+    buckets=(.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800))
+PAGES_SCRAPED = Counter('celery_task_success_total', 'Job pages scraped or found unchanged', ['site'])
+PAGES_FAILED = Counter('celery_task_failure_total', 'Job pages that failed to scrape', ['site'])
+TASKS_IN_PROGRESS = Gauge('celery_tasks_in_progress', 'scrape_job tasks being processed',
+                          multiprocess_mode='livesum')
+
+
+class QueueDepthCollector:
+    """
+    Length of each broker queue, read with LLEN whenever Prometheus scrapes
+    (the redis transport keeps a queue's pending messages in a list of the
+    same name).
+    """
+
+    def __init__(self, broker_url: str, queues):
+        self.client = redis.Redis.from_url(broker_url)
+        self.queues = list(queues)
+
+    def collect(self):
+        depth = GaugeMetricFamily('celery_queue_length', 'Messages waiting in the broker queue', labels=['queue'])
+        pipe = self.client.pipeline(transaction=False)
+        for queue in self.queues:
+            pipe.llen(queue)
+        try:
+            lengths = pipe.execute()
+        except redis.RedisError as e:
+            print(f"Could not read queue lengths: {e}")
+            return
+        for queue, length in zip(self.queues, lengths):
+            depth.add_metric([queue], length)
+        yield depth
+
+
+def start_exporter(broker_url: str, queues, port: int = METRICS_PORT):
+    """
+    Serve the metrics of every process of this worker and the depth of
+    `queues` on `port`. Call it in the worker's main process before the pool
+    forks; samples left over from the previous run are dropped.
+    """
+    for path in glob.glob(os.path.join(MULTIPROC_DIR, '*.db')):
+        os.remove(path)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(QueueDepthCollector(broker_url, queues))
+    start_http_server(port, registry=registry)
+    print(f"Metrics on :{port} (samples in {MULTIPROC_DIR})")
+
+
+def mark_process_dead(pid: int):
+    """Drop the live gauges of a pool process that exited."""
+    multiprocess.mark_process_dead(pid, MULTIPROC_DIR)
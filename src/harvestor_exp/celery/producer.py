@@ -1,30 +1,50 @@
 # producer.py
-from tasks import scrape_job, ScraperPayload
+import os
+
+from tasks import app, scrape_job
+from sites import get_site_config
 from src.cache.Redis import Redis
+from src.Database.database import Database
+
+# urls per task message; each task upserts its chunk in one batch
+TASK_CHUNK_SIZE = int(os.getenv("TASK_CHUNK_SIZE", 100))
+
+# RECRAWL=1 queues every open job again (fetched conditionally, so unchanged
+# pages cost a 304) instead of only the urls not in job_details yet
+RECRAWL = os.getenv("RECRAWL", "0") == "1"
+
+
+def chunked(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
 
-def main():
+
+def main(site_id="apple", recrawl=RECRAWL):
     cache = Redis()
-    queue = set(cache.get_list("jobs"))  # e.g., list of job URLs
-
-    # Example config mapping selectors to the CSS for each field
-    config = {
-        "job_id": "#jobNumber",
-        "title": ".jd__header--title",
-        "location": [".addressCountry", "#job-location-name"],
-        "department": "#job-team-name",
-        "summary": "#jd-job-summary",
-        "long_description": "#jd-description",
-        "date": "#jobPostDate",
-    }
-
-    print(f"Found {len(queue)} job URLs to scrape.")
-
-    for url in queue:
-        payload = ScraperPayload(url=url, **config)
-        # Enqueue a Celery task for each job
-        scrape_job.delay(payload.__dict__)  # .delay() is what queues the task
-
-    print("All jobs have been queued to Celery.")
+    db = Database()
+    frontier = cache.frontier("jobs")  # deduplicated job URLs
+    frontier.add_from_list("jobs")
+    get_site_config(site_id)  # fail before claiming anything for an unknown site
+    if recrawl:
+        for urls in db.iter_open_job_urls():
+            frontier.requeue(*urls)
+
+    print(f"Found {frontier.pending_count()} job URLs to scrape.")
+
+    queued = 0
+    # one broker connection for every message instead of one per .delay()
+    with app.producer_or_acquire() as producer:
+        for urls in frontier.iter_claims(500):
+            # only enqueue URLs that are not in job_details yet (one query per page)
+            todo = [url.strip() for url in urls] if recrawl else db.filter_unscraped_urls(urls)
+            for chunk in chunked(todo, TASK_CHUNK_SIZE):
+                # the selectors stay with the workers, referenced by site id
+                scrape_job.apply_async((site_id, chunk, recrawl), producer=producer)
+                queued += len(chunk)
+            # the broker owns these URLs now
+            frontier.ack(*urls)
+
+    print(f"All {queued} jobs have been queued to Celery.")
 
 if __name__ == "__main__":
     main()
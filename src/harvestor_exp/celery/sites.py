@@ -0,0 +1,23 @@
+# sites.py
+# Selector configs of the job sites, keyed by site id. Task messages carry
+# only the site id and the urls; producer and workers look the config up here.
+
+SITE_CONFIGS = {
+    "apple": {
+        "job_id": "#jobNumber",
+        "title": ".jd__header--title",
+        "location": [".addressCountry", "#job-location-name"],
+        "department": "#job-team-name",
+        "summary": "#jd-job-summary",
+        "long_description": "#jd-description",
+        "date": "#jobPostDate",
+        "parser": "selectolax",
+    },
+}
+
+
+def get_site_config(site_id: str) -> dict:
+    try:
+        return SITE_CONFIGS[site_id]
+    except KeyError:
+        raise ValueError(f"Unknown site id {site_id!r}, add its selectors to SITE_CONFIGS") from None
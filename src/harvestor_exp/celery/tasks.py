@@ -1,15 +1,21 @@
 # tasks.py
+import asyncio
 import time
-import requests
-from bs4 import BeautifulSoup
 from celery import Celery
 from dataclasses import dataclass
 from typing import Optional
 import os
-from Database.database import Database
-import sys
-from prometheus_client import Counter, Gauge, start_http_server
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'Database')))
+from src.cache.Redis import Redis
+from src.Database.database import Database, JobDetailsWriter
+from src.utilities.extraction_plan import DEFAULT_PARSER, get_plan, parse_html
+from src.utilities.http_client import (HTTP_STATS, close_session, get_requests_session, get_session,
+                                       requests_connection_stats)
+from src.utilities.response_cache import PendingValidators, get_response_cache
+from src.utilities.work_queue import run_work_queue
+from sites import get_site_config
+from metrics import (PAGES_FAILED, PAGES_SCRAPED, PHASE_SECONDS, TASK_SECONDS, TASKS_IN_PROGRESS,
+                     mark_process_dead, start_exporter)
+from celery.signals import worker_init, worker_process_shutdown
 
 # (Optional) Ensure Celery sees your config file
 os.environ.setdefault('CELERY_CONFIG_MODULE', 'celeryconfig')
@@ -18,17 +24,80 @@ app = Celery("scraper")
 app.config_from_envvar('CELERY_CONFIG_MODULE')  # or directly: app.config_from_object('celeryconfig')
 
 
+# "async": the pages of a chunk are fetched concurrently (aiohttp) on the
+# worker process's event loop, so a prefork process is not idle while it
+# waits on the network. "sync": one after another with requests.
+FETCH_MODE = os.getenv("SCRAPE_FETCH_MODE", "async")
+FETCH_CONCURRENCY = int(os.getenv("SCRAPE_FETCH_CONCURRENCY", 20))
 
+_job_writer = None
+_rate_limiter = None
+_event_loops = {}
+# validators of the rows queued on this process's writer, cached once committed
+_validators = PendingValidators()
 
-TASK_SUCCESS = Counter('celery_task_success_total', 'Total number of successfully executed tasks')
-TASK_FAILURE = Counter('celery_task_failure_total', 'Total number of failed tasks')
-TASK_DURATION = Gauge('celery_task_duration_seconds', 'Task execution duration in seconds')
-TASK_IN_PROGRESS = Gauge('celery_tasks_in_progress', 'Number of tasks currently being processed')
 
+def store_validators(rows: list, rejected: list):
+    """
+    The writer's commit callback: only pages whose rows are in the DB are
+    remembered as seen, so a lost or refused row is fetched in full again.
+    """
+    _validators.commit(row[-1] for row in rows)
+    _validators.discard(row[-1] for row in rejected)
+
+
+def get_job_writer() -> JobDetailsWriter:
+    """
+    Row buffer shared by all tasks of this worker process, created lazily so a
+    prefork child never inherits the parent's buffer.
+    """
+    global _job_writer
+    if _job_writer is None:
+        _job_writer = JobDetailsWriter(Database(), on_commit=store_validators)
+    return _job_writer
+
+
+def get_rate_limiter():
+    """
+    Per-host rate limiter whose buckets live in redis, so every worker
+    process and machine paces a host together.
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = Redis().rate_limiter()
+    return _rate_limiter
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Event loop of this worker process for the async fetch mode. It outlives
+    the tasks, and with it the aiohttp session and its keep-alive connections.
+    """
+    pid = os.getpid()
+    if pid not in _event_loops:
+        _event_loops[pid] = asyncio.new_event_loop()
+    return _event_loops[pid]
+
+
+@worker_init.connect
+def start_metrics_exporter(**kwargs):
+    # one exporter per worker, in the main process, for all of its pool processes
+    start_exporter(app.conf.broker_url, list(app.amqp.queues) or [app.conf.task_default_queue])
+
+
+@worker_process_shutdown.connect
+def flush_job_writer(**kwargs):
+    if _job_writer is not None:
+        _job_writer.close()
+    loop = _event_loops.pop(os.getpid(), None)
+    if loop is not None:
+        loop.run_until_complete(close_session())
+        loop.close()
+        print(f"HTTP connections: {HTTP_STATS.as_dict()}")
+    else:
+        print(f"HTTP connections: {requests_connection_stats(get_requests_session())}")
+    mark_process_dead(os.getpid())
 
-#
-# # Start Prometheus metrics server
-# start_http_server(8000)  # Exposes metrics on localhost:8000
 
 @dataclass
 class ScraperPayload:
@@ -40,98 +109,144 @@ class ScraperPayload:
     summary: Optional[str] = None
     long_description: Optional[str] = None
     date: Optional[str] = None
+    parser: str = DEFAULT_PARSER  # html.parser, lxml or selectolax
 
-def get_inner_text(soup: BeautifulSoup, selector: str) -> str:
+
+DETAIL_FIELDS = ("job_id", "title", "location", "department", "summary", "long_description", "date")
+
+
+def extract_fields(html: str, payload: ScraperPayload) -> dict:
     """
-    Given a CSS selector, find the first matching element in `soup`
-    and return its text. Otherwise return an empty string.
+    Parse with the site's parser backend and extract every detail field
+    with its compiled selector plan (fallback selector lists tried in order).
+    Missing fields come back as None.
     """
-    if not selector:
-        return ""
-    element = soup.select_one(selector)
-    return element.get_text(strip=True) if element else ""
-
-@app.task
-def scrape_job(payload_dict):
+    plan = get_plan({field: getattr(payload, field) for field in DETAIL_FIELDS})
+    document = parse_html(html, payload.parser)
+    return {field: text or None for field, text in plan.extract(document).items()}
+
+
+def store_page(payload: ScraperPayload, site_id: str, headers, html: str):
+    """Extract a fetched page and queue its row, unless it is the same page as last time."""
+    cache = get_response_cache()
+    if cache.is_unchanged(payload.url, html):
+        cache.touch(payload.url)
+        print(f"[UNCHANGED] {payload.url}")
+        return
+
+    # Extract info
+    with PHASE_SECONDS.labels(site_id, 'parse').time():
+        fields = extract_fields(html, payload)
+    job_id = fields["job_id"]
+    title = fields["title"]
+    location = fields["location"]
+    department = fields["department"]
+    summary = fields["summary"]
+    long_desc = fields["long_description"]
+    date_val = fields["date"]
+
+    # Queue for the batched upsert at the end of the chunk
+    _validators.add(payload.url, headers, html)
+    get_job_writer().add(job_id, title, location, department, summary, long_desc, date_val, None, payload.url)
+    print(f"[DONE] Scraped {payload.url}")
+
+
+def scrape_url(payload: ScraperPayload, site_id: str):
     """
-    Celery task to scrape a single job URL and insert into the DB.
-    `payload_dict` is a dictionary version of ScraperPayload.
+    Fetch one job page and queue its row on this worker's writer. Errors are
+    counted and printed so one bad page does not fail the rest of its chunk.
     """
-
-    # Convert dict back to ScraperPayload
-    payload = ScraperPayload(**payload_dict)
-
-    start_time = time.time()  # Start timing
-    TASK_IN_PROGRESS.inc()  # Increment tasks in progress
     try:
-
-        db = Database()
-
-        # Skip if already in DB
-        query = "SELECT * FROM job_details WHERE url = %s"
-        params = (payload.url.strip(),)
-        result = db.execute_query_with_params_and_fetch_one(query, params)
-        if result:
-            print(f"[SKIP] Already scraped {payload.url}")
-            return
-
         # Synchronous HTTP request (using requests)
-        response = requests.get(payload.url, timeout=10)
-        response.raise_for_status()
-        html = response.text
-
-        soup = BeautifulSoup(html, "html.parser")
-
-        # Extract info
-        job_id = get_inner_text(soup, payload.job_id) or None
-        title = get_inner_text(soup, payload.title) or None
-
-        # If location is a list of selectors, try them in order
-        location = None
-        if isinstance(payload.location, list):
-            for loc_sel in payload.location:
-                location = get_inner_text(soup, loc_sel)
-                if location:
-                    break
+        # Conditional GET: a 304 or an identical body means nothing to re-parse
+        cache = get_response_cache()
+        with get_rate_limiter().request(payload.url) as slot, PHASE_SECONDS.labels(site_id, 'fetch').time():
+            # pooled keep-alive session of this worker process
+            response = get_requests_session().get(
+                payload.url, headers=cache.conditional_headers(payload.url), timeout=10
+            )
+            slot.observe(response.status_code, response.headers)
+            response.raise_for_status()
+
+        if response.status_code == 304:
+            cache.touch(payload.url)
+            print(f"[UNCHANGED] {payload.url}")
         else:
-            location = get_inner_text(soup, payload.location)
-        location = location or None
+            store_page(payload, site_id, response.headers, response.text)
+        PAGES_SCRAPED.labels(site_id).inc()
 
-        department = get_inner_text(soup, payload.department) or None
-        summary = get_inner_text(soup, payload.summary) or None
-        long_desc = get_inner_text(soup, payload.long_description) or None
-        date_val = get_inner_text(soup, payload.date) or None
+    except Exception as e:
+        print(f"Error scraping {payload.url}: {e}")
+        PAGES_FAILED.labels(site_id).inc()
 
-        # Insert data into DB
-        query = """
-            INSERT INTO job_details (job_id, title, location, department, summary, long_description, date, end_date, url)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        params = (job_id, title, location, department, summary, long_desc, date_val, None, payload.url)
-        db.insert_query(query, params)
 
-        print(f"[DONE] Scraped {payload.url}")
-        TASK_SUCCESS.inc()  # Increment successful tasks
+async def scrape_url_async(payload: ScraperPayload, site_id: str):
+    """`scrape_url` over the worker's aiohttp session, for the async fetch mode."""
+    try:
+        cache = get_response_cache()
+        async with get_rate_limiter().request_async(payload.url) as slot:
+            with PHASE_SECONDS.labels(site_id, 'fetch').time():
+                async with get_session().get(payload.url, headers=cache.conditional_headers(payload.url)) as response:
+                    slot.observe(response.status, response.headers)
+                    response.raise_for_status()
+                    html = await response.text() if response.status != 304 else None
+                    headers = response.headers
+
+        if html is None:
+            cache.touch(payload.url)
+            print(f"[UNCHANGED] {payload.url}")
+        else:
+            store_page(payload, site_id, headers, html)
+        PAGES_SCRAPED.labels(site_id).inc()
 
     except Exception as e:
         print(f"Error scraping {payload.url}: {e}")
-        TASK_FAILURE.inc()
-
-    finally:
-        duration = time.time() - start_time
-        TASK_DURATION.set(duration)  # Record task duration
-        TASK_IN_PROGRESS.dec()  # Decrement tasks in progress
+        PAGES_FAILED.labels(site_id).inc()
 
 
-from celery.app.control import Inspect
+def scrape_urls(payloads: list, site_id: str, mode: str = FETCH_MODE):
+    """Scrape a chunk of pages, FETCH_CONCURRENCY at a time in the async mode."""
+    if mode == "async":
+        get_event_loop().run_until_complete(
+            run_work_queue(payloads, lambda payload: scrape_url_async(payload, site_id), workers=FETCH_CONCURRENCY))
+    elif mode == "sync":
+        for payload in payloads:
+            scrape_url(payload, site_id)
+    else:
+        raise ValueError(f"Unknown fetch mode {mode!r}, expected 'async' or 'sync'")
 
-TASK_QUEUE_SIZE = Gauge('celery_task_queue_size', 'Number of tasks in the Celery queue')
 
 @app.task
-def update_queue_size():
-    inspect = app.control.inspect()
-    active_queues = inspect.active_queues()
-    if active_queues:
-        for queue_name, queue_info in active_queues.items():
-            TASK_QUEUE_SIZE.labels(queue_name=queue_name).set(len(queue_info))
+def scrape_job(site_id, urls, recrawl=False):
+    """
+    Celery task to scrape a chunk of job URLs of one site and upsert them.
+    The selectors are looked up by `site_id` in SITE_CONFIGS rather than sent
+    with every message. The chunk shares one "already scraped" query (skipped
+    for a `recrawl`, where stored jobs are fetched again), the worker's
+    pooled HTTP session and a single batched upsert. Its pages are fetched
+    concurrently unless SCRAPE_FETCH_MODE=sync.
+    """
+    config = get_site_config(site_id)
+
+    start_time = time.time()  # Start timing
+    TASKS_IN_PROGRESS.inc()
+    try:
+        # Skip urls already in the DB (one indexed query for the chunk)
+        if recrawl:
+            unscraped = [url.strip() for url in urls]
+        else:
+            with PHASE_SECONDS.labels(site_id, 'db_check').time():
+                unscraped = Database().filter_unscraped_urls(urls)
+        if len(unscraped) < len(urls):
+            print(f"[SKIP] {len(urls) - len(unscraped)} of {len(urls)} urls already scraped")
+
+        scrape_urls([ScraperPayload(url=url, **config) for url in unscraped], site_id)
+
+        # the chunk is done once its rows are in the DB
+        with PHASE_SECONDS.labels(site_id, 'insert').time():
+            get_job_writer().flush()
+
+    finally:
+        TASK_SECONDS.labels(site_id).observe(time.time() - start_time)
+        TASKS_IN_PROGRESS.dec()
 
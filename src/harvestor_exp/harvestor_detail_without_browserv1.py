@@ -1,10 +1,17 @@
 import asyncio
-import random
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, Tuple
 
 import aiohttp
-from bs4 import BeautifulSoup
+
+from src.utilities.extraction_plan import DEFAULT_PARSER, get_plan, parse_html
+from src.utilities.http_client import HTTP_STATS, close_session, get_session
+from src.utilities.rate_limiter import get_rate_limiter
+from src.utilities.response_cache import PendingValidators, get_response_cache
+from src.utilities.timing import PhaseTimer
+from src.utilities.work_queue import run_work_queue
 
 @dataclass
 class ScraperPayload:
@@ -16,80 +23,114 @@ class ScraperPayload:
     summary: Optional[str] = None
     long_description: Optional[str] = None
     date: Optional[str] = None
+    parser: str = DEFAULT_PARSER  # html.parser, lxml or selectolax
+
 
+DETAIL_FIELDS = ("job_id", "title", "location", "department", "summary", "long_description", "date")
 
 # Limit concurrency to avoid overwhelming the server or your system.
-SEM = asyncio.Semaphore(5)
+FETCH_CONCURRENCY = 5
+SEM = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+# Parsing is CPU bound and runs in a process pool, one worker per core.
+# PARSE_SEM caps the pages handed to the pool (and held in memory) at two per
+# worker, independently of how many fetches SEM lets run.
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", os.cpu_count() or 1))
+PARSE_SEM = asyncio.Semaphore(PARSE_WORKERS * 2)
+
+# fetch, extract (all fields in one plan walk) and db_write times of this run
+timer = PhaseTimer("aiohttp")
+
+# outcomes of scrape_job_details: a row was queued, nothing changed, or the page failed
+QUEUED, UNCHANGED, FAILED = "queued", "unchanged", "failed"
+
+# RECRAWL=1 puts every open job back on the frontier and fetches it again
+# (conditionally, so unchanged pages cost a 304) instead of skipping the
+# urls already in job_details
+RECRAWL = os.getenv("RECRAWL", "0") == "1"
+
+# validators of the queued rows, saved to the response cache once committed
+validators = PendingValidators()
 
-def get_inner_text(soup: BeautifulSoup, selector: str) -> str:
+
+def extract_fields(html: str, selectors: dict, parser: str) -> dict:
     """
-    Given a CSS selector, find the first matching element in `soup`
-    and return its text. Otherwise return an empty string.
+    Parse with the site's parser backend and extract every detail field
+    with its compiled selector plan. Missing fields come back as None.
+    Runs in a parse worker process; the plan is compiled once per process.
     """
-    if not selector:
-        return ""
+    document = parse_html(html, parser)
+    return {field: text or None for field, text in get_plan(selectors).extract(document).items()}
+
 
-    element = soup.select_one(selector)
-    if element:
-        return element.get_text(strip=True)
-    return ""
+async def fetch_html(session: aiohttp.ClientSession, url: str) -> Tuple[Optional[str], dict]:
+    """
+    Fetch a page under SEM, so the slot is free again as soon as the body is read.
+    Requests are paced per host by the adaptive rate limiter and made
+    conditional on the response cache. Returns (html, headers), with html
+    None when the page has not changed since it was last processed.
+    """
+    cache = get_response_cache()
+    async with SEM:
+        async with get_rate_limiter().request(url) as slot:
+            with timer.span("fetch"):
+                async with session.get(url, headers=cache.conditional_headers(url)) as response:
+                    slot.observe(response.status, response.headers)
+                    if response.status == 304:
+                        cache.touch(url)
+                        return None, response.headers
+                    # Raise if there's a non-2xx status
+                    response.raise_for_status()
+                    html = await response.text()
+                    headers = response.headers
+
+    if cache.is_unchanged(url, html):
+        cache.touch(url)
+        return None, headers
+    return html, headers
+
+
+async def parse_fields(parse_pool: Executor, html: str, payload: ScraperPayload) -> dict:
+    """
+    Run `extract_fields` in the parse pool under PARSE_SEM, keeping the event loop free for I/O.
+    """
+    selectors = {field: getattr(payload, field) for field in DETAIL_FIELDS}
+    async with PARSE_SEM:
+        loop = asyncio.get_running_loop()
+        with timer.span("extract"):
+            return await loop.run_in_executor(parse_pool, extract_fields, html, selectors, payload.parser)
 
 
-async def scrape_job_details(payload: ScraperPayload, session: aiohttp.ClientSession) -> None:
+async def scrape_job_details(payload: ScraperPayload, session: aiohttp.ClientSession, writer, parse_pool: Executor) -> str:
     """
     Asynchronously fetches the job details page, parses required fields
-    using CSS selectors, and then inserts into the database.
+    using CSS selectors in the parse pool, and then queues the row for a
+    batched upsert. Returns QUEUED, UNCHANGED (nothing to write) or FAILED
+    (an error, or no job id on the page).
     """
     try:
-        # # Basic random delay for rate limiting
-        # await asyncio.sleep(random.uniform(1, 2))
-        from src.Database.database import Database
-        db = Database()
-
-        # check if url is already scraped
-        query = "SELECT * FROM job_details WHERE url = %s"
-        params = (payload.url.strip(),)
-        result = db.execute_query_with_params_and_fetch_one(query, params)
-        if result:
-            print(f"[SKIP] Already scraped {payload.url}")
-            return
-
-        # Fetch HTML content
-        async with session.get(payload.url) as response:
-            # Raise if there's a non-2xx status
-            response.raise_for_status()
-            html = await response.text()
-
-        # Parse the HTML
-        soup = BeautifulSoup(html, "html.parser")
+        # Fetch HTML content (only when it changed since the last run)
+        html, headers = await fetch_html(session, payload.url)
+        if html is None:
+            print(f"[UNCHANGED] {payload.url}")
+            return UNCHANGED
 
         # Extract info based on CSS selectors in the payload
-        job_id = get_inner_text(soup, payload.job_id)
-        job_id = job_id.strip() if job_id else None
-        title = get_inner_text(soup, payload.title)
-        title = title.strip() if title else None
-        location = get_inner_text(soup, payload.location[0])
-        if not location:
-            location = get_inner_text(soup, payload.location[1])
-        location = location.strip() if location else None
-        department = get_inner_text(soup, payload.department)
-        department = department.strip() if department else None
-        summary = get_inner_text(soup, payload.summary)
-        summary = summary.strip() if summary else None
-        long_desc = get_inner_text(soup, payload.long_description)
-        long_desc = long_desc.strip() if long_desc else None
-        date_val = get_inner_text(soup, payload.date)
-        date_val = date_val.strip() if date_val else None
-
-        # Insert into the database (example)
-
-        db = Database()
-        query = """
-            INSERT INTO job_details (job_id, title, location, department, summary, long_description, date, end_date, url)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        params = (job_id, title, location, department, summary, long_desc, date_val, None, payload.url)
-        db.insert_query(query, params)
+        fields = await parse_fields(parse_pool, html, payload)
+        job_id = fields["job_id"]
+        title = fields["title"]
+        location = fields["location"]
+        department = fields["department"]
+        summary = fields["summary"]
+        long_desc = fields["long_description"]
+        date_val = fields["date"]
+        if not job_id:
+            print(f"[SKIP] No job_id for {payload.url}")
+            return FAILED
+
+        # Queue for the next batched upsert
+        validators.add(payload.url, headers, html)
+        writer.add(job_id, title, location, department, summary, long_desc, date_val, None, payload.url)
 
         # Optionally update the payload with the scraped info
         payload.job_id = job_id
@@ -101,30 +142,14 @@ async def scrape_job_details(payload: ScraperPayload, session: aiohttp.ClientSes
         payload.date = date_val
 
         print(f"[DONE] Scraped {payload.url}")
+        return QUEUED
 
     except Exception as e:
         print(f"Error scraping {payload.url}: {e}")
+        return FAILED
 
 
-async def process_job_detail(payload: ScraperPayload, session: aiohttp.ClientSession) -> None:
-    """
-    Process a single job detail page under semaphore control.
-    """
-    async with SEM:  # ensures only X tasks run concurrently
-        await scrape_job_details(payload, session)
-
-
-async def scrape_batch(payloads) -> None:
-    """
-    Given a list of ScraperPayloads, create tasks to scrape each payload concurrently.
-    Uses a single shared aiohttp.ClientSession.
-    """
-    async with aiohttp.ClientSession() as session:
-        tasks = [asyncio.create_task(process_job_detail(pl, session)) for pl in payloads]
-        await asyncio.gather(*tasks)
-
-
-async def main():
+async def main(recrawl: bool = RECRAWL):
     # Example config mapping selectors to the CSS for each field
     config = {
         "job_id": "#jobNumber",
@@ -133,29 +158,74 @@ async def main():
         "department": "#job-team-name",
         "summary": "#jd-job-summary",
         "long_description": "#jd-description",
-        "date": "#jobPostDate"
+        "date": "#jobPostDate",
+        "parser": "selectolax",
     }
 
     from src.cache.Redis import Redis
+    from src.Database.database import Database, JobDetailsWriter
     cache = Redis()
-
-    # Get unique job URLs from Redis
-    queue = set(cache.get_list("jobs"))
-    print(f"Found {len(queue)} job URLs to scrape.")
-
-    # Build a list of ScraperPayload objects
-    jobs = [ScraperPayload(url=item, **config) for item in queue]
-
-    # Process jobs in small batches if desired:
-    batch_size = 10
-    for i in range(0, len(jobs), batch_size):
-        batch = jobs[i : i + batch_size]
-        print(f"Scraping batch {i // batch_size + 1} with {len(batch)} items.")
-        await scrape_batch(batch)
-
-        # # Optional: Sleep between batches
-        # await asyncio.sleep(2)
-
+    db = Database()
+
+    # Claim unique job URLs from the Redis frontier
+    frontier = cache.frontier("jobs")
+    frontier.add_from_list("jobs")
+    if recrawl:
+        for urls in db.iter_open_job_urls():
+            frontier.requeue(*urls)
+    print(f"Found {frontier.pending_count()} job URLs to scrape.")
+
+    # URLs claimed from the frontier, keyed by their stripped form
+    claimed = {}
+
+    # A url is acked (and its validators cached) once its row is committed,
+    # so a crash before the flush leaves it claimed for requeue_unacked and
+    # fetched in full again; rows the DB refused are retried
+    def stored(rows, rejected):
+        validators.commit(row[-1] for row in rows)
+        validators.discard(row[-1] for row in rejected)
+        frontier.ack(*(claimed.pop(row[-1], row[-1]) for row in rows))
+        frontier.fail(*(claimed.pop(row[-1], row[-1]) for row in rejected))
+
+    writer = JobDetailsWriter(db, on_commit=stored, timer=timer)
+
+    def claim_payloads(page_size: int = 10):
+        for urls in frontier.iter_claims(page_size):
+            # Skip URLs that are already in job_details (one query per claimed
+            # page), unless they are claimed to be fetched again
+            todo = [url.strip() for url in urls] if recrawl else db.filter_unscraped_urls(urls)
+            pending = {url.strip(): url for url in urls}
+            skipped = [pending.pop(url) for url in list(pending) if url not in todo]
+            if skipped:
+                print(f"[SKIP] {len(skipped)} already scraped")
+                frontier.ack(*skipped)
+            claimed.update(pending)
+            for item in todo:
+                yield ScraperPayload(url=item, **config)
+
+    # One keep-alive session for the whole run
+    session = get_session()
+
+    async def handle(payload):
+        with timer.span("job"):
+            outcome = await scrape_job_details(payload, session, writer, parse_pool)
+        if outcome == UNCHANGED:
+            frontier.ack(claimed.pop(payload.url, payload.url))
+        elif outcome == FAILED:
+            # back to pending for another try, dead-lettered after a few
+            frontier.fail(claimed.pop(payload.url, payload.url))
+
+    # Workers keep both stages busy: up to 5 fetches (SEM) while the parse pool works
+    with ProcessPoolExecutor(max_workers=PARSE_WORKERS) as parse_pool:
+        try:
+            stats = await run_work_queue(claim_payloads(), handle, workers=FETCH_CONCURRENCY + PARSE_WORKERS * 2)
+            print(f"Job details processed: {stats}")
+        finally:
+            await close_session()
+            # flush the rows still buffered even when the run is interrupted
+            writer.close()
+            timer.write_summary()
+    print(f"Connections: {HTTP_STATS.as_dict()}")
     print("All done!")
 
 
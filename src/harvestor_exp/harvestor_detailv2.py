@@ -1,9 +1,14 @@
 import asyncio
-import random
-from pyppeteer import launch
 from dataclasses import dataclass
 from typing import Optional
 
+from src.utilities.browser_pool import BrowserPool
+from src.utilities.page_ready import goto_ready
+from src.utilities.rate_limiter import get_rate_limiter
+from src.utilities.resource_policy import apply_resource_policy
+from src.utilities.timing import PhaseTimer
+from src.utilities.work_queue import run_work_queue
+
 
 @dataclass
 class ScraperPayload:
@@ -19,6 +24,13 @@ class ScraperPayload:
 
 sem = asyncio.Semaphore(5)
 
+DETAIL_FIELDS = ("job_id", "title", "location", "department", "summary", "long_description", "date")
+# fields whose selectors must be on the page before it is scraped
+READY_FIELDS = ("job_id", "title", "long_description")
+
+# launch, navigate (with its ready / load breakdown), extract.<field> and db_write times of this run
+timer = PhaseTimer("pyppeteer-shared")
+
 async def get_inner_text(page, selector: str) -> str:
     """
     Helper function to extract innerText from an element.
@@ -36,36 +48,42 @@ async def get_inner_text(page, selector: str) -> str:
     return ""
 
 
-async def scrape_job_details_on_page(page, payload: ScraperPayload):
+async def scrape_job_details_on_page(page, payload: ScraperPayload, writer) -> bool:
     """
     Scrapes a single job detail page using an *already open* browser page.
-    Updates the payload with scraped info and inserts into the DB.
+    Updates the payload with scraped info and queues the row on the DB writer.
+    Returns False when the page failed or had no job id (no row queued then).
     """
     try:
-        # Add random delay (rate-limiting)
-        await asyncio.sleep(random.uniform(1, 3))
-
-        # Navigate to the job detail page
-        await page.goto(payload.url, waitUntil='networkidle0', timeout=90000)
-
-        # Extract info
-        job_id = await get_inner_text(page, payload.job_id)
-        title = await get_inner_text(page, payload.title)
-        location = await get_inner_text(page, payload.location)
-        department = await get_inner_text(page, payload.department)
-        summary = await get_inner_text(page, payload.summary)
-        long_desc = await get_inner_text(page, payload.long_description)
-        date_val = await get_inner_text(page, payload.date)
-
-        # Insert into DB
-        from src.Database.database import Database
-        db = Database()
-        query = """
-            INSERT INTO job_details(job_id, title, location, department, summary, long_description, date)
-            VALUES(%s, %s, %s, %s, %s, %s, %s)
-        """
-        params = (job_id, title, location, department, summary, long_desc, date_val)
-        db.insert_query(query, params)
+        # Skip the images, fonts, styles and trackers the site's resource policy blocks
+        await apply_resource_policy(page, url=payload.url)
+
+        # Navigate to the job detail page until its fields are there
+        async with get_rate_limiter().request(payload.url) as slot:
+            with timer.navigation(page):
+                response = await goto_ready(page, payload.url, [getattr(payload, f) for f in READY_FIELDS], timer)
+            if response:
+                slot.observe(response.status, response.headers)
+
+        # Extract info, timing each field
+        fields = {}
+        for field in DETAIL_FIELDS:
+            with timer.span(f"extract.{field}"):
+                fields[field] = await get_inner_text(page, getattr(payload, field))
+        job_id = fields["job_id"]
+        title = fields["title"]
+        location = fields["location"]
+        department = fields["department"]
+        summary = fields["summary"]
+        long_desc = fields["long_description"]
+        date_val = fields["date"]
+
+        if not job_id:
+            print(f"[SKIP] No job_id for {payload.url}")
+            return False
+
+        # Queue for the next batched upsert
+        writer.add(job_id, title, location, department, summary, long_desc, date_val, url=payload.url)
 
         # Update the payload with the scraped details (optional)
         payload.job_id = job_id
@@ -75,46 +93,21 @@ async def scrape_job_details_on_page(page, payload: ScraperPayload):
         payload.summary = summary
         payload.long_description = long_desc
         payload.date = date_val
+        return True
 
     except Exception as e:
         print(f"Error scraping job details from {payload.url}: {e}")
+        return False
 
 
-async def process_job_detail(payload, browser):
-    page = None
+async def process_job_detail(payload, pool: BrowserPool, writer) -> bool:
     try:
-        page = await browser.newPage()
-        await scrape_job_details_on_page(page, payload)
+        async with pool.page() as page:
+            return await scrape_job_details_on_page(page, payload, writer)
     except Exception as e:
         # Log error
         print(f"Error processing {payload.url}: {e}")
-    finally:
-        if page:
-            try:
-                await page.close()
-            except Exception:
-                pass  # Page may already be closed
-
-
-
-async def scrape_batch(payloads):
-    """
-    Scrapes a batch of jobs using a single browser instance for all payloads.
-    """
-    browser = None
-    try:
-        browser = await launch(
-            headless=True,
-            args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
-        )
-
-        # Use asyncio.gather to process each job concurrently or serially
-        tasks = [process_job_detail(payload, browser) for payload in payloads]
-        await asyncio.gather(*tasks)
-
-    finally:
-        if browser:
-            await browser.close()
+        return False
 
 
 async def main():
@@ -129,27 +122,39 @@ async def main():
     }
 
     from src.cache.Redis import Redis
+    from src.Database.database import Database, JobDetailsWriter
     cache = Redis()
 
-    # Grab URLs from Redis (stored under the 'jobs' list)
-    queue = set(cache.get_list('jobs'))
+    # Claim URLs from the Redis frontier (deduplicated when the listings were harvested)
+    frontier = cache.frontier('jobs')
+    frontier.add_from_list('jobs')
+
+    # A url is acked once its row is committed, so a crash before the flush
+    # leaves it claimed for requeue_unacked; rows the DB refused are retried
+    def stored(rows, rejected):
+        frontier.ack(*(row[-1] for row in rows))
+        frontier.fail(*(row[-1] for row in rejected))
 
-    print(f"Found {len(queue)} job URLs to scrape.")
+    writer = JobDetailsWriter(Database(), on_commit=stored, timer=timer)
 
-    # Build ScraperPayload objects
-    jobs = [ScraperPayload(url=item, **config) for item in queue]
+    print(f"Found {frontier.pending_count()} job URLs to scrape.")
 
-    # You can process all at once, or in batches
-    batch_size = 3
-    for i in range(0, len(jobs), batch_size):
-        batch = jobs[i : i + batch_size]
-        print(f"Scraping batch {i // batch_size + 1} with {len(batch)} items.")
-        await scrape_batch(batch)
+    # URLs are claimed a page at a time, only as fast as the workers free up
+    payloads = (ScraperPayload(url=item, **config) for urls in frontier.iter_claims(10) for item in urls)
+    async with BrowserPool(size=1, pages_per_browser=3, max_navigations=100, timer=timer) as pool:
+        async def handle(payload):
+            with timer.span("job"):
+                ok = await process_job_detail(payload, pool, writer)
+            if not ok:
+                # back to pending for another try, dead-lettered after a few
+                frontier.fail(payload.url)
 
-        # Optional: Wait between batches if you need more rate-limiting
-        await asyncio.sleep(10)
+        # Navigations are paced per host by the rate limiter
+        stats = await run_work_queue(payloads, handle, workers=3, per_host=3)
 
-    print("All done!")
+    writer.close()
+    timer.write_summary()
+    print(f"All done! {stats}")
 
 
 if __name__ == "__main__":
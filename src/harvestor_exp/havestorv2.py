@@ -1,34 +1,37 @@
 # main()
 #
 # Generates all scraping payloads.
-# Splits them into batches.
-# Calls scrape_batch(...) for each batch.
-# scrape_batch(...)
+# Opens a BrowserPool whose browser is recycled every 50 pages or 1.5 GB RSS.
+# Feeds the payloads to a WorkQueue of long-lived workers; each worker
+# picks up the next payload as soon as it is free.
+# scrape_listing(...)
 #
-# Launches one browser instance for the entire batch.
-# For each ScraperPayload in the batch:
-# Opens a new page in the same browser instance.
+# Borrows a new page from the browser pool.
 # Scrapes data using scrape_jobs_on_page.
 # Closes the page.
-# Finally closes the browser when the batch is done.
 # scrape_jobs_on_page(...)
 #
 # Navigates to the payload’s url.
 # Waits for the job list selector.
-# Extracts titles/links from each job listing, storing them in Redis.
+# Extracts titles/links from all job listings in one evaluate call, storing them in Redis.
 # Rate Limiting
 #
-# A small, random delay is added between opening pages (random.uniform(1, 3) seconds).
-# An additional, longer wait is inserted between batches (currently 5 seconds, previously 30).
+# The adaptive rate limiter paces navigations per host (faster while the
+# host answers quickly, backing off on 429/5xx), with at most 3 pages of the
+# host open at once.
 #
 
 import asyncio
-import random
-from pyppeteer import launch
 from dataclasses import dataclass
 from typing import List, Dict, Optional
 
 from src.cache.Redis import Redis
+from src.utilities.browser_pool import BrowserPool
+from src.utilities.listing_extractor import extract_listing_rows
+from src.utilities.page_ready import goto_ready
+from src.utilities.rate_limiter import get_rate_limiter
+from src.utilities.resource_policy import apply_resource_policy
+from src.utilities.work_queue import run_work_queue
 
 
 @dataclass
@@ -75,29 +78,16 @@ async def scrape_jobs_on_page(page, payload: ScraperPayload, redis_client) -> Li
     Scrapes a single page using a provided `page` object (instead of launching a new browser).
     """
     try:
-        await page.goto(payload.url, {
-            'waitUntil': 'networkidle0',
-            'timeout': 90000
-        })
+        async with get_rate_limiter().request(payload.url) as slot:
+            response = await goto_ready(page, payload.url, [payload.job_list_selector])
+            if response:
+                slot.observe(response.status, response.headers)
         await page.waitForSelector(payload.job_list_selector)
 
-        jobs = []
-        job_list_elements = await page.querySelectorAll(payload.job_list_selector)
-
-        for job_el in job_list_elements:
-            # Only print outerHTML if absolutely needed, otherwise comment this out
-            # print(await page.evaluate('(el) => el.outerHTML', job_el))
-
-            try:
-                title = await get_inner_text(job_el, payload.title_selector, page)
-                link = await get_link_href(job_el, payload.link_selector, page)
-
-                if title or link:
-                    jobs.append({"title": title, "link": link})
-                    redis_client.append_to_list("jobs", link)
-
-            except Exception as e:
-                print(f"Error extracting job element: {e}")
+        jobs = await extract_listing_rows(page, payload)
+        with redis_client.buffered_writer() as writer:
+            for job in jobs:
+                writer.add_to_frontier("jobs", job["link"])
 
         return jobs
 
@@ -106,40 +96,15 @@ async def scrape_jobs_on_page(page, payload: ScraperPayload, redis_client) -> Li
         return []
 
 
-async def scrape_batch(payloads: List[ScraperPayload]) -> None:
+async def scrape_listing(payload: ScraperPayload, pool: BrowserPool, redis_client) -> None:
     """
-    Scrape a batch of payloads using a single browser instance.
+    Scrape one listing page in a new page borrowed from the browser pool.
     """
-    redis_client = Redis()
-    browser = None
-    try:
-        browser = await launch(
-            headless=True,
-            args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
-        )
-
-        # Create a list of pages in parallel (or sequentially) to scrape each payload
-        results = []
-
-        for payload in payloads:
-            # Add a small random delay between page requests to reduce the risk of rate-limiting
-            await asyncio.sleep(random.uniform(1, 3))
-
-            page = await browser.newPage()
-            page.setDefaultNavigationTimeout(90000)
-
-            jobs = await scrape_jobs_on_page(page, payload, redis_client)
-            results.append((payload.url, jobs))
-
-            await page.close()
-
-        # (Optional) Print or log the aggregated results for the batch:
-        for url, jobs in results:
-            print(f"Scraped {len(jobs)} jobs from {url}")
-
-    finally:
-        if browser:
-            await browser.close()
+    async with pool.page() as page:
+        page.setDefaultNavigationTimeout(90000)
+        await apply_resource_policy(page, url=payload.url)
+        jobs = await scrape_jobs_on_page(page, payload, redis_client)
+        print(f"Scraped {len(jobs)} jobs from {payload.url}")
 
 
 async def main():
@@ -163,20 +128,12 @@ async def main():
         for i in range(page_limit + 1)
     ]
 
-    # Batch size for concurrent scraping
-    batch_size = 10
-
-    for i in range(0, len(queue), batch_size):
-        batch = queue[i:i + batch_size]
-        print(f"Starting batch {i // batch_size + 1} with {len(batch)} tasks...")
-
-        # Scrape the entire batch (1 browser instance).
-        await scrape_batch(batch)
-
-        print(f"Batch {i // batch_size + 1} completed.")
-
-        # (Optional) Sleep between batches if you're concerned about rate limits
-        await asyncio.sleep(5)  # Lowered from 30 for illustration
+    redis_client = Redis()
+    # 1 browser x 3 pages serve the 3 workers; the browser is recycled every 50 pages or 1.5 GB RSS
+    async with BrowserPool(size=1, pages_per_browser=3, max_navigations=50, max_rss_mb=1536) as pool:
+        stats = await run_work_queue(queue, lambda payload: scrape_listing(payload, pool, redis_client),
+                                     workers=3, per_host=3)
+        print(f"Listing pages processed: {stats}")
 
 
 if __name__ == "__main__":
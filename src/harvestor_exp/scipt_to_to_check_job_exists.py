@@ -1,30 +1,126 @@
+import asyncio
+import os
+import time
+from datetime import date, timedelta
+from typing import AsyncIterator, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
 
+import aiohttp
 
-import requests
-from src.Database.database import Database
-import time
-db = Database()
-
-# todo, check it last checked date is more than 1 week
-# check if job is still available
-query = "SELECT url FROM job_details where end_date is null"
-result = db.execute_query(query)
-
-for item in result[:10]:
-    # sleep for a while
-    time.sleep(1)
-    url = item[0]
-    try:
-        response = requests.head(url, timeout=10)
-
-        if response.status_code == 200:
-
-            print(url, " is active.")
-            # todo: add last checked date
-        else:
-            # update the status of the job
-            query = "UPDATE job_details SET end_date = %s WHERE url = %s"
-            params = (time.strftime('%Y-%m-%d'), url)
-            db.insert_query(query, params)
-    except requests.exceptions.RequestException as e:
-        print(f"{url} Error checking URL: {e}")
+from src.Database.database import Database, JobStatusWriter
+from src.utilities.http_client import HTTP_STATS, create_session
+from src.utilities.rate_limiter import AIMDPolicy, AdaptiveRateLimiter, THROTTLE_STATUSES
+from src.utilities.response_cache import get_response_cache
+from src.utilities.work_queue import WorkQueue
+
+# Only jobs not checked for this long are checked again
+STALE_AFTER = timedelta(days=float(os.getenv("CHECK_STALE_AFTER_DAYS", 7)))
+
+# Checks in flight overall and per host. HEADs are cheap for the server, so
+# the per host rate may climb far above the scrapers' (see CHECK_MAX_RATE).
+CHECK_WORKERS = int(os.getenv("CHECK_WORKERS", 50))
+CHECK_PER_HOST = int(os.getenv("CHECK_PER_HOST", 20))
+CHECK_MAX_RATE = float(os.getenv("CHECK_MAX_RATE", 100))
+
+# Servers that do not implement HEAD answer with these; ask again with GET
+HEAD_NOT_ALLOWED = {405, 501}
+
+# Redirects are not followed: an expired posting is typically sent on to the
+# search or listing page, which answers 200
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+limiter = AdaptiveRateLimiter(AIMDPolicy(initial_rate=5, max_rate=CHECK_MAX_RATE, increase=1, burst=CHECK_PER_HOST))
+
+
+def leaves_posting(url: str, location: str) -> bool:
+    """
+    True when a redirect from `url` to `location` goes to another page (say
+    the search page), False when it only changes the scheme, a leading www.
+    or a trailing slash of the posting's own address.
+    """
+    source, target = urlsplit(url), urlsplit(urljoin(url, location))
+    return (source.hostname or '').removeprefix('www.') != (target.hostname or '').removeprefix('www.') \
+        or source.path.rstrip('/') != target.path.rstrip('/')
+
+
+def is_ended(status: int, url: Optional[str] = None, location: Optional[str] = None) -> Optional[bool]:
+    """
+    False when the posting is still up, True when it is gone, None when the
+    answer says nothing (throttled, server error, a redirect that stays on
+    the posting) and it should be checked again next run. A redirect is
+    judged by its `location`: one off the posting `url` means it ended.
+    """
+    if status in REDIRECT_STATUSES:
+        return True if location and url and leaves_posting(url, location) else None
+    if status < 400:
+        return False
+    if status in THROTTLE_STATUSES or status >= 500 or status == 408:
+        return None
+    return True
+
+
+async def request_status(session: aiohttp.ClientSession, method: str, url: str, headers: dict) -> Tuple[int, str]:
+    """The status of the response and, for a redirect, where it points."""
+    async with limiter.request(url) as slot:
+        async with session.request(method, url, headers=headers, allow_redirects=False) as response:
+            slot.observe(response.status, response.headers)
+            return response.status, response.headers.get('Location', '')
+
+
+async def check_job(session: aiohttp.ClientSession, writer: JobStatusWriter, url: str) -> None:
+    """
+    HEAD the posting, conditional on the validators the detail scrapers
+    cached (falling back to GET when HEAD is not allowed), and queue the
+    result. A redirect to the posting's own address (https, trailing slash)
+    is followed once; any other redirect means the posting is gone.
+
+    The response cache is only read here: validators stored without the
+    body's hash would make the next detail fetch answer 304 for a page
+    that changed, and its row would never be refreshed.
+    """
+    headers = get_response_cache().conditional_headers(url)
+    method = 'HEAD'
+    status, location = await request_status(session, method, url, headers)
+    if status in HEAD_NOT_ALLOWED:
+        method = 'GET'
+        status, location = await request_status(session, method, url, headers)
+    if status in REDIRECT_STATUSES and location and not leaves_posting(url, location):
+        status, location = await request_status(session, method, urljoin(url, location), headers)
+
+    ended = is_ended(status, url, location)
+    if ended is None:
+        print(f"{url} answered {status}, checking again next run")
+    elif ended:
+        print(f"{url} is gone ({status}).")
+        writer.add(url, end_date=date.today())
+    else:
+        writer.add(url)
+
+
+async def stale_urls(db: Database) -> AsyncIterator[str]:
+    """Stream the urls due for a check, fetching each batch off the event loop."""
+    batches = db.iter_urls_to_check(STALE_AFTER)
+    while True:
+        batch = await asyncio.to_thread(next, batches, None)
+        if batch is None:
+            return
+        for url in batch:
+            yield url
+
+
+async def main():
+    # needs job_details.last_checked: python -m src.Database.database migrate
+    db = Database()
+    start = time.monotonic()
+    async with create_session(limit=CHECK_WORKERS, limit_per_host=CHECK_PER_HOST) as session:
+        with JobStatusWriter(db) as writer:
+            queue = WorkQueue(lambda url: check_job(session, writer, url),
+                              workers=CHECK_WORKERS, per_host=CHECK_PER_HOST)
+            stats = await queue.run(stale_urls(db))
+    elapsed = time.monotonic() - start
+    print(f"Checked {stats.get('done', 0)} jobs ({stats.get('failed', 0)} failed) in {elapsed:.1f}s")
+    print(f"Connections: {HTTP_STATS.as_dict()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
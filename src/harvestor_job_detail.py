@@ -1,9 +1,14 @@
 import asyncio
-import random
 from pyppeteer import launch
 from dataclasses import dataclass
 from typing import Optional
 
+from src.utilities.page_ready import goto_ready
+from src.utilities.rate_limiter import get_rate_limiter
+from src.utilities.resource_policy import apply_resource_policy
+from src.utilities.timing import PhaseTimer
+from src.utilities.work_queue import run_work_queue
+
 
 @dataclass
 class ScraperPayload:
@@ -28,62 +33,66 @@ class ScraperPayload:
 
 
 
-async def scrape_job_details(payload: ScraperPayload) -> ScraperPayload:
+DETAIL_FIELDS = ("job_id", "title", "location", "department", "summary", "long_description", "date")
+OPTIONAL_FIELDS = ("summary", "long_description", "date")
+# fields whose selectors must be on the page before it is scraped
+READY_FIELDS = ("job_id", "title", "long_description")
+
+# launch, navigate (with its ready / load breakdown), extract.<field> and db_write times of this run
+timer = PhaseTimer("pyppeteer-per-job")
+
+
+async def scrape_job_details(payload: ScraperPayload, writer) -> bool:
     """
     Navigates to a single job details page and extracts details.
-    Updates the payload with the scraped information.
+    Updates the payload with the scraped information and queues the row on the DB writer.
+    Returns False when the page failed or had no job id (no row queued then).
     """
     browser = None
     try:
-        # Add random delay for rate limiting
-        await asyncio.sleep(random.uniform(1, 3))
-
-        browser = await launch(
-            headless=True,
-            args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
-        )
+        with timer.span("launch"):
+            browser = await launch(
+                headless=True,
+                args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
+            )
         page = await browser.newPage()
 
         # Set longer default timeout
         page.setDefaultNavigationTimeout(90000)
 
-        # Navigate to the job detail page
-        await page.goto(payload.url, {
-            'waitUntil': 'networkidle0',
-            'timeout': 90000
-        })
-
-        job_id = await get_inner_text(page, payload.job_id)
-        title = await get_inner_text(page, payload.title)
-        location = await get_inner_text(page, payload.location)
-        department = await get_inner_text(page, payload.department)
-        summary = await get_inner_text(page, payload.summary) if payload.summary else None
-        long_description = await get_inner_text(page, payload.long_description) if payload.long_description else None
-        date = await get_inner_text(page, payload.date) if payload.date else None
-
-
-        from src.Database.database import Database
-
-        db = Database()
-        #  """
-        # CREATE TABLE IF NOT EXISTS job_details(
-        #     job_id VARCHAR(255) PRIMARY KEY,
-        #     title VARCHAR(255),
-        #     location VARCHAR(255),
-        #     department VARCHAR(255),
-        #     summary TEXT,
-        #     long_description TEXT,
-        #     date DATE
-        # );
-        # """
-
-        # write an insert query
-        query = """
-        INSERT INTO job_details(job_id, title, location, department, summary, long_description, date)
-        VALUES(%s, %s, %s, %s, %s, %s, %s)
-        """
-        params = (str(job_id), str(title), str(location), str(department), str(summary), str(long_description), str(date))
-        db.insert_query(query, params)
+        # Skip the images, fonts, styles and trackers the site's resource policy blocks
+        await apply_resource_policy(page, url=payload.url)
+
+        # Navigate to the job detail page until its fields are there, paced per host
+        async with get_rate_limiter().request(payload.url) as slot:
+            with timer.navigation(page):
+                response = await goto_ready(page, payload.url, [getattr(payload, f) for f in READY_FIELDS], timer)
+            if response:
+                slot.observe(response.status, response.headers)
+
+        # Extract info, timing each field (the last three are optional)
+        fields = {}
+        for field in DETAIL_FIELDS:
+            selector = getattr(payload, field)
+            if not selector and field in OPTIONAL_FIELDS:
+                fields[field] = None
+                continue
+            with timer.span(f"extract.{field}"):
+                fields[field] = await get_inner_text(page, selector)
+        job_id = fields["job_id"]
+        title = fields["title"]
+        location = fields["location"]
+        department = fields["department"]
+        summary = fields["summary"]
+        long_description = fields["long_description"]
+        date = fields["date"]
+
+        if not job_id:
+            print(f"[SKIP] No job_id for {payload.url}")
+            return False
+
+        # queue for the next batched upsert
+        writer.add(job_id, title, location, department, summary, long_description, date, url=payload.url)
 
 
         # Update the payload with the scraped details
@@ -95,11 +104,11 @@ async def scrape_job_details(payload: ScraperPayload) -> ScraperPayload:
         payload.long_description = long_description
         payload.date = date
 
-        return payload
+        return True
 
     except Exception as e:
         print(f"Error scraping job details from {payload.url}: {e}")
-        return payload
+        return False
     finally:
         if browser:
             await browser.close()
@@ -120,11 +129,12 @@ async def get_inner_text(page, selector: str) -> str:
     return ""
 
 
-async def worker(payload: ScraperPayload):
-    """Worker to scrape a single job details page."""
+async def worker(payload: ScraperPayload, writer) -> bool:
+    """Worker to scrape a single job details page. Returns whether it succeeded."""
     print(f"Processing: {payload.url}")
     try:
-        updated_payload = await scrape_job_details(payload)
+        with timer.span("job"):
+            return await scrape_job_details(payload, writer)
 
         # from src.cache.Redis import Redis
         #
@@ -146,6 +156,7 @@ async def worker(payload: ScraperPayload):
 
     except Exception as e:
         print(f"Failed to scrape {payload.url}: {e}")
+        return False
 
 
 async def main():
@@ -160,21 +171,32 @@ async def main():
     }
 
     from src.cache.Redis import Redis
+    from src.Database.database import Database, JobDetailsWriter
     cache = Redis()
-    queue = cache.get_list('jobs')
-    jobs = []
-    for item in queue[:1]:
-        job = ScraperPayload(url=item, **config)
-        jobs.append(job)
-
-    batch_limit = 10
-    for i in range(0, len(jobs), batch_limit):
-        batch = jobs[i:i + batch_limit]
-        await asyncio.gather(*[worker(job) for job in batch])
-        # sleep for a while
-        await asyncio.sleep(180)
-
-
+    frontier = cache.frontier('jobs')
+    frontier.add_from_list('jobs')
+
+    # A url is acked once its row is committed, so a crash before the flush
+    # leaves it claimed for requeue_unacked; rows the DB refused are retried
+    def stored(rows, rejected):
+        frontier.ack(*(row[-1] for row in rows))
+        frontier.fail(*(row[-1] for row in rejected))
+
+    writer = JobDetailsWriter(Database(), on_commit=stored, timer=timer)
+
+    async def handle(job):
+        if not await worker(job, writer):
+            # back to pending for another try, dead-lettered after a few
+            frontier.fail(job.url)
+
+    # URLs are claimed a page at a time, only as fast as the workers free up.
+    # Each job launches its own browser, so keep a handful of workers;
+    # navigations are paced per host by the rate limiter
+    jobs = (ScraperPayload(url=item, **config) for urls in frontier.iter_claims(10) for item in urls)
+    stats = await run_work_queue(jobs, handle, workers=5, per_host=5)
+    writer.close()
+    timer.write_summary()
+    print(f"Job details processed: {stats}")
 
 
 if __name__ == "__main__":
@@ -1,10 +1,11 @@
 import asyncio
-import random
-import time
 from pyppeteer import launch
 from dataclasses import dataclass
 from typing import Optional
 
+from src.utilities.rate_limiter import get_rate_limiter
+from src.utilities.timing import PhaseTimer
+
 @dataclass
 class ScraperPayload:
     url: str
@@ -16,6 +17,13 @@ class ScraperPayload:
     long_description: Optional[str]
     date: Optional[str]
 
+DETAIL_FIELDS = ("job_id", "title", "location", "department", "summary", "long_description", "date")
+OPTIONAL_FIELDS = ("summary", "long_description", "date")
+
+# launch, navigate (with its networkidle breakdown) and extract.<field> times of this run (nothing is written)
+timer = PhaseTimer("pyppeteer-per-job")
+
+
 async def scrape_job_details(payload: ScraperPayload) -> ScraperPayload:
     """
     Navigates to a single job details page and extracts details.
@@ -23,34 +31,42 @@ async def scrape_job_details(payload: ScraperPayload) -> ScraperPayload:
     """
     browser = None
     try:
-        # Start profiling
-        start_time = time.time()
-
-        # Add random delay for rate limiting
-        await asyncio.sleep(random.uniform(1, 3))
-
-        browser = await launch(
-            headless=True,
-            args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
-        )
+        with timer.span("launch"):
+            browser = await launch(
+                headless=True,
+                args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
+            )
         page = await browser.newPage()
 
         # Set longer default timeout
         page.setDefaultNavigationTimeout(90000)
 
-        # Navigate to the job detail page
-        await page.goto(payload.url, {
-            'waitUntil': 'networkidle0',
-            'timeout': 90000
-        })
-
-        job_id = await get_inner_text(page, payload.job_id)
-        title = await get_inner_text(page, payload.title)
-        location = await get_inner_text(page, payload.location)
-        department = await get_inner_text(page, payload.department)
-        summary = await get_inner_text(page, payload.summary) if payload.summary else None
-        long_description = await get_inner_text(page, payload.long_description) if payload.long_description else None
-        date = await get_inner_text(page, payload.date) if payload.date else None
+        # Navigate to the job detail page, paced per host
+        async with get_rate_limiter().request(payload.url) as slot:
+            with timer.navigation(page):
+                response = await page.goto(payload.url, {
+                    'waitUntil': 'networkidle0',
+                    'timeout': 90000
+                })
+            if response:
+                slot.observe(response.status, response.headers)
+
+        # Extract info, timing each field (the last three are optional)
+        fields = {}
+        for field in DETAIL_FIELDS:
+            selector = getattr(payload, field)
+            if not selector and field in OPTIONAL_FIELDS:
+                fields[field] = None
+                continue
+            with timer.span(f"extract.{field}"):
+                fields[field] = await get_inner_text(page, selector)
+        job_id = fields["job_id"]
+        title = fields["title"]
+        location = fields["location"]
+        department = fields["department"]
+        summary = fields["summary"]
+        long_description = fields["long_description"]
+        date = fields["date"]
 
         # Update the payload with the scraped details
         payload.job_id = job_id
@@ -61,10 +77,6 @@ async def scrape_job_details(payload: ScraperPayload) -> ScraperPayload:
         payload.long_description = long_description
         payload.date = date
 
-        # End profiling
-        end_time = time.time()
-        print(f"Task completed in {end_time - start_time:.2f} seconds")
-
         return payload
 
     except Exception as e:
@@ -92,7 +104,8 @@ async def worker(payload: ScraperPayload):
     """Worker to scrape a single job details page."""
     print(f"Processing: {payload.url}")
     try:
-        updated_payload = await scrape_job_details(payload)
+        with timer.span("job"):
+            updated_payload = await scrape_job_details(payload)
         print(f"Updated Payload:\n{updated_payload}")
     except Exception as e:
         print(f"Failed to scrape {payload.url}: {e}")
@@ -109,15 +122,13 @@ async def main():
         date="#jobPostDate"
     )
 
-    # Start profiling for main task
-    start_time = time.time()
-
     # Run the worker for the single job
     await worker(payload)
 
-    # End profiling for main task
-    end_time = time.time()
-    print(f"Main task completed in {end_time - start_time:.2f} seconds")
+    # Per phase timings (launch, navigate and its breakdown, extract.<field>)
+    for phase, stats in timer.summary()['phases'].items():
+        print(f"{phase:<30} {stats['p50']:.3f}s")
+    timer.write_summary()
 
 if __name__ == "__main__":
     asyncio.run(main())
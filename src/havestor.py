@@ -1,11 +1,15 @@
 import asyncio
-import random
-from pyppeteer import launch
 from dataclasses import dataclass
 from typing import List, Dict, Optional
 
 
 from src.cache.Redis import Redis
+from src.utilities.browser_pool import BrowserPool
+from src.utilities.listing_extractor import extract_listing_rows
+from src.utilities.page_ready import goto_ready
+from src.utilities.rate_limiter import get_rate_limiter
+from src.utilities.resource_policy import apply_resource_policy
+from src.utilities.work_queue import run_work_queue
 
 
 
@@ -18,62 +22,39 @@ class ScraperPayload:
     date_selector: Optional[str] = None
 
 
-async def scrape_jobs(payload: ScraperPayload) -> List[Dict[str, str]]:
+async def scrape_jobs(payload: ScraperPayload, pool: BrowserPool) -> List[Dict[str, str]]:
+    """Scrapes jobs based on the given payload using a page borrowed from the browser pool."""
     r = Redis()
-    """Scrapes jobs based on the given payload without using JavaScript code in page.evaluate."""
-    browser = None
     try:
-        # Add random delay for rate limiting
-        await asyncio.sleep(random.uniform(1, 3))
-
-        browser = await launch(
-            headless=True,
-            args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
-        )
-        page = await browser.newPage()
-
-        # Set longer default timeout
-        page.setDefaultNavigationTimeout(90000)
-
-        # Go to the page and wait until network is idle
-        await page.goto(payload.url, {
-            'waitUntil': 'networkidle0',
-            'timeout': 90000
-        })
-
-        # Wait for the container that holds the job listings
-        await page.waitForSelector(payload.job_list_selector)
-
-        # Scrape jobs
-        jobs = []
-        job_list_elements = await page.querySelectorAll(payload.job_list_selector)
-        for job_el in job_list_elements:
-            # print html of each job element
-            print(await page.evaluate('(el) => el.outerHTML', job_el))
-            try:
-                title = await get_inner_text(job_el, payload.title_selector, page)
-                link = await get_link_href(job_el, payload.link_selector, page)
-
-                # Append scraped job to the list
-                if title or link:
-                    jobs.append({
-                        "title": title,
-                        "link": link
-                    })
-
-                    # todo : package links that are diverse and append to redis
-                    # append job to redis list
-                    r.append_to_list('jobs', link)
-            except Exception as e:
-                print(f"Error extracting job element: {e}")
-
-        return jobs
+        async with pool.page() as page:
+            # Set longer default timeout
+            page.setDefaultNavigationTimeout(90000)
+
+            # Skip the images, fonts, styles and trackers the site's resource policy blocks
+            await apply_resource_policy(page, url=payload.url)
+
+            # Go to the page and wait until the listings are there, paced per host
+            async with get_rate_limiter().request(payload.url) as slot:
+                response = await goto_ready(page, payload.url, [payload.job_list_selector])
+                if response:
+                    slot.observe(response.status, response.headers)
+
+            # Wait for the container that holds the job listings
+            await page.waitForSelector(payload.job_list_selector)
+
+            # Scrape every row in a single evaluate call
+            jobs = await extract_listing_rows(page, payload)
+
+            # todo : package links that are diverse and append to redis
+            # add job to the redis frontier, one pipelined round-trip per page
+            with r.buffered_writer() as writer:
+                for job in jobs:
+                    writer.add_to_frontier('jobs', job["link"])
+
+            return jobs
     except Exception as e:
         print(f"Error scraping {payload.url}: {str(e)}")
         return []
-    finally:
-        if browser:
-            await browser.close()
 
 
 async def get_inner_text(parent_element, selector: str, page) -> str:
@@ -108,15 +89,13 @@ async def get_link_href(parent_element, selector: str, page) -> str:
     return ""
 
 
-async def worker(queue: ScraperPayload):
+async def worker(queue: ScraperPayload, pool: BrowserPool):
     """Worker to process the scraping jobs."""
-    while queue:
-
-        try:
-            jobs = await scrape_jobs(queue)
-            print(f"Jobs scraped from {queue.url}:\n", jobs)
-        except Exception as e:
-            print(f"Failed to scrape {queue.url}: {e}")
+    try:
+        jobs = await scrape_jobs(queue, pool)
+        print(f"Jobs scraped from {queue.url}:\n", jobs)
+    except Exception as e:
+        print(f"Failed to scrape {queue.url}: {e}")
 
 
 async def main():
@@ -141,18 +120,12 @@ async def main():
         ) for i in range(page_limit + 1)
     ]
 
-    # Batch size for concurrent workers
-    batch_size = 10
-
-    # Process payloads in batches
-    for i in range(0, len(queue), batch_size):
-        batch = queue[i:i + batch_size]
-        print(f"Starting batch {i // batch_size + 1} with {len(batch)} tasks...")
-        await asyncio.gather(*(worker(payload) for payload in batch))
-        print(f"Batch {i // batch_size + 1} completed.")
-        # sleep for a while
-        await asyncio.sleep(30)
-
+    # 2 browsers x 5 pages serve the 10 workers; browsers are recycled every 50 pages or 1.5 GB RSS
+    async with BrowserPool(size=2, pages_per_browser=5, max_navigations=50, max_rss_mb=1536) as pool:
+        # Workers pick up the next page as soon as they are free; the rate
+        # limiter paces the navigations per host
+        stats = await run_work_queue(queue, lambda payload: worker(payload, pool), workers=10, per_host=10)
+        print(f"Listing pages processed: {stats}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from pyppeteer import launch
+
+from src.utilities.timing import PhaseTimer
+
+try:
+    import psutil
+except ImportError:  # RSS based recycling is skipped without psutil
+    psutil = None
+
+
+LAUNCH_ARGS = ['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
+
+
+class PooledBrowser:
+    """
+    A launched Chromium instance plus the bookkeeping the pool needs to decide
+    when it has to be recycled.
+    """
+
+    def __init__(self, browser):
+        self.browser = browser
+        self.navigations: int = 0
+        self.in_use: int = 0
+        self.retired: bool = False
+
+    def is_alive(self) -> bool:
+        process = self.browser.process
+        return process is None or process.poll() is None
+
+    def rss_mb(self) -> float:
+        """
+        Resident memory of the browser process and all of its renderers in MB.
+        Returns 0 when psutil is not installed.
+        """
+        process = self.browser.process
+        if psutil is None or process is None:
+            return 0.0
+        try:
+            root = psutil.Process(process.pid)
+            rss = root.memory_info().rss
+            for child in root.children(recursive=True):
+                rss += child.memory_info().rss
+        except psutil.Error:
+            return 0.0
+        return rss / (1024 * 1024)
+
+
+class BrowserPool:
+    """
+    Long-lived pool of `size` browsers with `pages_per_browser` concurrent pages each.
+
+    A browser is recycled (closed and relaunched) once it has served
+    `max_navigations` pages, exceeds `max_rss_mb` of resident memory, or its
+    process died. Callers borrow a fresh page with `async with pool.page() as page`.
+    With a `timer`, every (re)launch is recorded as its `launch` phase.
+    """
+
+    def __init__(self, size: int = 2, pages_per_browser: int = 5, max_navigations: int = 100,
+                 max_rss_mb: Optional[float] = None, launch_args: Optional[List[str]] = None,
+                 timer: Optional[PhaseTimer] = None):
+        self.size = size
+        self.pages_per_browser = pages_per_browser
+        self.max_navigations = max_navigations
+        self.max_rss_mb = max_rss_mb
+        self.launch_args = launch_args or LAUNCH_ARGS
+        self.timer = timer
+
+        self._browsers: List[Optional[PooledBrowser]] = [None] * size
+        self._conditions: List[asyncio.Condition] = []
+        self._slots: Optional[asyncio.Queue] = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def start(self):
+        self._slots = asyncio.Queue()
+        self._conditions = [asyncio.Condition() for _ in range(self.size)]
+        for index in range(self.size):
+            self._browsers[index] = await self._launch()
+            for _ in range(self.pages_per_browser):
+                self._slots.put_nowait(index)
+
+    async def close(self):
+        for index, pooled in enumerate(self._browsers):
+            if pooled:
+                await self._close_browser(pooled)
+            self._browsers[index] = None
+
+    @asynccontextmanager
+    async def page(self):
+        """
+        Borrow a new page from the least recently used slot. The page is closed
+        and the slot handed back when the block exits.
+        """
+        index = await self._slots.get()
+        try:
+            pooled = await self._checkout(index)
+            page = None
+            try:
+                page = await pooled.browser.newPage()
+                yield page
+            finally:
+                if page:
+                    try:
+                        await page.close()
+                    except Exception:
+                        pass  # Page may already be closed
+                await self._checkin(index, pooled)
+        finally:
+            self._slots.put_nowait(index)
+
+    async def _launch(self) -> PooledBrowser:
+        start = time.perf_counter()
+        browser = await launch(headless=True, args=self.launch_args)
+        if self.timer:
+            self.timer.record('launch', time.perf_counter() - start)
+        return PooledBrowser(browser)
+
+    async def _close_browser(self, pooled: PooledBrowser):
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            print(f"Failed to close browser: {e}")
+
+    def _needs_recycle(self, pooled: PooledBrowser) -> bool:
+        if pooled.retired or not pooled.is_alive():
+            return True
+        if pooled.navigations >= self.max_navigations:
+            return True
+        return bool(self.max_rss_mb) and pooled.rss_mb() >= self.max_rss_mb
+
+    async def _checkout(self, index: int) -> PooledBrowser:
+        condition = self._conditions[index]
+        async with condition:
+            pooled = self._browsers[index]
+            if self._needs_recycle(pooled):
+                pooled.retired = True
+                # let pages still open on the old browser finish first
+                await condition.wait_for(lambda: pooled.in_use == 0)
+                if self._browsers[index] is pooled:
+                    print(f"Recycling browser {index} after {pooled.navigations} navigations")
+                    await self._close_browser(pooled)
+                    self._browsers[index] = await self._launch()
+                pooled = self._browsers[index]
+            pooled.in_use += 1
+            pooled.navigations += 1
+            return pooled
+
+    async def _checkin(self, index: int, pooled: PooledBrowser):
+        condition = self._conditions[index]
+        async with condition:
+            pooled.in_use -= 1
+            condition.notify_all()
@@ -0,0 +1,157 @@
+import re
+from functools import lru_cache
+from typing import Dict, Mapping, Sequence, Tuple, Union
+
+import soupsieve
+from bs4 import BeautifulSoup, Tag
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # the selectolax backend is unavailable without it
+    LexborHTMLParser = None
+
+Selectors = Union[None, str, Sequence[str]]
+
+# 'lxml' needs lxml installed, 'selectolax' the lexbor based selectolax parser
+PARSERS = ('html.parser', 'lxml', 'selectolax')
+DEFAULT_PARSER = 'html.parser'
+# BeautifulSoup leaves the contents of these out of get_text()
+NON_TEXT_TAGS = ['script', 'style', 'template']
+
+_ID_SELECTOR = re.compile(r"^#(-?[A-Za-z_][\w-]*)$")
+_CLASS_SELECTOR = re.compile(r"^\.(-?[A-Za-z_][\w-]*)$")
+
+
+def _match_id(value: str):
+    return lambda tag: tag.get('id') == value
+
+
+def _match_class(value: str):
+    return lambda tag: value in tag.get_attribute_list('class')
+
+
+def parse_html(html: str, parser: str = DEFAULT_PARSER):
+    """
+    Parse `html` with one of PARSERS. The html.parser and lxml backends give a
+    BeautifulSoup tree, selectolax a LexborHTMLParser; ExtractionPlan.extract
+    accepts either.
+    """
+    if parser not in PARSERS:
+        raise ValueError(f"Unknown parser {parser!r}, expected one of {PARSERS}")
+    if parser != 'selectolax':
+        return BeautifulSoup(html, parser)
+    if LexborHTMLParser is None:
+        raise ValueError("The selectolax parser needs the selectolax package")
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(NON_TEXT_TAGS)
+    return tree
+
+
+@lru_cache(maxsize=None)
+def compile_selector(selector: str):
+    """
+    Compile a CSS selector into a `tag -> bool` matcher. Plain `#id` and
+    `.class` selectors are checked on the attributes directly; anything else
+    goes through a precompiled soupsieve pattern.
+    """
+    selector = selector.strip()
+    match = _ID_SELECTOR.match(selector)
+    if match:
+        return _match_id(match.group(1))
+    match = _CLASS_SELECTOR.match(selector)
+    if match:
+        return _match_class(match.group(1))
+    return soupsieve.compile(selector).match
+
+
+class ExtractionPlan:
+    """
+    Precompiled field selectors for one site.
+
+    `fields` maps a field name to a selector or to a list of fallback
+    selectors tried in order, e.g.
+        {"title": ".jd__header--title", "location": [".addressCountry", "#job-location-name"]}
+
+    `extract` walks the tree once and gives the same result as calling
+    `soup.select_one(selector).get_text(strip=True)` for every selector and
+    keeping the first non-empty text per field. Trees from the selectolax
+    backend are queried with its own C selector engine instead.
+    """
+
+    def __init__(self, fields: Mapping[str, Selectors]):
+        self.fields: Dict[str, Tuple[str, ...]] = {}
+        for name, selectors in fields.items():
+            if isinstance(selectors, str):
+                selectors = (selectors,)
+            self.fields[name] = tuple(selector for selector in selectors or () if selector)
+
+        # one matcher per distinct selector, shared by every field using it
+        self.selectors: Tuple[str, ...] = tuple(dict.fromkeys(
+            selector for selectors in self.fields.values() for selector in selectors
+        ))
+        self.matchers = [(selector, compile_selector(selector)) for selector in self.selectors]
+
+    def first_matches(self, soup: Tag) -> Dict[str, Tag]:
+        """ First element in document order for every selector that matches """
+        found = {}
+        pending = self.matchers
+        for element in soup.descendants:
+            if not isinstance(element, Tag):
+                continue
+            matched = [selector for selector, matcher in pending if matcher(element)]
+            if not matched:
+                continue
+            for selector in matched:
+                found[selector] = element
+            pending = [item for item in pending if item[0] not in found]
+            if not pending:
+                break
+        return found
+
+    def _lexbor_first_matches(self, tree) -> dict:
+        found = {}
+        for selector in self.selectors:
+            node = tree.css_first(selector)
+            if node is not None:
+                found[selector] = node
+        return found
+
+    def extract(self, document) -> Dict[str, str]:
+        """ Text of every field, '' when none of its selectors gives any """
+        if isinstance(document, Tag):
+            found = self.first_matches(document)
+            get_text = lambda element: element.get_text(strip=True)
+        else:
+            found = self._lexbor_first_matches(document)
+            get_text = lambda node: node.text(strip=True)
+
+        texts = {}
+        result = {}
+        for name, selectors in self.fields.items():
+            result[name] = ''
+            for selector in selectors:
+                if selector not in found:
+                    continue
+                if selector not in texts:
+                    texts[selector] = get_text(found[selector])
+                if texts[selector]:
+                    result[name] = texts[selector]
+                    break
+        return result
+
+    def extract_html(self, html: str, parser: str = DEFAULT_PARSER) -> Dict[str, str]:
+        return self.extract(parse_html(html, parser))
+
+
+@lru_cache(maxsize=128)
+def _cached_plan(fields: Tuple[Tuple[str, Tuple[str, ...]], ...]) -> ExtractionPlan:
+    return ExtractionPlan(dict(fields))
+
+
+def get_plan(fields: Mapping[str, Selectors]) -> ExtractionPlan:
+    """ The plan for a site config, compiled once and reused for every page """
+    key = tuple(
+        (name, (selectors,) if isinstance(selectors, str) else tuple(selectors or ()))
+        for name, selectors in fields.items()
+    )
+    return _cached_plan(key)
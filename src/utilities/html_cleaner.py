@@ -1,61 +1,117 @@
 from src.utilities.cleaner import Cleaner
-from bs4 import BeautifulSoup, Comment
+from bs4 import BeautifulSoup, Comment, NavigableString
+from bs4.element import PreformattedString
+
+
+UNWANTED_TAGS = ['script', 'fieldset', 'form', 'style', 'option', 'base', 'meta', 'svg', 'header', 'footer', 'nav', 'aside', 'noscript', 'input', 'title', 'button', 'li']
+ALLOWED_ATTRIBUTES = ['class', 'id']
+PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
 
 
 class HTMLCleaner(Cleaner):
     """
     Concrete implementation of the Cleaner abstract class for HTML content.
+
+    The document is parsed once and every step works on that tree. `clean`
+    serializes only at the end; the individual steps still return the HTML
+    string. Pass parser='lxml' for the faster lxml tree builder.
     """
 
-    def __init__(self, html_content: str):
+    def __init__(self, html_content: str, parser: str = 'html.parser'):
         self.html_content: str = html_content
-
-    def strip_unwanted_tags(self):
-        soup = BeautifulSoup(self.html_content, 'html.parser')
-
+        self.parser: str = parser
+        self._soup = None
+
+    @property
+    def soup(self):
+        if self._soup is None:
+            self._soup = BeautifulSoup(self.html_content, self.parser)
+        return self._soup
+
+    def _serialize(self) -> str:
+        self.html_content = str(self.soup)
+        return self.html_content
+
+    def _merge_strings(self):
+        """
+        Removing nodes leaves neighbouring strings behind. Merge them the way a
+        fresh parse would (whitespace-only runs become a single newline or
+        space), so the output matches re-parsing after every step.
+        """
+        for tag in [self.soup, *self.soup.find_all(True)]:
+            run = []
+            for child in [*tag.contents, None]:
+                if isinstance(child, NavigableString) and not isinstance(child, PreformattedString):
+                    run.append(child)
+                    continue
+                if len(run) > 1:
+                    text = ''.join(run)
+                    preserve = tag.name in PRESERVE_WHITESPACE_TAGS or tag.find_parent(PRESERVE_WHITESPACE_TAGS)
+                    if not preserve and all(char in BeautifulSoup.ASCII_SPACES for char in text):
+                        text = '\n' if '\n' in text else ' '
+                    run[0].replace_with(type(run[0])(text))
+                    for string in run[1:]:
+                        string.extract()
+                run = []
+
+    def _strip_unwanted_tags(self):
         # Remove unwanted tags and their content
-        for tag in soup(['script', 'fieldset', 'form', 'style', 'option', 'base', 'meta', 'svg', 'header', 'footer', 'nav', 'aside', 'noscript', 'input', 'title', 'button', 'li']):
+        for tag in self.soup(UNWANTED_TAGS):
             tag.decompose()
+        self._merge_strings()
 
-        self.html_content = str(soup)
-        return str(soup)
-
-
-    def remove_comments(self):
-        soup = BeautifulSoup(self.html_content, 'html.parser')
-
+    def _remove_comments(self):
         # Remove all comments
-        for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        for comment in self.soup.find_all(string=lambda text: isinstance(text, Comment)):
             comment.extract()
+        self._merge_strings()
 
-        self.html_content = str(soup)
-        return str(soup)
-
-    def retain_allowed_attributes(self):
-        soup = BeautifulSoup(self.html_content, 'html.parser')
-
+    def _retain_allowed_attributes(self) -> set:
         tags = set()
         # Retain only 'class' and 'id' attributes
-        for tag in soup.find_all(True):  # True matches all tags
-            # print(tag)
+        for tag in self.soup.find_all(True):  # True matches all tags
             tags.add(tag.name)
-            allowed_attributes = {
+            tag.attrs = {
                 key: value
                 for key, value in tag.attrs.items()
-                if key in ['class', 'id']
+                if key in ALLOWED_ATTRIBUTES
             }
-            tag.attrs = allowed_attributes
-        print("ALL UNIQUE TAGS: ", tags)
-        self.html_content = str(soup)
-        return str(soup)
+        return tags
 
+    def strip_unwanted_tags(self):
+        self._strip_unwanted_tags()
+        return self._serialize()
+
+    def remove_comments(self):
+        self._remove_comments()
+        return self._serialize()
+
+    def retain_allowed_attributes(self):
+        tags = self._retain_allowed_attributes()
+        print("ALL UNIQUE TAGS: ", tags)
+        return self._serialize()
 
     def return_only_body(self):
-        soup = BeautifulSoup(self.html_content, 'html.parser')
-        body = soup.find('body')
+        body = self.soup.find('body')
         # remove all attributes from the body tag
         body.attrs = {}
-        self.html_content: str = str(body)
-        return str(body)
-
-
+        self._soup = body
+        return self._serialize()
+
+    def clean(self, html_content: str = None):
+        """
+        Apply all cleaning steps on a single parsed tree and serialize once.
+
+        Args:
+            html_content (str): Optional HTML to clean instead of the one given to the constructor.
+
+        Returns:
+            str: Fully cleaned content.
+        """
+        if html_content is not None:
+            self.html_content = html_content
+            self._soup = None
+        self._strip_unwanted_tags()
+        self._remove_comments()
+        self._retain_allowed_attributes()
+        return self._serialize()
@@ -0,0 +1,151 @@
+import asyncio
+import os
+from typing import Dict, Optional
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+# Connector defaults, overridable per process through the environment
+HTTP_LIMIT = int(os.getenv("HTTP_LIMIT", 100))
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", 10))
+DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", 300))
+KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 30))
+REQUEST_TIMEOUT = float(os.getenv("HTTP_REQUEST_TIMEOUT", 60))
+
+
+class ConnectionStats:
+    """
+    Connection level counters of the aiohttp sessions created here, fed by
+    their TraceConfig. `reuse_ratio` is the share of requests that went out on
+    an already open keep-alive connection.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.queued = 0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+
+    @property
+    def reuse_ratio(self) -> float:
+        total = self.new_connections + self.reused_connections
+        return self.reused_connections / total if total else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            'requests': self.requests,
+            'new_connections': self.new_connections,
+            'reused_connections': self.reused_connections,
+            'queued_for_connection': self.queued,
+            'dns_cache_hits': self.dns_cache_hits,
+            'dns_cache_misses': self.dns_cache_misses,
+            'reuse_ratio': round(self.reuse_ratio, 3),
+        }
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        def counter(name):
+            async def increment(session, context, params):
+                setattr(self, name, getattr(self, name) + 1)
+            return increment
+
+        trace.on_request_start.append(counter('requests'))
+        trace.on_connection_create_end.append(counter('new_connections'))
+        trace.on_connection_reuseconn.append(counter('reused_connections'))
+        trace.on_connection_queued_start.append(counter('queued'))
+        trace.on_dns_cache_hit.append(counter('dns_cache_hits'))
+        trace.on_dns_cache_miss.append(counter('dns_cache_misses'))
+        return trace
+
+
+# counters of every aiohttp session of this process
+HTTP_STATS = ConnectionStats()
+
+
+def create_session(limit: int = HTTP_LIMIT, limit_per_host: int = HTTP_LIMIT_PER_HOST,
+                   ttl_dns_cache: int = DNS_CACHE_TTL, keepalive_timeout: float = KEEPALIVE_TIMEOUT,
+                   timeout: float = REQUEST_TIMEOUT, stats: ConnectionStats = HTTP_STATS,
+                   headers: Optional[dict] = None) -> aiohttp.ClientSession:
+    """
+    A ClientSession whose connector keeps connections alive between requests,
+    caps connections overall and per host, and caches DNS lookups.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        ttl_dns_cache=ttl_dns_cache,
+        keepalive_timeout=keepalive_timeout,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        trace_configs=[stats.trace_config()],
+        headers=headers,
+    )
+
+
+_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    The long-lived session of the running event loop, created on first use.
+    Close it with `close_session()` before the loop ends.
+    """
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = _sessions[loop] = create_session()
+    return session
+
+
+async def close_session():
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+def create_requests_session(pool_connections: int = 10, pool_maxsize: int = HTTP_LIMIT_PER_HOST) -> requests.Session:
+    """
+    A requests.Session keeping up to `pool_maxsize` keep-alive connections
+    for each of `pool_connections` hosts.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+_requests_sessions: Dict[int, requests.Session] = {}
+
+
+def get_requests_session() -> requests.Session:
+    """
+    The pooled requests.Session of this process. Sockets must not be shared
+    across a fork, so every (Celery prefork) process gets its own.
+    """
+    pid = os.getpid()
+    if pid not in _requests_sessions:
+        _requests_sessions[pid] = create_requests_session()
+    return _requests_sessions[pid]
+
+
+def requests_connection_stats(session: requests.Session) -> Dict[str, float]:
+    """Requests sent and connections opened by the urllib3 pools of a requests.Session."""
+    sent = opened = 0
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            sent += pool.num_requests
+            opened += pool.num_connections
+    return {
+        'requests': sent,
+        'new_connections': opened,
+        'reuse_ratio': round(1 - opened / sent, 3) if sent else 0.0,
+    }
@@ -0,0 +1,47 @@
+from typing import Dict, List
+
+# Runs inside the page: one CDP round-trip returns every row of the listing.
+EXTRACT_ROWS_JS = """
+(listSelector, titleSelector, linkSelector, dateSelector) => {
+    const text = (row, selector) => {
+        if (!selector) return '';
+        const el = row.querySelector(selector);
+        return el && el.innerText ? el.innerText.trim() : '';
+    };
+    const href = (row, selector) => {
+        if (!selector) return '';
+        const el = row.querySelector(selector);
+        return el && el.href ? el.href.trim() : '';
+    };
+    return Array.from(document.querySelectorAll(listSelector)).map(row => ({
+        title: text(row, titleSelector),
+        link: href(row, linkSelector),
+        date: text(row, dateSelector),
+    }));
+}
+"""
+
+
+async def extract_listing_rows(page, payload) -> List[Dict[str, str]]:
+    """
+    Extract title/link/date for every row matching `payload.job_list_selector`
+    with a single `page.evaluate` call instead of querySelector + evaluate per field.
+    Rows with neither a title nor a link are dropped; `date` is only kept when the
+    payload defines a `date_selector`.
+    """
+    rows = await page.evaluate(
+        EXTRACT_ROWS_JS,
+        payload.job_list_selector,
+        payload.title_selector,
+        payload.link_selector,
+        payload.date_selector or "",
+    )
+
+    jobs = []
+    for row in rows:
+        if not (row["title"] or row["link"]):
+            continue
+        if not payload.date_selector:
+            row.pop("date")
+        jobs.append(row)
+    return jobs
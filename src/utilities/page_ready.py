@@ -0,0 +1,123 @@
+import asyncio
+import os
+import time
+from typing import Iterable, List, Optional, Sequence, Union
+
+from src.utilities.timing import PhaseTimer
+
+# 'ready' returns once the page's fields are in the DOM, 'networkidle' waits
+# for the network to go quiet on every page as before
+NAVIGATION_WAIT = os.getenv("NAVIGATION_WAIT", "ready")
+NAVIGATION_TIMEOUT = float(os.getenv("NAVIGATION_TIMEOUT", 90))
+# how long the fields get to appear before falling back to networkidle
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", 15))
+# quiet period that counts as idle, as pyppeteer's networkidle0
+NETWORK_IDLE_SECONDS = 0.5
+
+# true once every selector group matches an element
+ALL_PRESENT = "groups => groups.every(group => document.querySelector(group) !== null)"
+
+Selector = Union[str, Sequence[str], None]
+
+
+def ready_selectors(selectors: Iterable[Selector]) -> List[str]:
+    """
+    One CSS selector group per field, skipping fields without a selector. A
+    field given as a list of fallback selectors becomes `a, b`, which is
+    there as soon as any of them is.
+    """
+    groups = []
+    for selector in selectors:
+        if selector and not isinstance(selector, str):
+            selector = ", ".join(s for s in selector if s)
+        if selector and selector not in groups:
+            groups.append(selector)
+    return groups
+
+
+class NetworkIdle:
+    """
+    Counts the requests a pyppeteer page has in flight, so networkidle can be
+    awaited after a `domcontentloaded` goto returned (playwright has
+    `wait_for_load_state('networkidle')` for that). Attach it before `goto`.
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self.in_flight = 0
+        self.changed = time.perf_counter()
+        self._handlers = {'request': self._started, 'requestfinished': self._ended, 'requestfailed': self._ended}
+        for event, handler in self._handlers.items():
+            page.on(event, handler)
+
+    def _started(self, request):
+        self.in_flight += 1
+        self.changed = time.perf_counter()
+
+    def _ended(self, request):
+        self.in_flight = max(0, self.in_flight - 1)
+        self.changed = time.perf_counter()
+
+    async def wait(self, timeout: float = NAVIGATION_TIMEOUT, idle: float = NETWORK_IDLE_SECONDS):
+        deadline = time.perf_counter() + timeout
+        while self.in_flight or time.perf_counter() - self.changed < idle:
+            if time.perf_counter() >= deadline:
+                raise asyncio.TimeoutError(f"Network not idle after {timeout}s ({self.in_flight} requests in flight)")
+            await asyncio.sleep(0.05)
+
+    def detach(self):
+        for event, handler in self._handlers.items():
+            try:
+                self.page.remove_listener(event, handler)
+            except Exception:
+                pass  # page already closed
+
+
+async def goto_ready(page, url: str, selectors: Iterable[Selector], timer: Optional[PhaseTimer] = None,
+                     wait: Optional[str] = None, timeout: float = NAVIGATION_TIMEOUT,
+                     ready_timeout: float = READY_TIMEOUT):
+    """
+    Navigate a pyppeteer or playwright page to `url` and return the response
+    once the elements of `selectors` (the site config's required fields) are
+    all there: the goto only waits for `domcontentloaded`, then the page is
+    polled for the selectors. Should they not show up within `ready_timeout`
+    seconds, e.g. because the site changed, the page gets until networkidle
+    instead, which is also what happens without selectors or with
+    wait='networkidle'. With a `timer`, the time to ready is recorded as
+    `navigate.ready` (failed when the fallback kicked in).
+    """
+    wait = wait or NAVIGATION_WAIT
+    groups = ready_selectors(selectors)
+    is_pyppeteer = hasattr(page, 'waitForFunction')
+
+    if wait != 'ready' or not groups:
+        if is_pyppeteer:
+            return await page.goto(url, {'waitUntil': 'networkidle0', 'timeout': timeout * 1000})
+        return await page.goto(url, wait_until='networkidle', timeout=timeout * 1000)
+
+    idle = NetworkIdle(page) if is_pyppeteer else None
+    try:
+        start = time.perf_counter()
+        if is_pyppeteer:
+            response = await page.goto(url, {'waitUntil': 'domcontentloaded', 'timeout': timeout * 1000})
+            ready = page.waitForFunction(ALL_PRESENT, {'timeout': ready_timeout * 1000, 'polling': 'mutation'}, groups)
+        else:
+            response = await page.goto(url, wait_until='domcontentloaded', timeout=timeout * 1000)
+            ready = page.wait_for_function(ALL_PRESENT, arg=groups, timeout=ready_timeout * 1000)
+        try:
+            await ready
+        except Exception:
+            # timed out (each library has its own TimeoutError): wait the old way
+            if timer:
+                timer.record('navigate.ready', time.perf_counter() - start, failed=True)
+            if is_pyppeteer:
+                await idle.wait(timeout)
+            else:
+                await page.wait_for_load_state('networkidle', timeout=timeout * 1000)
+        else:
+            if timer:
+                timer.record('navigate.ready', time.perf_counter() - start)
+        return response
+    finally:
+        if idle:
+            idle.detach()
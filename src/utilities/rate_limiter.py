@@ -0,0 +1,172 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+from src.utilities.work_queue import host_of
+
+# Responses that mean "slow down"; any other 5xx counts as well
+THROTTLE_STATUSES = {429, 503}
+
+
+@dataclass
+class AIMDPolicy:
+    """
+    Additive increase / multiplicative decrease of a host's request rate.
+
+    Every successful response adds `increase` requests/sec (up to `max_rate`).
+    A 429, a 5xx, a failed request or a response slower than `slow_factor`
+    times the host's average latency (and than `slow_after` seconds)
+    multiplies the rate by `decrease` (down to `min_rate`). A Retry-After
+    header also pauses the host.
+    """
+    initial_rate: float = 1.0
+    min_rate: float = 0.1
+    max_rate: float = 10.0
+    increase: float = 0.1
+    decrease: float = 0.5
+    burst: int = 1
+    slow_factor: float = 3.0
+    slow_after: float = 1.0
+    latency_alpha: float = 0.2
+
+
+def status_signal(status: Optional[int]) -> int:
+    """-1 to back off, 1 to speed up, 0 when the response says nothing about load."""
+    if status is None or status in THROTTLE_STATUSES or status >= 500:
+        return -1
+    if status < 400:
+        return 1
+    return 0
+
+
+def parse_retry_after(value: Optional[str]) -> float:
+    """Seconds to wait from a Retry-After header (delta seconds or HTTP date), 0 when absent."""
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class HostBucket:
+    """
+    Token bucket of one host whose rate follows the AIMD policy. Calls
+    reserve a start time, so concurrent callers are spaced out without a lock.
+    """
+
+    def __init__(self, policy: AIMDPolicy):
+        self.policy = policy
+        self.rate: float = policy.initial_rate
+        self.tokens: float = policy.burst
+        self.updated = time.monotonic()
+        self.paused_until: float = 0.0
+        self.latency: Optional[float] = None
+
+    def reserve(self) -> float:
+        """Take a token and return how many seconds to wait before using it."""
+        now = time.monotonic()
+        self.tokens = min(self.policy.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+    def record(self, status: Optional[int], latency: float, retry_after: float = 0.0) -> float:
+        """Adjust the rate after a response and return the new rate."""
+        policy = self.policy
+        signal = status_signal(status)
+        if (signal > 0 and self.latency is not None
+                and latency > max(policy.slow_after, policy.slow_factor * self.latency)):
+            signal = -1
+        if status is not None and latency > 0:
+            previous = latency if self.latency is None else self.latency
+            self.latency = previous + policy.latency_alpha * (latency - previous)
+
+        if signal < 0:
+            self.rate = max(policy.min_rate, self.rate * policy.decrease)
+        elif signal > 0:
+            self.rate = min(policy.max_rate, self.rate + policy.increase)
+        if retry_after > 0:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        return self.rate
+
+
+class RequestSlot:
+    """Handed out by `request()`; report the response through `observe`."""
+
+    def __init__(self):
+        self.status: Optional[int] = None
+        self.retry_after: float = 0.0
+
+    def observe(self, status: Optional[int], headers=None):
+        self.status = status
+        if headers:
+            self.retry_after = parse_retry_after(headers.get('Retry-After') or headers.get('retry-after'))
+
+
+class AdaptiveRateLimiter:
+    """
+    Per-host adaptive rate limiting for the coroutines of one process.
+
+    Usage:
+        async with limiter.request(url) as slot:
+            async with session.get(url) as response:
+                slot.observe(response.status, response.headers)
+                ...
+
+    The block starts once the host's bucket allows it. Its latency and the
+    observed status (or an exception before any status) adjust the host's rate.
+    """
+
+    def __init__(self, policy: Optional[AIMDPolicy] = None):
+        self.policy = policy or AIMDPolicy()
+        self.hosts: Dict[str, HostBucket] = {}
+
+    def _bucket(self, url: str) -> HostBucket:
+        host = host_of(url)
+        if host not in self.hosts:
+            self.hosts[host] = HostBucket(self.policy)
+        return self.hosts[host]
+
+    async def acquire(self, url: str):
+        wait = self._bucket(url).reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def record(self, url: str, status: Optional[int], latency: float, retry_after: float = 0.0) -> float:
+        return self._bucket(url).record(status, latency, retry_after)
+
+    def rate(self, url: str) -> float:
+        return self._bucket(url).rate
+
+    @asynccontextmanager
+    async def request(self, url: str):
+        await self.acquire(url)
+        slot = RequestSlot()
+        start = time.monotonic()
+        try:
+            yield slot
+        except Exception:
+            self.record(url, slot.status, time.monotonic() - start, slot.retry_after)
+            raise
+        if slot.status is not None:
+            self.record(url, slot.status, time.monotonic() - start, slot.retry_after)
+
+
+_limiter: Optional[AdaptiveRateLimiter] = None
+
+
+def get_rate_limiter() -> AdaptiveRateLimiter:
+    """The limiter shared by every coroutine of this process."""
+    global _limiter
+    if _limiter is None:
+        _limiter = AdaptiveRateLimiter()
+    return _limiter
@@ -0,0 +1,105 @@
+import asyncio
+import os
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from src.utilities.work_queue import host_of
+
+# BLOCK_RESOURCES=0 loads every page in full again (e.g. to debug a selector)
+BLOCK_RESOURCES = os.getenv("BLOCK_RESOURCES", "1") != "0"
+
+# resource types (the same names in pyppeteer and playwright) a scraper never reads
+BLOCKED_RESOURCE_TYPES = frozenset({'image', 'media', 'font', 'stylesheet'})
+
+# analytics, tag managers and ad beacons, matched as substrings of the request url
+TRACKER_PATTERNS = (
+    'google-analytics.com', 'googletagmanager.com', 'doubleclick.net', 'googlesyndication.com',
+    'facebook.net', 'connect.facebook.com', 'hotjar.com', 'segment.com', 'segment.io',
+    'nr-data.net', 'newrelic.com', 'omtrdc.net', 'demdex.net', 'adobedtm.com',
+    'scorecardresearch.com', 'bat.bing.com', 'snap.licdn.com', 'clarity.ms', 'optimizely.com',
+)
+
+
+@dataclass(frozen=True)
+class ResourcePolicy:
+    """
+    Which subresources a browser page may load. A request is aborted when its
+    resource type is in `blocked_types` or its url contains one of
+    `blocked_patterns`, unless it contains one of `allowed_patterns`. The
+    document itself and its scripts and XHRs load, so pages rendered client
+    side still work.
+
+    Note that innerText follows CSS: a site whose fields are hidden or
+    reordered by its stylesheets should keep 'stylesheet' out of
+    `blocked_types`.
+    """
+    blocked_types: FrozenSet[str] = BLOCKED_RESOURCE_TYPES
+    blocked_patterns: Tuple[str, ...] = TRACKER_PATTERNS
+    allowed_patterns: Tuple[str, ...] = ()
+
+    def blocks(self, resource_type: str, url: str) -> bool:
+        if any(pattern in url for pattern in self.allowed_patterns):
+            return False
+        return resource_type in self.blocked_types or any(pattern in url for pattern in self.blocked_patterns)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.blocked_types or self.blocked_patterns)
+
+
+DEFAULT_RESOURCE_POLICY = ResourcePolicy()
+LOAD_EVERYTHING = ResourcePolicy(blocked_types=frozenset(), blocked_patterns=())
+
+# per site policies, keyed by host; other hosts get DEFAULT_RESOURCE_POLICY
+SITE_RESOURCE_POLICIES: Dict[str, ResourcePolicy] = {
+    'jobs.apple.com': ResourcePolicy(
+        blocked_patterns=TRACKER_PATTERNS + ('/static/js/analytics/', 'metrics.apple.com'),
+    ),
+}
+
+
+def resource_policy_for(url: str) -> ResourcePolicy:
+    """The policy of the site `url` belongs to (LOAD_EVERYTHING with BLOCK_RESOURCES=0)."""
+    if not BLOCK_RESOURCES:
+        return LOAD_EVERYTHING
+    return SITE_RESOURCE_POLICIES.get(host_of(url), DEFAULT_RESOURCE_POLICY)
+
+
+async def apply_resource_policy(page, policy: Optional[ResourcePolicy] = None, url: Optional[str] = None) -> Counter:
+    """
+    Intercept the requests of a fresh pyppeteer or playwright page and abort
+    the ones `policy` (by default the policy of `url`'s site) blocks. Call it
+    before the first `goto`. Returns a Counter of 'allowed' and 'blocked'
+    requests that fills in as the page loads.
+    """
+    policy = policy or (resource_policy_for(url) if url else DEFAULT_RESOURCE_POLICY)
+    counts = Counter()
+    if not policy.enabled:
+        return counts
+
+    if hasattr(page, 'setRequestInterception'):
+        # pyppeteer: every request waits until it is continued or aborted
+        async def decide(request):
+            blocked = policy.blocks(request.resourceType, request.url)
+            counts['blocked' if blocked else 'allowed'] += 1
+            try:
+                await (request.abort() if blocked else request.continue_())
+            except Exception:
+                pass  # the page navigated away or closed meanwhile
+
+        await page.setRequestInterception(True)
+        page.on('request', lambda request: asyncio.ensure_future(decide(request)))
+    else:
+        # playwright
+        async def decide(route):
+            request = route.request
+            blocked = policy.blocks(request.resource_type, request.url)
+            counts['blocked' if blocked else 'allowed'] += 1
+            try:
+                await (route.abort() if blocked else route.continue_())
+            except Exception:
+                pass
+
+        await page.route('**/*', decide)
+    return counts
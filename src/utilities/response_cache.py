@@ -0,0 +1,182 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", os.path.join(".cache", "responses.sqlite3"))
+
+CREATE_RESPONSES_TABLE = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    checked_at REAL,
+    changed_at REAL
+)
+"""
+
+
+def content_hash(body: Union[str, bytes]) -> str:
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return hashlib.sha256(body).hexdigest()
+
+
+def _header(headers, name: str) -> Optional[str]:
+    if not headers:
+        return None
+    return headers.get(name) or headers.get(name.lower())
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_hash: Optional[str]
+    checked_at: float
+    changed_at: float
+
+
+class ResponseCache:
+    """
+    On-disk (sqlite) record of what every URL looked like when it was last
+    processed: its ETag, Last-Modified and a hash of the body. Bodies are not
+    stored.
+
+    Send `conditional_headers(url)` with the request; on a 304 call
+    `touch(url)`, otherwise skip the page when `is_unchanged(url, body)`.
+    Call `store(url, headers, body)` once the page has been processed, so a
+    page that failed half way is fetched in full again next time. When the
+    page's row is written in batches, "processed" means committed: hold the
+    validators in `PendingValidators` until then.
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # WAL lets several worker processes read while one writes
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(CREATE_RESPONSES_TABLE)
+        self.conn.commit()
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT url, etag, last_modified, content_hash, checked_at, changed_at FROM responses WHERE url = ?",
+                (url,),
+            ).fetchone()
+        return CacheEntry(*row) if row else None
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """If-None-Match / If-Modified-Since for the validators seen last time."""
+        entry = self.get(url)
+        headers = {}
+        if entry and entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry and entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def is_unchanged(self, url: str, body: Union[str, bytes]) -> bool:
+        """The server sent the full body, but it hashes the same as last time."""
+        entry = self.get(url)
+        return entry is not None and entry.content_hash == content_hash(body)
+
+    def touch(self, url: str):
+        """Record that the URL was checked and had not changed (e.g. a 304)."""
+        with self._lock:
+            self.conn.execute("UPDATE responses SET checked_at = ? WHERE url = ?", (time.time(), url))
+            self.conn.commit()
+
+    def store(self, url: str, headers=None, body: Union[str, bytes, None] = None, digest: Optional[str] = None):
+        """
+        Save the response's validators together with the hash of its body (or
+        the `digest` of it). The validators describe that body, so ones the
+        response does not carry are cleared rather than kept. A bodiless
+        (HEAD) response only counts as a check: its validators would answer
+        304 for a body that was never hashed.
+        """
+        now = time.time()
+        if body is not None:
+            digest = content_hash(body)
+        if digest is None:
+            self.touch(url)
+            return
+        with self._lock:
+            self.conn.execute(
+                """
+                INSERT INTO responses (url, etag, last_modified, content_hash, checked_at, changed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    changed_at = CASE
+                        WHEN excluded.content_hash IS NOT responses.content_hash
+                        THEN excluded.changed_at ELSE responses.changed_at END,
+                    content_hash = excluded.content_hash,
+                    checked_at = excluded.checked_at
+                """,
+                (url, _header(headers, 'ETag'), _header(headers, 'Last-Modified'), digest, now, now),
+            )
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class PendingValidators:
+    """
+    Validators (ETag, Last-Modified, body hash) of pages whose rows are
+    queued but not committed yet. `commit` saves them to the process's
+    cache once the rows are in the DB; a row that is lost or refused never
+    gets there, so its page is fetched and parsed in full again instead of
+    answering 304 for good. Only the small validators are held, not bodies.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending: Dict[str, Tuple[Dict[str, Optional[str]], str]] = {}
+
+    def add(self, url: str, headers, body: Union[str, bytes]):
+        validators = {name: _header(headers, name) for name in ('ETag', 'Last-Modified')}
+        with self.lock:
+            self.pending[url] = (validators, content_hash(body))
+
+    def commit(self, urls: Iterable[str]):
+        """Store the validators of the urls whose rows were committed."""
+        cache = get_response_cache()
+        for url in urls:
+            with self.lock:
+                entry = self.pending.pop(url, None)
+            if entry:
+                cache.store(url, entry[0], digest=entry[1])
+
+    def discard(self, urls: Iterable[str]):
+        """Forget the validators of rows the DB refused."""
+        with self.lock:
+            for url in urls:
+                self.pending.pop(url, None)
+
+
+_caches: Dict[int, ResponseCache] = {}
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    The cache of this process. sqlite connections must not cross a fork, so
+    every (Celery prefork) process opens its own.
+    """
+    pid = os.getpid()
+    if pid not in _caches:
+        _caches[pid] = ResponseCache()
+    return _caches[pid]
@@ -0,0 +1,239 @@
+import re
+from html.parser import HTMLParser
+from typing import Iterable, Iterator
+
+from bs4 import BeautifulSoup
+from bs4.builder._htmlparser import HTMLParserTreeBuilder
+from bs4.dammit import EntitySubstitution, UnicodeDammit
+from bs4.element import CData, Declaration, Doctype, ProcessingInstruction
+
+from src.utilities.html_cleaner import ALLOWED_ATTRIBUTES, PRESERVE_WHITESPACE_TAGS, UNWANTED_TAGS
+
+VOID_TAGS = frozenset(HTMLParserTreeBuilder().empty_element_tags)
+MULTI_VALUED_ATTRIBUTES = {'class'}
+UNWANTED = frozenset(UNWANTED_TAGS)
+
+_NON_WHITESPACE = re.compile(r"\S+")
+_DECIMAL_REFERENCE = re.compile("^([0-9]+)(.*)")
+_HEX_REFERENCE = re.compile("^([0-9a-f]+)(.*)")
+
+
+def _collapse(text: str, preserve: bool) -> str:
+    """A whitespace-only string becomes a single newline or space, as BeautifulSoup does."""
+    if preserve or any(char not in BeautifulSoup.ASCII_SPACES for char in text):
+        return text
+    return '\n' if '\n' in text else ' '
+
+
+class StreamingHTMLCleaner(HTMLParser):
+    """
+    Incremental version of `HTMLCleaner.clean` built on html.parser events.
+
+    Cleaned HTML is emitted as soon as it is known, so memory is bounded by the
+    nesting depth and the longest text run instead of the document size. The
+    output is identical to `HTMLCleaner(html).clean()`, including how the text
+    around removed tags and comments is merged.
+
+    Usage:
+        cleaner = StreamingHTMLCleaner()
+        for chunk in chunks:
+            out.write(cleaner.feed(chunk))
+        out.write(cleaner.close())
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        # open tags as (name, skipped); skipped tags are unwanted or inside one
+        self.stack = []
+        self.open_counts = {}
+        self.preserve_depth = 0
+        self.closed_void_tags = {}
+        # text waiting for the next emitted node: raw data, strings merged
+        # across removed tags, strings merged across comments
+        self.raw = []
+        self.run = []
+        self.group = []
+        # whether the parent of the pending run/group keeps its whitespace;
+        # a removed <pre> opened since then does not count
+        self.text_preserved = False
+        self.out = []
+
+    def feed(self, data: str) -> str:
+        super().feed(data)
+        return self._drain()
+
+    def close(self) -> str:
+        super().close()
+        self._end_data()
+        self._flush_text()
+        while self.stack:
+            self._pop()
+        return self._drain()
+
+    def _drain(self) -> str:
+        out, self.out = ''.join(self.out), []
+        return out
+
+    @property
+    def skipping(self) -> bool:
+        return bool(self.stack) and self.stack[-1][1]
+
+    def _end_data(self):
+        """A parser event ends the current raw string (BeautifulSoup.endData)."""
+        if self.raw:
+            text = _collapse(''.join(self.raw), self.preserve_depth > 0)
+            self.raw = []
+            if not self.skipping:
+                if not self.run and not self.group:
+                    self.text_preserved = self.preserve_depth > 0
+                self.run.append(text)
+
+    def _end_run(self):
+        """A comment separates strings until comments themselves are removed."""
+        if self.run:
+            text = ''.join(self.run)
+            if len(self.run) > 1:
+                text = _collapse(text, self.text_preserved)
+            self.group.append(text)
+            self.run = []
+
+    def _flush_text(self):
+        self._end_run()
+        if self.group:
+            text = ''.join(self.group)
+            if len(self.group) > 1:
+                text = _collapse(text, self.text_preserved)
+            self.out.append(EntitySubstitution.substitute_xml(text))
+            self.group = []
+
+    def _emit(self, markup: str):
+        self._flush_text()
+        self.out.append(markup)
+
+    def _push(self, tag: str, skipped: bool):
+        self.stack.append((tag, skipped))
+        self.open_counts[tag] = self.open_counts.get(tag, 0) + 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_depth += 1
+
+    def _pop(self):
+        tag, skipped = self.stack[-1]
+        if not skipped:
+            self._emit(f"</{tag}>")
+        self.stack.pop()
+        self.open_counts[tag] -= 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_depth -= 1
+
+    def _start_tag_markup(self, tag: str, attrs, void: bool) -> str:
+        values = {}
+        for key, value in attrs:
+            if key in ALLOWED_ATTRIBUTES:
+                values[key] = '' if value is None else value
+        parts = []
+        for key, value in sorted(values.items()):
+            if key in MULTI_VALUED_ATTRIBUTES:
+                value = ' '.join(_NON_WHITESPACE.findall(value))
+            value = EntitySubstitution.substitute_xml(value)
+            parts.append(f"{key}={EntitySubstitution.quoted_attribute_value(value)}")
+        attributes = ''.join(' ' + part for part in parts)
+        return f"<{tag}{attributes}{'/' if void else ''}>"
+
+    def _start(self, tag: str, attrs, auto_close_void: bool):
+        self._end_data()
+        skipped = self.skipping or tag in UNWANTED
+        if tag in VOID_TAGS:
+            # void elements never get children: opened and closed right away
+            if not skipped:
+                self._emit(self._start_tag_markup(tag, attrs, void=True))
+            if auto_close_void:
+                self.closed_void_tags[tag] = self.closed_void_tags.get(tag, 0) + 1
+            return
+        if not skipped:
+            self._emit(self._start_tag_markup(tag, attrs, void=False))
+        self._push(tag, skipped)
+
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, attrs, auto_close_void=True)
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag, attrs, auto_close_void=False)
+        if tag not in VOID_TAGS:
+            self._end(tag)
+
+    def handle_endtag(self, tag):
+        if self.closed_void_tags.get(tag):
+            # </br> after <br>: the element was already closed
+            self.closed_void_tags[tag] -= 1
+            return
+        self._end(tag)
+
+    def _end(self, tag: str):
+        self._end_data()
+        if not self.open_counts.get(tag):
+            return
+        while self.stack:
+            name = self.stack[-1][0]
+            self._pop()
+            if name == tag:
+                return
+
+    def handle_data(self, data):
+        self.raw.append(data)
+
+    def handle_charref(self, name):
+        base, pattern = 10, _DECIMAL_REFERENCE
+        if name.startswith(('x', 'X')):
+            name, base, pattern = name[1:], 16, _HEX_REFERENCE
+        try:
+            number, extra = int(name, base), ''
+        except ValueError:
+            match = pattern.search(name)
+            if match is None:
+                self.handle_data(name)
+                return
+            number, extra = int(match.group(1), base), match.group(2)
+        self.handle_data(UnicodeDammit.numeric_character_reference(number)[0])
+        self.handle_data(extra)
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.handle_data(character if character is not None else f"&{name}")
+
+    def handle_comment(self, data):
+        self._end_data()
+        if not self.skipping:
+            self._end_run()
+
+    def _preformatted(self, cls, data: str):
+        self._end_data()
+        if not self.skipping:
+            self._emit(f"{cls.PREFIX}{data}{cls.SUFFIX}")
+
+    def handle_decl(self, decl):
+        self._preformatted(Doctype, decl[len("DOCTYPE "):])
+
+    def unknown_decl(self, data):
+        if data.upper().startswith("CDATA["):
+            self._preformatted(CData, data[len("CDATA["):])
+        else:
+            self._preformatted(Declaration, data)
+
+    def handle_pi(self, data):
+        self._preformatted(ProcessingInstruction, data)
+
+
+def iter_clean(chunks: Iterable[str]) -> Iterator[str]:
+    """Clean an iterable of HTML chunks, yielding cleaned HTML as it becomes available."""
+    cleaner = StreamingHTMLCleaner()
+    for chunk in chunks:
+        cleaned = cleaner.feed(chunk)
+        if cleaned:
+            yield cleaned
+    cleaned = cleaner.close()
+    if cleaned:
+        yield cleaned
+
+
+def clean(html_content: str, chunk_size: int = 64 * 1024) -> str:
+    return ''.join(iter_clean(html_content[i:i + chunk_size] for i in range(0, len(html_content), chunk_size)))
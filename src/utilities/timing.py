@@ -0,0 +1,145 @@
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+TIMING_DIR = os.getenv("TIMING_DIR", os.path.join(".cache", "timings"))
+
+# page events timed from the start of a navigation, in the order they fire
+NAVIGATION_EVENTS = ('domcontentloaded', 'load')
+
+
+def percentile(values: List[float], q: float) -> float:
+    """q-th percentile (0-100) with linear interpolation between the closest ranks."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class PhaseTimer:
+    """
+    Records how long each phase of a scraper run takes (launch, navigate,
+    extract.<field>, db_write, ...) so engines can be compared on the same
+    terms. Every sample is also handed to the callables in `hooks` as
+    (phase, seconds, failed), e.g. to feed a tracer or Prometheus. Samples
+    of batched work can carry how many `items` they handled (rows per
+    db_write flush), which the summary reports next to the times.
+
+    Usage:
+        timer = PhaseTimer('playwright')
+        with timer.span('launch'):
+            browser = await p.chromium.launch()
+        with timer.navigation(page):
+            await page.goto(url, wait_until='networkidle')
+        timer.write_summary()   # p50/p95/p99 per phase as JSON
+    """
+
+    def __init__(self, engine: str, hooks: Optional[List[Callable[[str, float, bool], None]]] = None):
+        self.engine = engine
+        self.hooks = hooks or []
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.items: Dict[str, List[int]] = defaultdict(list)
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+
+    def record(self, phase: str, seconds: float, failed: bool = False, items: Optional[int] = None):
+        self.samples[phase].append(seconds)
+        if failed:
+            self.errors[phase] += 1
+        if items is not None:
+            self.items[phase].append(items)
+        for hook in self.hooks:
+            hook(phase, seconds, failed)
+
+    @contextmanager
+    def span(self, phase: str, items: Optional[int] = None):
+        """Time the block as one sample of `phase`; a raised exception counts as an error."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.record(phase, time.perf_counter() - start, failed=True, items=items)
+            raise
+        self.record(phase, time.perf_counter() - start, items=items)
+
+    @contextmanager
+    def navigation(self, page, phase: str = 'navigate'):
+        """
+        Time a `page.goto` (pyppeteer or playwright) as `phase`, broken down
+        into `<phase>.domcontentloaded` and `<phase>.load` (from the start of
+        the navigation) and `<phase>.networkidle` (the wait after load until
+        goto returned).
+        """
+        start = time.perf_counter()
+        fired: Dict[str, float] = {}
+
+        def listener(event):
+            def mark(*args):
+                fired.setdefault(event, time.perf_counter())
+            return mark
+
+        listeners = {event: listener(event) for event in NAVIGATION_EVENTS}
+        for event, handler in listeners.items():
+            page.on(event, handler)
+        try:
+            with self.span(phase):
+                yield
+        finally:
+            end = time.perf_counter()
+            for event, handler in listeners.items():
+                try:
+                    page.remove_listener(event, handler)
+                except Exception:
+                    pass  # page already closed
+            for event in NAVIGATION_EVENTS:
+                if event in fired:
+                    self.record(f"{phase}.{event}", fired[event] - start)
+            if 'load' in fired:
+                self.record(f"{phase}.networkidle", end - fired['load'])
+
+    def summary(self) -> dict:
+        phases = {}
+        for phase, values in sorted(self.samples.items()):
+            phases[phase] = {
+                'count': len(values),
+                'errors': self.errors.get(phase, 0),
+                'total': round(sum(values), 6),
+                'mean': round(sum(values) / len(values), 6),
+                'p50': round(percentile(values, 50), 6),
+                'p95': round(percentile(values, 95), 6),
+                'p99': round(percentile(values, 99), 6),
+                'max': round(max(values), 6),
+            }
+            items = self.items.get(phase)
+            if items:
+                phases[phase]['items'] = {'total': sum(items), 'mean': round(sum(items) / len(items), 3),
+                                          'max': max(items)}
+        return {
+            'engine': self.engine,
+            'started_at': self.started_at,
+            'wall_seconds': round(time.perf_counter() - self._start, 3),
+            'phases': phases,
+        }
+
+    def write_summary(self, path: Optional[str] = None) -> str:
+        """
+        Write `summary()` as JSON, by default to
+        TIMING_DIR/<engine>-<start time>.json, and return the path.
+        """
+        if path is None:
+            stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))
+            path = os.path.join(TIMING_DIR, f"{self.engine}-{stamp}.json")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        print(f"Timings of {self.engine} written to {path}")
+        return path
@@ -0,0 +1,135 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import AsyncIterable, Awaitable, Callable, Dict, Iterable, Optional, Union
+from urllib.parse import urlparse
+
+
+def host_of(item) -> str:
+    """Host of a payload's `url` (or of a plain URL string)."""
+    return urlparse(getattr(item, 'url', item)).hostname or ''
+
+
+class TokenBucket:
+    """
+    Paces callers to `rate` acquisitions per second on average, allowing
+    bursts of up to `burst` back to back.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens: float = burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class WorkQueue:
+    """
+    Runs `handler` over a stream of items with `workers` long-lived workers
+    pulling from a bounded asyncio.Queue, so one slow item only holds up its
+    own worker instead of a whole batch.
+
+    Per host (see `key`) at most `per_host` items run at once, and with
+    `rate` set each host gets a token bucket of `rate` starts per second
+    (bursts of `burst`). Items are pulled from the source lazily, only when
+    the queue has room, so e.g. frontier claims track actual progress.
+
+    Usage:
+        stats = await WorkQueue(handle, workers=10, per_host=5, rate=2).run(items)
+    """
+
+    def __init__(self, handler: Callable[[object], Awaitable], workers: int = 5,
+                 per_host: Optional[int] = None, rate: Optional[float] = None, burst: int = 1,
+                 key: Callable[[object], str] = host_of, queue_size: Optional[int] = None):
+        self.handler = handler
+        self.workers = workers
+        self.per_host = per_host
+        self.rate = rate
+        self.burst = burst
+        self.key = key
+        self.queue_size = queue_size or workers * 2
+
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self.stats: Dict[str, int] = defaultdict(int)
+
+    def _host_limit(self, host: str) -> Optional[asyncio.Semaphore]:
+        if self.per_host is None:
+            return None
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        return self._host_limits[host]
+
+    def _bucket(self, host: str) -> Optional[TokenBucket]:
+        if self.rate is None:
+            return None
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate, self.burst)
+        return self._buckets[host]
+
+    async def _process(self, item):
+        host = self.key(item)
+        limit = self._host_limit(host)
+        bucket = self._bucket(host)
+        if limit is not None:
+            await limit.acquire()
+        try:
+            if bucket is not None:
+                await bucket.acquire()
+            await self.handler(item)
+            self.stats['done'] += 1
+        except Exception as e:
+            self.stats['failed'] += 1
+            print(f"Failed to process {getattr(item, 'url', item)}: {e}")
+        finally:
+            if limit is not None:
+                limit.release()
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            item = await queue.get()
+            try:
+                await self._process(item)
+            finally:
+                queue.task_done()
+
+    async def _feed(self, queue: asyncio.Queue, items: Union[Iterable, AsyncIterable]):
+        if hasattr(items, '__aiter__'):
+            async for item in items:
+                await queue.put(item)
+                self.stats['queued'] += 1
+        else:
+            for item in items:
+                await queue.put(item)
+                self.stats['queued'] += 1
+
+    async def run(self, items: Union[Iterable, AsyncIterable]) -> Dict[str, int]:
+        """Process every item, returning counts of queued, done and failed items."""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.workers)]
+        try:
+            await self._feed(queue, items)
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return dict(self.stats)
+
+
+async def run_work_queue(items: Union[Iterable, AsyncIterable], handler: Callable[[object], Awaitable],
+                         **kwargs) -> Dict[str, int]:
+    """Shortcut for `WorkQueue(handler, **kwargs).run(items)`."""
+    return await WorkQueue(handler, **kwargs).run(items)
@@ -1,11 +1,23 @@
-from src.utilities.html_cleaner import HTMLCleaner
+import ast
+import asyncio
+import json
+import os
+import time
 
+from bs4 import BeautifulSoup
 
-def test_html_cleaner():
-    """
-     Test the HTMLCleaner class
-    """
-    html = """
+from src.utilities.html_cleaner import HTMLCleaner
+from src.utilities import streaming_html_cleaner
+from src.utilities.extraction_plan import PARSERS, ExtractionPlan, get_plan, parse_html
+from src.utilities.page_ready import goto_ready, ready_selectors
+from src.utilities.rate_limiter import AdaptiveRateLimiter, AIMDPolicy, parse_retry_after
+from src.utilities.resource_policy import (DEFAULT_RESOURCE_POLICY, LOAD_EVERYTHING, ResourcePolicy,
+                                           apply_resource_policy, resource_policy_for)
+from src.utilities.response_cache import ResponseCache
+from src.utilities.timing import PhaseTimer, percentile
+from src.utilities.work_queue import WorkQueue
+
+TEST_PAGE = """
     <html>
     <head>
         <title>Test Page</title>
@@ -20,6 +32,13 @@ def test_html_cleaner():
     </body>
     </html>
     """
+
+
+def test_html_cleaner():
+    """
+     Test the HTMLCleaner class
+    """
+    html = TEST_PAGE
     cleaner = HTMLCleaner(html)
     cleaned_html = cleaner.strip_unwanted_tags()
     assert '<script>' not in cleaned_html
@@ -32,3 +51,1121 @@ def test_html_cleaner():
     assert 'class' in cleaned_html
 
 
+
+
+def test_html_cleaner_single_parse_matches_steps():
+    """
+     clean() works on one parsed tree and must match running the steps one by one
+    """
+    html = """
+    <html>
+    <body>
+        <div class="content" data-x="1">
+            <!-- comment -->
+            <p id="intro" style="color: red">Intro</p>
+            <script>alert('Hello');</script>
+            <nav><a href="/">Home</a></nav>
+            <pre>  keep   spacing  </pre>
+        </div>
+    </body>
+    </html>
+    """
+    stepwise = HTMLCleaner(html)
+    stepwise.strip_unwanted_tags()
+    stepwise.remove_comments()
+    expected = stepwise.retain_allowed_attributes()
+
+    cleaned_html = HTMLCleaner(html).clean()
+    assert cleaned_html == expected
+    assert '<!--' not in cleaned_html
+    assert 'style=' not in cleaned_html
+    assert '<pre>  keep   spacing  </pre>' in cleaned_html
+
+    cleaned_html = HTMLCleaner(html, parser='lxml').clean()
+    assert '<script>' not in cleaned_html
+    assert 'id="intro"' in cleaned_html
+
+
+def apple_page():
+    """ The Apple careers page embedded in temo.py """
+    with open(os.path.join(os.path.dirname(__file__), '..', 'temo.py'), encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and any(getattr(t, 'id', None) == 'html_code' for t in node.targets):
+            return node.value.value
+
+
+def test_streaming_html_cleaner_matches_html_cleaner():
+    """
+     The streaming cleaner must emit exactly what HTMLCleaner.clean does, whatever the chunking
+    """
+    tricky = (
+        '<!DOCTYPE html><div class=" a  b " id=x data-q="1">a<!--c--> <li>x\n<b>&amp;q&copy;&#65;&nosuch;</b>'
+        '<pre> <script>var s = "</div>";</script>  </pre><br></br><img src=x class=y><div/>'
+        '<span id=\'a"b\' class="c\'d">t</x>u</span><![CDATA[x<y]]><nav><a href="/">Home</a></nav>'
+    )
+    for html in (TEST_PAGE, tricky, apple_page()):
+        expected = HTMLCleaner(html).clean()
+        for chunk_size in (1, 17, 64 * 1024):
+            assert streaming_html_cleaner.clean(html, chunk_size=chunk_size) == expected
+
+    cleaned_html = streaming_html_cleaner.clean(TEST_PAGE)
+    assert '<script>' not in cleaned_html
+    assert '<meta' not in cleaned_html
+    assert 'class="content"' in cleaned_html
+
+
+def test_streaming_html_cleaner_matches_html_cleaner_on_random_markup():
+    """
+     Differential test on seeded random tag soup: unmatched end tags, removed and whitespace-keeping tags, comments
+    """
+    import random
+
+    pieces = ['<div>', '</div>', '<pre>', '</pre>', '<li>', '</li>', '<e>', '</e>', '<textarea>', '</textarea>',
+              '<script>x</script>', '<!--c-->', ' ', '  ', '\n', 'a', '<br>', '</br>', '<b>', '</b>', '&amp;',
+              '<span class=" x ">', '</span>', '<nav>', '</nav>', '<img>', '<p/>']
+    rng = random.Random(1)
+    cases = [' </e> <li><pre>']
+    cases += [''.join(rng.choice(pieces) for _ in range(rng.randint(1, 16))) for _ in range(3000)]
+    for html in cases:
+        chunk_size = rng.choice((1, 3, 64 * 1024))
+        assert streaming_html_cleaner.clean(html, chunk_size=chunk_size) == HTMLCleaner(html).clean(), html
+
+
+def test_extraction_plan_matches_select_one():
+    """
+     One walk with the compiled plan gives what select_one per field gives, fallbacks included
+    """
+    html = """
+    <div id="main">
+        <h1 class="title  big">Engineer</h1>
+        <span class="addressCountry"> </span>
+        <span id="job-location-name">Cupertino</span>
+        <p class="title">Second title</p>
+        <ul><li>one</li><li data-x="1">two</li></ul>
+    </div>
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    config = {
+        'title': '.title',
+        'location': ['.addressCountry', '#job-location-name'],
+        'second': 'div p.title',
+        'item': 'li:nth-child(2)',
+        'missing': '#nothing',
+        'empty': None,
+    }
+    plan = ExtractionPlan(config)
+    assert plan.extract(soup) == {
+        'title': 'Engineer',
+        'location': 'Cupertino',
+        'second': 'Second title',
+        'item': 'two',
+        'missing': '',
+        'empty': '',
+    }
+    for name, selectors in config.items():
+        if isinstance(selectors, str):
+            element = soup.select_one(selectors)
+            assert plan.extract(soup)[name] == (element.get_text(strip=True) if element else '')
+    assert get_plan(config) is get_plan(dict(config))
+
+
+DETAIL_PAGE = """
+<!DOCTYPE html>
+<html>
+<head><title>Software Engineer - Jobs</title><script>var job = {"id": "0"};</script></head>
+<body>
+    <header><nav><a href="/">Careers</a></nav></header>
+    <main>
+        <h1 class="jd__header--title">Software Engineer &ndash; Maps &amp; Location</h1>
+        <strong id="jobNumber"> 200571234 </strong>
+        <span class="addressCountry"><!-- filled by js --></span>
+        <span id="job-location-name">Cupertino,&nbsp;California</span>
+        <span id="job-team-name">Software and Services</span>
+        <time id="jobPostDate">Jan 15, 2025</time>
+        <div id="jd-job-summary">
+            <p>Build <b>things</b> people love.<br>Every day.</p>
+            <style>.x { color: red; }</style>
+        </div>
+        <div id="jd-description">
+            <ul><li>Write code &lt;3</li><li>Ship it &#8212; often</li></ul>
+            <table><tr><td>Level</td><td>ICT4</td></tr></table>
+            <pre>  keep   spacing  </pre>
+        </div>
+    </main>
+</body>
+</html>
+"""
+
+
+def test_parser_backends_extract_the_same_fields():
+    """
+     Every parser backend yields the same fields as html.parser
+    """
+    pages = [
+        (DETAIL_PAGE, {
+            'job_id': '#jobNumber',
+            'title': '.jd__header--title',
+            'location': ['.addressCountry', '#job-location-name'],
+            'department': '#job-team-name',
+            'summary': '#jd-job-summary',
+            'long_description': '#jd-description',
+            'date': '#jobPostDate',
+            'level': '#jd-description td + td',
+            'missing': '#nothing',
+        }),
+        (apple_page(), {
+            'title': '.table--advanced-search__title',
+            'role': 'tbody:nth-of-type(3) .table--advanced-search__role',
+            'date': '.table-col-2 .table--advanced-search__date',
+            'location': ['.no-location', '.table--advanced-search__location-sub'],
+        }),
+        (TEST_PAGE, {'content': 'div.content', 'title': 'title', 'body': 'body'}),
+    ]
+    for html, config in pages:
+        plan = get_plan(config)
+        expected = plan.extract(parse_html(html))
+        assert any(expected.values())
+        for parser in PARSERS:
+            assert plan.extract_html(html, parser) == expected, parser
+
+    fields = get_plan(pages[0][1]).extract_html(DETAIL_PAGE, 'selectolax')
+    assert fields['job_id'] == '200571234'
+    assert fields['location'] == 'Cupertino,\xa0California'
+    assert fields['summary'] == 'Buildthingspeople love.Every day.'
+
+
+def test_work_queue_slow_item_does_not_gate_the_rest():
+    """
+     A slow item only holds its own worker; per-host limits and failures are respected
+    """
+    running = {}
+    peak = {}
+    finished = []
+
+    async def handle(url):
+        host = url.split('/')[2]
+        running[host] = running.get(host, 0) + 1
+        peak[host] = max(peak.get(host, 0), running[host])
+        try:
+            if url.endswith('/fail'):
+                raise ValueError(url)
+            await asyncio.sleep(1.0 if url.endswith('/slow') else 0.01)
+            finished.append(url)
+        finally:
+            running[host] -= 1
+
+    urls = ['http://a.test/slow', 'http://a.test/fail']
+    urls += [f'http://a.test/{i}' for i in range(20)] + [f'http://b.test/{i}' for i in range(20)]
+    start = time.perf_counter()
+    stats = asyncio.run(WorkQueue(handle, workers=4, per_host=2).run(iter(urls)))
+    elapsed = time.perf_counter() - start
+
+    assert stats == {'queued': 42, 'done': 41, 'failed': 1}
+    assert peak == {'a.test': 2, 'b.test': 2}
+    # everything else finishes while the slow item is still running
+    assert finished[-1] == 'http://a.test/slow'
+    assert elapsed < 1.5
+
+
+def test_work_queue_token_bucket_paces_starts():
+    """
+     With rate set, each host starts at most `burst` items at once and then `rate` per second
+    """
+    starts = []
+
+    async def handle(url):
+        starts.append(time.perf_counter())
+
+    stats = asyncio.run(WorkQueue(handle, workers=5, rate=20, burst=2).run(
+        f'http://a.test/{i}' for i in range(6)
+    ))
+    assert stats['done'] == 6
+    # 2 immediately, the other 4 at 20 per second
+    assert starts[-1] - starts[0] >= 4 / 20 - 0.02
+
+
+def test_adaptive_rate_limiter_backs_off_and_recovers():
+    """
+     Successes raise a host's rate additively, 429/5xx/slow responses halve it, hosts are independent
+    """
+    limiter = AdaptiveRateLimiter(AIMDPolicy(initial_rate=1.0, min_rate=0.25, max_rate=2.0, increase=0.5))
+    url = 'https://jobs.example.com/a'
+
+    assert limiter.record(url, 200, 0.1) == 1.5
+    assert limiter.record(url, 200, 0.1) == 2.0
+    assert limiter.record(url, 200, 0.1) == 2.0
+    assert limiter.record(url, 404, 0.1) == 2.0
+    assert limiter.record(url, 429, 0.1) == 1.0
+    assert limiter.record(url, 503, 0.1) == 0.5
+    assert limiter.record(url, None, 0.1) == 0.25
+    assert limiter.record(url, 200, 0.1) == 0.75
+    # much slower than the host's average latency
+    assert limiter.record(url, 200, 5.0) == 0.375
+    assert limiter.rate('https://other.example.com/') == 1.0
+
+    assert parse_retry_after('3') == 3.0
+    assert parse_retry_after(None) == 0.0
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+
+
+def test_adaptive_rate_limiter_paces_requests():
+    """
+     Concurrent requests to one host are spaced at its rate; Retry-After pauses the host
+    """
+    limiter = AdaptiveRateLimiter(AIMDPolicy(initial_rate=20.0, max_rate=20.0, increase=0.0))
+    url = 'https://jobs.example.com/a'
+    starts = []
+
+    async def fetch(status, headers=None):
+        async with limiter.request(url) as slot:
+            starts.append(time.perf_counter())
+            slot.observe(status, headers)
+
+    async def run():
+        await asyncio.gather(*(fetch(200) for _ in range(5)))
+        await fetch(429, {'Retry-After': '0.3'})
+        await fetch(200)
+
+    asyncio.run(run())
+    # 1 immediately, then 4 at 20/s
+    assert starts[4] - starts[0] >= 4 / 20 - 0.02
+    assert starts[6] - starts[5] >= 0.28
+    assert limiter.rate(url) == 10.0
+
+
+def test_response_cache_conditional_headers_and_hash(tmp_path):
+    """
+     Validators and the body hash survive a reopen; HEAD responses only count as a check
+    """
+    url = 'https://jobs.example.com/details/1'
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite3'))
+    assert cache.conditional_headers(url) == {}
+    assert not cache.is_unchanged(url, '<p>v1</p>')
+
+    cache.store(url, {'ETag': '"v1"', 'Last-Modified': 'Wed, 01 Jan 2025 00:00:00 GMT'}, '<p>v1</p>')
+    cache.close()
+
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite3'))
+    assert cache.conditional_headers(url) == {
+        'If-None-Match': '"v1"',
+        'If-Modified-Since': 'Wed, 01 Jan 2025 00:00:00 GMT',
+    }
+    assert cache.is_unchanged(url, '<p>v1</p>')
+    assert not cache.is_unchanged(url, '<p>v2</p>')
+
+    before = cache.get(url)
+    cache.store(url, {'etag': '"v2"'})
+    entry = cache.get(url)
+    # a new ETag without the body it belongs to would answer 304 for a page never hashed
+    assert (entry.etag, entry.last_modified) == ('"v1"', 'Wed, 01 Jan 2025 00:00:00 GMT')
+    assert cache.is_unchanged(url, '<p>v1</p>')
+    assert entry.changed_at == before.changed_at
+    assert entry.checked_at >= before.checked_at
+
+    cache.store(url, {'ETag': '"v2"'}, '<p>v2</p>')
+    entry = cache.get(url)
+    assert (entry.etag, entry.last_modified) == ('"v2"', None)
+    assert cache.is_unchanged(url, '<p>v2</p>')
+    assert entry.changed_at > before.changed_at
+
+
+def test_pending_validators_reach_the_cache_only_once_committed(tmp_path, monkeypatch):
+    """
+     A page's validators are cached when its row commits; a refused or lost row leaves the page uncached
+    """
+    from src.utilities import response_cache
+
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite3'))
+    monkeypatch.setattr(response_cache, '_caches', {os.getpid(): cache})
+    pending = response_cache.PendingValidators()
+    for i in range(3):
+        pending.add(f'https://jobs.example.com/{i}', {'ETag': f'"v{i}"'}, f'<p>{i}</p>')
+    assert cache.conditional_headers('https://jobs.example.com/0') == {}
+
+    pending.commit(['https://jobs.example.com/0'])
+    pending.discard(['https://jobs.example.com/1'])
+    assert cache.conditional_headers('https://jobs.example.com/0') == {'If-None-Match': '"v0"'}
+    assert cache.is_unchanged('https://jobs.example.com/0', '<p>0</p>')
+    assert cache.get('https://jobs.example.com/1') is None
+    assert list(pending.pending) == ['https://jobs.example.com/2']
+
+def test_phase_timer_summary_and_navigation_breakdown(tmp_path):
+    """
+     Spans and page load events end up as per phase percentiles in the JSON summary
+    """
+    from pyee import EventEmitter
+
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    assert percentile([5.0], 99) == 5.0
+
+    timer = PhaseTimer('test')
+    for seconds in (0.1, 0.2, 0.3, 0.4):
+        timer.record('extract.title', seconds)
+    try:
+        with timer.span('db_write'):
+            raise ValueError('boom')
+    except ValueError:
+        pass
+
+    page = EventEmitter()
+
+    async def goto():
+        await asyncio.sleep(0.02)
+        page.emit('domcontentloaded')
+        await asyncio.sleep(0.02)
+        page.emit('load')
+        await asyncio.sleep(0.05)
+
+    async def navigate():
+        with timer.navigation(page):
+            await goto()
+
+    asyncio.run(navigate())
+    # listeners are removed once the navigation is over
+    assert not page.listeners('load')
+
+    summary = timer.summary()
+    phases = summary['phases']
+    assert phases['extract.title']['count'] == 4
+    assert abs(phases['extract.title']['p50'] - 0.25) < 1e-9
+    assert phases['db_write']['errors'] == 1
+    assert phases['navigate.domcontentloaded']['p50'] < phases['navigate.load']['p50'] < phases['navigate']['p50']
+    assert phases['navigate.networkidle']['p50'] >= 0.04
+
+    path = timer.write_summary(str(tmp_path / 'timings.json'))
+    with open(path) as f:
+        assert json.load(f)['engine'] == 'test'
+
+
+def test_resource_policy_aborts_assets_and_trackers_on_both_engines():
+    """
+     Images, fonts, styles and tracker scripts are aborted on pyppeteer and playwright pages, the rest continues
+    """
+    from pyee import EventEmitter
+
+    apple = resource_policy_for('https://jobs.apple.com/en-us/details/200')
+    assert resource_policy_for('https://careers.example.com/jobs/1') is DEFAULT_RESOURCE_POLICY
+    assert apple.blocks('script', 'https://jobs.apple.com/static/js/analytics/v4/packager.js')
+    assert not DEFAULT_RESOURCE_POLICY.blocks('script', 'https://jobs.apple.com/static/js/analytics/v4/packager.js')
+    assert not apple.blocks('script', 'https://jobs.apple.com/static/js/app.js')
+    assert not ResourcePolicy(allowed_patterns=('/logo',)).blocks('image', 'https://a.com/logo.png')
+
+    requests = [
+        ('document', 'https://jobs.apple.com/en-us/details/200'),
+        ('stylesheet', 'https://jobs.apple.com/static/styles/jobsite.built.css'),
+        ('font', 'https://www.apple.com/wss/fonts?families=SF+Pro'),
+        ('image', 'https://jobs.apple.com/static/favicon.ico'),
+        ('script', 'https://jobs.apple.com/static/js/analytics/v4/packager.js'),
+        ('script', 'https://www.googletagmanager.com/gtm.js'),
+        ('script', 'https://jobs.apple.com/static/js/app.js'),
+        ('xhr', 'https://jobs.apple.com/api/role/200'),
+    ]
+    expected = {url: kind in ('document', 'xhr') or url.endswith('app.js') for kind, url in requests}
+
+    class PyppeteerRequest:
+        def __init__(self, kind, url, outcome):
+            self.resourceType, self.url, self.outcome = kind, url, outcome
+
+        async def abort(self):
+            self.outcome[self.url] = False
+
+        async def continue_(self):
+            self.outcome[self.url] = True
+
+    class PyppeteerPage(EventEmitter):
+        intercepting = False
+
+        async def setRequestInterception(self, value):
+            self.intercepting = value
+
+    class PlaywrightRoute:
+        def __init__(self, kind, url, outcome):
+            self.request = type('Request', (), {'resource_type': kind, 'url': url})()
+            self.outcome = outcome
+
+        async def abort(self):
+            self.outcome[self.request.url] = False
+
+        async def continue_(self):
+            self.outcome[self.request.url] = True
+
+    class PlaywrightPage:
+        handler = None
+
+        async def route(self, pattern, handler):
+            self.handler = handler
+
+    async def run():
+        pyppeteer_outcome, playwright_outcome = {}, {}
+        page = PyppeteerPage()
+        counts = await apply_resource_policy(page, url=requests[0][1])
+        assert page.intercepting
+        for kind, url in requests:
+            page.emit('request', PyppeteerRequest(kind, url, pyppeteer_outcome))
+        await asyncio.sleep(0)
+        assert counts == {'allowed': 3, 'blocked': 5}
+
+        page = PlaywrightPage()
+        await apply_resource_policy(page, apple)
+        for kind, url in requests:
+            await page.handler(PlaywrightRoute(kind, url, playwright_outcome))
+
+        # nothing is intercepted when every request may load
+        unrouted = PlaywrightPage()
+        assert not await apply_resource_policy(unrouted, LOAD_EVERYTHING) and unrouted.handler is None
+        return pyppeteer_outcome, playwright_outcome
+
+    pyppeteer_outcome, playwright_outcome = asyncio.run(run())
+    assert pyppeteer_outcome == expected
+    assert playwright_outcome == expected
+
+
+def test_goto_ready_waits_for_fields_and_falls_back_to_network_idle():
+    """
+     Navigation returns at domcontentloaded once the required selectors match, and waits for the network otherwise
+    """
+    from pyee import EventEmitter
+
+    assert ready_selectors(['#jobNumber', None, ['.addressCountry', '#job-location-name'], '#jobNumber']) == \
+        ['#jobNumber', '.addressCountry, #job-location-name']
+
+    class Page(EventEmitter):
+        """pyppeteer page whose fields appear after `ready_after` seconds (never when None)"""
+
+        def __init__(self, ready_after):
+            super().__init__()
+            self.ready_after = ready_after
+            self.wait_until = None
+            self.groups = None
+
+        async def goto(self, url, options):
+            self.wait_until = options['waitUntil']
+            request = object()
+            self.emit('request', request)
+
+            async def slow_tracker():
+                await asyncio.sleep(0.3)
+                self.emit('requestfinished', request)
+
+            asyncio.ensure_future(slow_tracker())
+            return 'response'
+
+        async def waitForFunction(self, function, options, groups):
+            self.groups = groups
+            if self.ready_after is None:
+                await asyncio.sleep(options['timeout'] / 1000)
+                raise asyncio.TimeoutError()
+            await asyncio.sleep(self.ready_after)
+
+    selectors = ['#jobNumber', '.jd__header--title', '#jd-description']
+
+    async def navigate(page, **kwargs):
+        timer = PhaseTimer('test')
+        start = time.perf_counter()
+        response = await goto_ready(page, 'https://jobs.apple.com/en-us/details/1', selectors, timer, **kwargs)
+        assert response == 'response'
+        return time.perf_counter() - start, timer.summary()['phases']
+
+    ready = Page(ready_after=0.01)
+    elapsed, phases = asyncio.run(navigate(ready, wait='ready'))
+    assert ready.wait_until == 'domcontentloaded' and ready.groups == selectors
+    # the tracker request still in flight is not waited for
+    assert elapsed < 0.2
+    assert phases['navigate.ready']['errors'] == 0
+    assert not ready.listeners('request')
+
+    missing = Page(ready_after=None)
+    elapsed, phases = asyncio.run(navigate(missing, wait='ready', ready_timeout=0.05))
+    # fell back to networkidle: the request ended at 0.3s, then 0.5s of quiet
+    assert elapsed >= 0.8
+    assert phases['navigate.ready']['errors'] == 1
+
+    idle = Page(ready_after=0.01)
+    asyncio.run(navigate(idle, wait='networkidle'))
+    assert idle.wait_until == 'networkidle0' and idle.groups is None
+
+
+def test_browser_pool_recycles_after_navigations_rss_and_crashes(monkeypatch):
+    """
+     A browser is relaunched after max_navigations pages, above max_rss_mb or once its process died,
+     and pages still open on it finish first
+    """
+    from src.utilities import browser_pool
+    from src.utilities.browser_pool import BrowserPool, PooledBrowser
+
+    class FakeProcess:
+        def __init__(self):
+            self.pid = os.getpid()
+            self.returncode = None
+
+        def poll(self):
+            return self.returncode
+
+    class FakePage:
+        async def close(self):
+            pass
+
+    class FakeBrowser:
+        def __init__(self):
+            self.process = FakeProcess()
+            self.rss = 0.0
+            self.pages = 0
+            self.closed = False
+
+        async def newPage(self):
+            self.pages += 1
+            return FakePage()
+
+        async def close(self):
+            self.closed = True
+
+    launched = []
+
+    async def launch(**kwargs):
+        launched.append(FakeBrowser())
+        return launched[-1]
+
+    # the real RSS of a (fake) browser running as this process is measured
+    assert PooledBrowser(FakeBrowser()).rss_mb() > 0
+
+    monkeypatch.setattr(browser_pool, 'launch', launch)
+    monkeypatch.setattr(PooledBrowser, 'rss_mb', lambda self: self.browser.rss)
+
+    async def borrow(pool):
+        async with pool.page():
+            pass
+
+    async def run():
+        async with BrowserPool(size=1, pages_per_browser=2, max_navigations=3, max_rss_mb=500) as pool:
+            for _ in range(4):
+                await borrow(pool)
+            assert len(launched) == 2
+            assert (launched[0].pages, launched[0].closed) == (3, True)
+
+            launched[1].rss = 600
+            await borrow(pool)
+            assert len(launched) == 3 and launched[1].closed
+
+            launched[2].process.returncode = -9
+            await borrow(pool)
+            assert len(launched) == 4 and launched[2].closed
+
+            async with pool.page():
+                launched[3].rss = 600
+                waiting = asyncio.ensure_future(borrow(pool))
+                await asyncio.sleep(0.01)
+                assert len(launched) == 4 and not launched[3].closed
+            await waiting
+            assert len(launched) == 5 and launched[3].closed
+        assert launched[4].closed
+
+    asyncio.run(run())
+
+
+def test_frontier_dedups_claims_acks_and_requeues():
+    """
+     Urls are queued once, claimed into processing, acked one at a time and requeued after a crash
+    """
+    import fakeredis
+    from src.cache.Redis import Frontier
+
+    client = fakeredis.FakeRedis()
+    frontier = Frontier(client, 'jobs')
+
+    assert frontier.add('a', 'b', 'a', 'c') == 3
+    assert frontier.add('b', 'd') == 1
+    assert frontier.pending_count() == 4
+
+    assert frontier.claim(2) == ['a', 'b']
+    assert client.lrange('jobs:processing', 0, -1) == [b'a', b'b']
+    assert frontier.pending_count() == 2
+
+    # the same url claimed twice (two consumers) is acked one entry at a time
+    client.rpush('jobs:processing', 'a')
+    frontier.ack('a')
+    assert client.lrange('jobs:processing', 0, -1) == [b'b', b'a']
+    frontier.ack('a')
+    assert client.lrange('jobs:processing', 0, -1) == [b'b']
+
+    # a consumer dies holding 'b' and 'c': they go back in front, in claim order
+    assert frontier.claim(1) == ['c']
+    assert frontier.requeue_unacked() == 2
+    assert client.lrange('jobs:pending', 0, -1) == [b'b', b'c', b'd']
+    assert [url for urls in frontier.iter_claims(2) for url in urls] == ['b', 'c', 'd']
+    assert frontier.pending_count() == 0
+
+    # acked urls stay seen, so harvesting them again does not queue them
+    frontier.ack('b', 'c', 'd')
+    assert frontier.add('a', 'b', 'c', 'd') == 0
+    assert client.llen('jobs:processing') == 0
+
+
+def test_frontier_migrates_the_legacy_list_once():
+    """
+     Urls on the old 'jobs' list move into the frontier once; a migration that died half way resumes
+    """
+    import fakeredis
+    from src.cache.Redis import Frontier
+
+    client = fakeredis.FakeRedis()
+    frontier = Frontier(client, 'jobs')
+    frontier.add('a')
+    client.rpush('jobs', 'a', 'b', 'c', 'b')
+
+    assert frontier.add_from_list('jobs', chunk_size=2) == 2
+    assert client.lrange('jobs:pending', 0, -1) == [b'a', b'b', b'c']
+    assert not client.exists('jobs') and not client.exists('jobs:migrating')
+    # later startups find nothing left to migrate
+    assert frontier.add_from_list('jobs') == 0
+
+    # a crash left 'd' in the renamed list, and a stray push re-created the old one
+    client.rpush('jobs:migrating', 'c', 'd')
+    client.rpush('jobs', 'e')
+    assert frontier.add_from_list('jobs') == 2
+    assert client.lrange('jobs:pending', 0, -1) == [b'a', b'b', b'c', b'd', b'e']
+    assert frontier.claim(10) == ['a', 'b', 'c', 'd', 'e']
+
+
+def test_buffered_writer_flushes_in_order_and_dedups():
+    """
+     Buffered pushes reach redis in order in one flush, frontier adds are deduplicated across flushes
+    """
+    import fakeredis
+    from src.cache.Redis import BufferedWriter, Frontier
+
+    client = fakeredis.FakeRedis()
+    writer = BufferedWriter(client, batch_size=4, flush_interval=3600)
+
+    writer.append_to_list('results', 'r1')
+    writer.add_to_frontier('jobs', 'a')
+    writer.add_to_frontier('jobs', 'a')
+    assert client.llen('results') == 0 and client.llen('jobs:pending') == 0
+
+    # the fourth value reaches batch_size and flushes the buffer
+    writer.append_to_list('results', 'r2')
+    assert client.lrange('results', 0, -1) == [b'r1', b'r2']
+    assert client.lrange('jobs:pending', 0, -1) == [b'a']
+    assert writer.pending_count == 0
+
+    with writer:
+        for url in ('c', 'a', 'b', 'c'):
+            writer.add_to_frontier('jobs', url)
+        writer.append_to_list('results', 'r3')
+    assert client.lrange('jobs:pending', 0, -1) == [b'a', b'c', b'b']
+    assert client.lrange('results', 0, -1) == [b'r1', b'r2', b'r3']
+    assert Frontier(client, 'jobs').add('a', 'b', 'c') == 0
+    assert writer.flush() == 0
+
+
+def test_frontier_requeues_failures_then_dead_letters_them():
+    """
+     A failed url goes back to pending with its attempts counted, and to the dead list after max_retries
+    """
+    import fakeredis
+    from src.cache.Redis import Frontier
+
+    client = fakeredis.FakeRedis()
+    frontier = Frontier(client, 'jobs', max_retries=2)
+    frontier.add('a', 'b')
+
+    assert frontier.claim(2) == ['a', 'b']
+    assert frontier.fail('a') == 1
+    # only claimed urls can fail
+    assert frontier.fail('z') == 0
+    assert client.lrange('jobs:pending', 0, -1) == [b'a']
+    assert client.lrange('jobs:processing', 0, -1) == [b'b']
+
+    for attempt in range(2):
+        assert frontier.claim(1) == ['a']
+        frontier.fail('a')
+    assert frontier.pending_count() == 0
+    assert frontier.dead() == ['a']
+    assert client.hget('jobs:retries', 'a') is None
+
+    # a success clears the attempts of an earlier failure
+    frontier.fail('b')
+    assert client.hget('jobs:retries', 'b') == b'1'
+    frontier.ack(*frontier.claim(1))
+    assert client.hget('jobs:retries', 'b') is None
+    assert client.llen('jobs:processing') == 0
+
+
+def test_pooled_connection_keeps_idle_connections_and_pings_stale_ones(monkeypatch):
+    """
+     Connections stay pooled above minconn; one idle past HEALTH_CHECK_AFTER is pinged, and replaced when dead
+    """
+    import threading
+    import psycopg2.pool
+    from psycopg2 import OperationalError, extensions
+    from src.Database import database
+
+    class FakeCursor:
+        def __init__(self, connection):
+            self.connection = connection
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_type, exc_val, exc_tb):
+            pass
+
+        def execute(self, query, params=None):
+            if self.connection.dead:
+                raise OperationalError('server closed the connection unexpectedly')
+            self.connection.queries.append(query)
+
+    class FakeConnection:
+        def __init__(self):
+            self.closed = 0
+            self.dead = False
+            self.queries = []
+            self.info = type('Info', (), {'transaction_status': extensions.TRANSACTION_STATUS_IDLE})()
+
+        def cursor(self, cursor_factory=None):
+            return FakeCursor(self)
+
+        def rollback(self):
+            pass
+
+        def close(self):
+            self.closed = 1
+
+    opened = []
+
+    def connect(*args, **kwargs):
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(psycopg2.pool.psycopg2, 'connect', connect)
+    pool = database.KeepAlivePool(1, 3)
+    monkeypatch.setattr(database, '_pool', pool)
+    monkeypatch.setattr(database, '_pool_pid', os.getpid())
+    monkeypatch.setattr(database, '_pool_slots', threading.BoundedSemaphore(3))
+    monkeypatch.setattr(database, '_last_used', {})
+
+    # a burst of three: all of them stay open for the next one, not just minconn
+    with database.pooled_connection(), database.pooled_connection(), database.pooled_connection():
+        pass
+    assert len(opened) == 3 and len(pool._pool) == 3
+    assert not any(conn.closed for conn in opened)
+
+    # used within HEALTH_CHECK_AFTER: handed out without a round trip
+    for conn in opened:
+        conn.queries.clear()
+    with database.pooled_connection() as conn:
+        assert conn.queries == []
+
+    database._last_used[id(conn)] = time.monotonic() - database.HEALTH_CHECK_AFTER - 1
+    with database.pooled_connection() as again:
+        assert again is conn and conn.queries == ['SELECT 1']
+
+    # the server dropped it while idle: it is closed and a live one handed out instead
+    conn.dead = True
+    database._last_used[id(conn)] = time.monotonic() - database.HEALTH_CHECK_AFTER - 1
+    with database.pooled_connection() as replacement:
+        assert replacement is not conn and conn.closed
+    assert conn not in pool._pool and len(pool._pool) == 2
+    assert len(opened) == 3
+
+
+def test_filter_unscraped_urls_checks_the_batch_in_one_query(monkeypatch):
+    """
+     The claimed urls are stripped and checked with one indexed ANY query, returning only the new ones in order
+    """
+    from src.Database.database import Database
+
+    queries = []
+
+    class FakeCursor:
+        def fetchall(self):
+            return [('https://jobs.example.com/2',)]
+
+    def execute(self, query, params=None, fetch=None):
+        queries.append((query, params))
+        return fetch(FakeCursor())
+
+    monkeypatch.setattr(Database, '_execute', execute)
+    db = Database.__new__(Database)
+
+    urls = [' https://jobs.example.com/3\n', 'https://jobs.example.com/2', 'https://jobs.example.com/1']
+    assert db.filter_unscraped_urls(urls) == ['https://jobs.example.com/3', 'https://jobs.example.com/1']
+    assert queries == [("SELECT url FROM job_details WHERE url = ANY(%s)",
+                        (['https://jobs.example.com/3', 'https://jobs.example.com/2', 'https://jobs.example.com/1'],))]
+    assert db.filter_unscraped_urls([]) == [] and len(queries) == 1
+
+
+def test_migrate_job_details_dedups_then_builds_indexes_concurrently(monkeypatch):
+    """
+     The migration drops duplicated urls before the unique index, and rebuilds an index left invalid, outside a transaction
+    """
+    from contextlib import contextmanager
+    from src.Database import database
+    from src.Database.database import Database
+
+    statements = []
+
+    class FakeCursor:
+        rowcount = 2
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_type, exc_val, exc_tb):
+            pass
+
+        def execute(self, query, params=None):
+            statements.append((' '.join(query.split()), params, connection.autocommit))
+            self.params = params
+
+        def fetchone(self):
+            # an earlier CONCURRENTLY build of the url index failed half way
+            return (True,) if self.params == ('job_details_url_key',) else None
+
+    class FakeConnection:
+        autocommit = False
+
+        def cursor(self):
+            return FakeCursor()
+
+    connection = FakeConnection()
+
+    @contextmanager
+    def pooled_connection():
+        yield connection
+
+    def execute(self, query, params=None, fetch=None):
+        cursor = FakeCursor()
+        cursor.execute(query, params)
+        return fetch(cursor) if fetch else None
+
+    monkeypatch.setattr(database, 'pooled_connection', pooled_connection)
+    monkeypatch.setattr(Database, '_execute', execute)
+    Database.__new__(Database).migrate_job_details()
+
+    create_url, create_open = (' '.join(create.split()) for create in database.JOB_DETAILS_INDEXES.values())
+    assert [(query, autocommit) for query, _, autocommit in statements] == [
+        ("ALTER TABLE job_details ADD COLUMN IF NOT EXISTS last_checked TIMESTAMP DEFAULT NULL", False),
+        ("DELETE FROM job_details AS job USING job_details AS newer "
+         "WHERE job.url = newer.url AND job.ctid < newer.ctid", False),
+        ("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", True),
+        ("DROP INDEX CONCURRENTLY IF EXISTS job_details_url_key", True),
+        (create_url, True),
+        ("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", True),
+        (create_open, True),
+    ]
+    assert create_url.startswith("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS job_details_url_key ON job_details (url)")
+    assert connection.autocommit is False
+
+
+def test_job_details_writer_commits_before_on_commit_and_keeps_rows_on_outages():
+    """
+     on_commit only sees committed rows, a DB outage keeps the batch buffered and the timer flushes without an add
+    """
+    from psycopg2 import OperationalError
+    from src.Database.database import JobDetailsWriter
+
+    class FlakyDatabase:
+        def __init__(self):
+            self.down = False
+            self.written = []
+
+        def upsert_job_details(self, rows, rejected=None, replaced=None):
+            if self.down:
+                raise OperationalError('server closed the connection unexpectedly')
+            for row in rows:
+                if row[0] == 'bad':
+                    rejected.append(row)
+                else:
+                    # 'u1' was stored under job 0 before
+                    if row[-1] == 'u1':
+                        replaced.append(('0', row[0], row[-1]))
+                    self.written.append(row)
+            return len(rows) - len(rejected)
+
+    db, committed, timer = FlakyDatabase(), [], PhaseTimer('test')
+    writer = JobDetailsWriter(db, batch_size=2, flush_interval=0, timer=timer,
+                              on_commit=lambda rows, rejected: committed.append(
+                                  ([row[-1] for row in rows], [row[-1] for row in rejected])))
+
+    writer.add('1', 't', 'l', 'd', 's', 'ld', 'date', url='u1')
+    assert committed == []
+    writer.add('bad', 't', 'l', 'd', 's', 'ld', 'date', url='u2')
+    assert committed == [(['u1'], ['u2'])]
+    assert writer.replaced == 1
+
+    db.down = True
+    writer.add('3', 't', 'l', 'd', 's', 'ld', 'date', url='u3')
+    writer.add('4', 't', 'l', 'd', 's', 'ld', 'date', url='u4')
+    assert len(committed) == 1
+    assert [row[-1] for row in writer.rows] == ['u3', 'u4']
+
+    db.down = False
+    assert writer.close() == 2
+    assert committed[-1] == (['u3', 'u4'], [])
+    assert [row[0] for row in db.written] == ['1', '3', '4']
+    # every flush is a db_write sample, the outage as an error, with its rows
+    db_write = timer.summary()['phases']['db_write']
+    assert (db_write['count'], db_write['errors']) == (3, 1)
+    assert db_write['items'] == {'total': 6, 'mean': 2.0, 'max': 2}
+
+    timed = JobDetailsWriter(db, batch_size=100, flush_interval=0.1, on_commit=lambda rows, rejected: committed.append(
+        ([row[-1] for row in rows], [])))
+    timed.add('5', 't', 'l', 'd', 's', 'ld', 'date', url='u5')
+    deadline = time.monotonic() + 5
+    while committed[-1] != (['u5'], []) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert committed[-1] == (['u5'], [])
+    assert timed.close() == 0
+
+
+def test_redis_rate_limiter_reservations_respect_the_host_interval():
+    """
+     Reservations made at once from several limiters (processes) on one redis are spaced 1/rate apart per host
+    """
+    import threading
+
+    import fakeredis
+    import pytest
+    from src.cache.Redis import RateLimiter
+
+    server = fakeredis.FakeServer()
+    policy = AIMDPolicy(initial_rate=10.0, max_rate=10.0, increase=0.0)
+    limiters = [RateLimiter(fakeredis.FakeRedis(server=server), policy=policy) for _ in range(3)]
+    url = 'https://jobs.example.com/a'
+    slots = []
+
+    def reserve(limiter):
+        # when the reserved request may start
+        slots.append(time.time() + limiter.reserve(url))
+
+    threads = [threading.Thread(target=reserve, args=(limiters[i % 3],)) for i in range(9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # one token of burst, then one every 0.1s whichever limiter asked (two
+    # reservations racing for the same token would land on the same slot)
+    slots.sort()
+    assert [b - a for a, b in zip(slots[1:], slots[2:])] == pytest.approx([0.1] * 7, abs=0.03)
+    assert limiters[0].reserve('https://other.example.com/') == 0.0
+
+    starts = []
+
+    async def fetch(limiter):
+        async with limiter.request_async('https://async.example.com/') as slot:
+            starts.append(time.perf_counter())
+            slot.observe(200)
+
+    async def fetch_all():
+        await asyncio.gather(*(fetch(limiters[i % 3]) for i in range(4)))
+
+    asyncio.run(fetch_all())
+    assert starts[-1] - starts[0] >= 3 / 10 - 0.02
+
+
+def test_redis_rate_limiter_backs_off_and_recovers():
+    """
+     record() applies the AIMD step and Retry-After pause to the host's hash, shared with every other limiter
+    """
+    import fakeredis
+    import pytest
+    from src.cache.Redis import RateLimiter
+
+    server = fakeredis.FakeServer()
+    policy = AIMDPolicy(initial_rate=1.0, min_rate=0.25, max_rate=2.0, increase=0.5)
+    limiter = RateLimiter(fakeredis.FakeRedis(server=server), policy=policy)
+    other = RateLimiter(fakeredis.FakeRedis(server=server), policy=policy)
+    url = 'https://jobs.example.com/a'
+
+    assert limiter.record(url, 200, 0.1) == 1.5
+    assert other.record(url, 200, 0.1) == 2.0
+    assert limiter.record(url, 200, 0.1) == 2.0
+    assert limiter.record(url, 404, 0.1) == 2.0
+    assert other.record(url, 429, 0.1) == 1.0
+    assert limiter.record(url, 503, 0.1) == 0.5
+    assert limiter.record(url, None, 0.1) == 0.25
+    assert limiter.record(url, 200, 0.1) == 0.75
+    # much slower than the host's average latency
+    assert limiter.record(url, 200, 5.0) == 0.375
+    assert other.rate(url) == 0.375
+    assert float(limiter.r.hget('ratelimit:jobs.example.com', 'latency')) == pytest.approx(0.1 + 0.2 * 4.9)
+    assert other.rate('https://other.example.com/') == 1.0
+
+    # an exception inside the block counts as a failed request
+    with pytest.raises(ConnectionError):
+        with limiter.request('https://flaky.example.com/'):
+            raise ConnectionError('reset')
+    assert other.rate('https://flaky.example.com/') == 0.5
+
+    # Retry-After pauses the host for every limiter
+    with limiter.request('https://busy.example.com/') as slot:
+        slot.observe(429, {'Retry-After': '2'})
+    assert other.rate('https://busy.example.com/') == 0.5
+    assert other.reserve('https://busy.example.com/') == pytest.approx(2.0, abs=0.1)
+
+
+def test_job_checker_treats_redirects_off_the_posting_as_ended(tmp_path, monkeypatch):
+    """
+     Redirects are not followed blindly: off the posting means ended, to its own https/slash address is followed once
+    """
+    from aiohttp import web
+    from src.harvestor_exp import scipt_to_to_check_job_exists as checker
+
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite3'))
+    monkeypatch.setattr(checker, 'get_response_cache', lambda: cache)
+
+    async def handle(request):
+        path = request.path
+        if path == '/jobs/expired':
+            raise web.HTTPFound('/search?expired=1')
+        if path == '/jobs/moved':
+            raise web.HTTPMovedPermanently('/jobs/moved/')
+        if path == '/jobs/moved-gone':
+            raise web.HTTPMovedPermanently('/jobs/moved-gone/')
+        if path == '/jobs/moved-gone/':
+            return web.Response(status=404)
+        if path == '/jobs/loop':
+            raise web.HTTPFound('/jobs/loop/')
+        if path == '/jobs/loop/':
+            raise web.HTTPFound('/jobs/loop')
+        if path == '/jobs/cached' and request.headers.get('If-None-Match') == '"c"':
+            return web.Response(status=304)
+        # the listing page and live postings answer 200
+        return web.Response(text='ok', headers={'ETag': '"1"'})
+
+    class Writer:
+        def __init__(self):
+            self.rows = {}
+
+        def add(self, url, end_date=None):
+            self.rows[url.rsplit('/', 1)[-1]] = end_date is not None
+
+    async def run():
+        app = web.Application()
+        app.router.add_route('*', '/{path:.*}', handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        base = f"http://127.0.0.1:{runner.addresses[0][1]}/jobs/"
+        # validators a detail scraper stored with the page's hash
+        cache.store(base + 'cached', {'ETag': '"c"'}, '<p>c</p>')
+        writer = Writer()
+        try:
+            async with checker.create_session() as session:
+                for name in ('live', 'expired', 'moved', 'moved-gone', 'loop', 'cached'):
+                    await checker.check_job(session, writer, base + name)
+        finally:
+            await runner.cleanup()
+        return writer.rows, base
+
+    rows, base = asyncio.run(run())
+    # name -> ended; the loop is undecided and checked again next run
+    assert rows == {'live': False, 'expired': True, 'moved': False, 'moved-gone': True, 'cached': False}
+    # checking a posting reads the validators the detail scrapers fetch with, never writes them
+    assert cache.get(base + 'moved') is None
+    assert (cache.get(base + 'cached').etag, cache.is_unchanged(base + 'cached', '<p>c</p>')) == ('"c"', True)
+    assert checker.is_ended(302, 'https://jobs.example.com/a/1', '/search') is True
+    assert checker.is_ended(301, 'http://jobs.example.com/a/1', 'https://www.jobs.example.com/a/1/') is None
+    assert checker.is_ended(200) is False